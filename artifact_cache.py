@@ -0,0 +1,197 @@
+import logging
+import os
+import re
+import shutil
+import tempfile
+import threading
+from http import HTTPStatus
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from time import time
+from urllib.error import HTTPError, URLError
+from urllib.request import urlopen
+
+logger = logging.getLogger('installer')
+
+DEFAULT_UPSTREAMS = {'downloads.scylladb.com': 'http://downloads.scylladb.com',
+                     'repositories.scylladb.com': 'http://repositories.scylladb.com',
+                     's3.amazonaws.com': 'https://s3.amazonaws.com'}
+# packages never change once published, everything else is repository metadata which is refreshed
+PACKAGE_SUFFIXES = ('.deb', '.rpm', '.tar.gz', '.jar')
+REPOSITORY_DEFINITION_SUFFIXES = ('.list', '.repo')
+
+
+class ArtifactNotFound(Exception):
+    pass
+
+
+class InvalidArtifactCacheConfig(Exception):
+    pass
+
+
+class ArtifactCache:
+    def __init__(self, cache_dir, advertised_address, upstreams=None, listen_host='0.0.0.0', listen_port=8090,
+                 metadata_ttl=300, upstream_timeout=60):
+        # the nodes download from this address, without a host they would get URLs like http://:8090/...
+        if not advertised_address or advertised_address.startswith(':'):
+            raise InvalidArtifactCacheConfig(f'The artifact cache needs an advertised address the nodes can reach, '
+                                             f'got "{advertised_address}"')
+        self._cache_dir = os.path.abspath(os.path.expanduser(cache_dir))
+        self._advertised_address = advertised_address
+        self._upstreams = dict(DEFAULT_UPSTREAMS if upstreams is None else upstreams)
+        self._listen_host = listen_host
+        self._listen_port = int(listen_port)
+        self._metadata_ttl = metadata_ttl
+        self._upstream_timeout = upstream_timeout
+        self._locks = {}
+        self._locks_lock = threading.Lock()
+        self._counters_lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._server = None
+        self._thread = None
+        self._upstream_pattern = re.compile(
+            r'https?://(' + '|'.join([re.escape(x) for x in sorted(self._upstreams, key=len, reverse=True)]) + r')/')
+
+    @property
+    def address(self):
+        return self._advertised_address
+
+    @property
+    def hits(self):
+        with self._counters_lock:
+            return self._hits
+
+    @property
+    def misses(self):
+        with self._counters_lock:
+            return self._misses
+
+    def start(self):
+        os.makedirs(self._cache_dir, exist_ok=True)
+        self._server = ThreadingHTTPServer((self._listen_host, self._listen_port), self._handler_class())
+        self._server.daemon_threads = True
+        if not self._advertised_address.split(':')[-1].isdigit():
+            self._advertised_address = f'{self._advertised_address}:{self._server.server_address[1]}'
+        self._thread = threading.Thread(target=self._server.serve_forever, name='artifact-cache', daemon=True)
+        self._thread.start()
+        logger.info(msg=f'Artifact cache serves {self._cache_dir} on http://{self._advertised_address}')
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._thread.join()
+            self._server = None
+
+    def url_for(self, url):
+        # an upstream URL is served from the cache under a path prefixed with the upstream name
+        return self._upstream_pattern.sub(lambda x: f'http://{self._advertised_address}/{x.group(1)}/', url)
+
+    def open(self, request_path):
+        upstream_name, relative_path = self._split_path(request_path)
+        cached_file = os.path.join(self._cache_dir, upstream_name, *relative_path.split('/'))
+        with self._lock_for(cached_file):
+            if self._is_fresh(cached_file):
+                self._count(hit=True)
+            else:
+                self._count(hit=False)
+                try:
+                    self._fetch(url=f'{self._upstreams[upstream_name]}/{relative_path}', destination=cached_file)
+                except OSError as e:
+                    if not os.path.exists(cached_file):
+                        raise
+                    logger.warning(msg=f'Upstream of {request_path} is unavailable, serving a stale copy: {e}')
+        if relative_path.endswith(REPOSITORY_DEFINITION_SUFFIXES):
+            with open(cached_file, 'r') as file:
+                return self.url_for(file.read()).encode('utf-8')
+        return open(cached_file, 'rb')
+
+    def _split_path(self, request_path):
+        parts = [x for x in request_path.split('?')[0].split('/') if x]
+        if len(parts) < 2 or parts[0] not in self._upstreams or any(x in ('.', '..') for x in parts):
+            raise ArtifactNotFound(f'Artifact {request_path} is not served by the cache')
+        return parts[0], '/'.join(parts[1:])
+
+    def _is_fresh(self, cached_file):
+        if not os.path.exists(cached_file):
+            return False
+        if cached_file.endswith(PACKAGE_SUFFIXES):
+            return True
+        return time() - os.path.getmtime(cached_file) < self._metadata_ttl
+
+    def _fetch(self, url, destination):
+        logger.debug(msg=f'Artifact cache downloads {url}')
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        try:
+            response = urlopen(url, timeout=self._upstream_timeout)
+        except HTTPError as e:
+            if e.code == HTTPStatus.NOT_FOUND:
+                raise ArtifactNotFound(f'Artifact {url} not found upstream')
+            raise
+        except URLError as e:
+            if isinstance(e.reason, FileNotFoundError):
+                raise ArtifactNotFound(f'Artifact {url} not found upstream')
+            raise
+        with response:
+            # the download is written aside and moved in place, so a reader never sees a partial file
+            file_descriptor, temporary_path = tempfile.mkstemp(dir=os.path.dirname(destination), prefix='.partial-')
+            try:
+                with os.fdopen(file_descriptor, 'wb') as file:
+                    shutil.copyfileobj(response, file)
+                os.replace(temporary_path, destination)
+            except BaseException:
+                os.unlink(temporary_path)
+                raise
+
+    def _lock_for(self, key):
+        with self._locks_lock:
+            return self._locks.setdefault(key, threading.Lock())
+
+    def _count(self, hit):
+        with self._counters_lock:
+            if hit:
+                self._hits += 1
+            else:
+                self._misses += 1
+
+    def _handler_class(self):
+        cache = self
+
+        class ArtifactRequestHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                self._send_artifact(with_body=True)
+
+            def do_HEAD(self):
+                self._send_artifact(with_body=False)
+
+            def _send_artifact(self, with_body):
+                try:
+                    artifact = cache.open(request_path=self.path)
+                except ArtifactNotFound:
+                    self.send_error(HTTPStatus.NOT_FOUND)
+                    return
+                except Exception as e:
+                    logger.error(msg=f'Artifact cache failed to serve {self.path}: {e}')
+                    self.send_error(HTTPStatus.BAD_GATEWAY)
+                    return
+                if isinstance(artifact, bytes):
+                    self._send_headers(length=len(artifact))
+                    if with_body:
+                        self.wfile.write(artifact)
+                    return
+                with artifact:
+                    self._send_headers(length=os.fstat(artifact.fileno()).st_size)
+                    if with_body:
+                        shutil.copyfileobj(artifact, self.wfile)
+
+            def _send_headers(self, length):
+                self.send_response(HTTPStatus.OK)
+                self.send_header('Content-Type', 'application/octet-stream')
+                self.send_header('Content-Length', str(length))
+                self.end_headers()
+
+            def log_message(self, format, *args):
+                logger.debug(msg=f'Artifact cache: {self.address_string()} {format % args}')
+
+        return ArtifactRequestHandler
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+
+import argparse
+import multiprocessing
+import resource
+from base64 import b64encode
+from time import perf_counter, sleep
+from ssh_interface.ssh import SSHConnection, SSHSessionPool
+from ssh_interface import async_ssh
+from ssh_interface.async_ssh import AsyncSSHConnection
+from worker_pool import WorkerPool, AsyncWorkerPool, Job
+
+PASSWORD = b64encode(b'test_password').decode('utf-8')
+
+
+def serve_fake_nodes(latency, port_pipe, stop_event):
+    from scylla_installer_test_package.fake_ssh_server import FakeSSHServer
+    server = FakeSSHServer(latency=latency)
+    port_pipe.send(server.port)
+    stop_event.wait()
+    server.stop()
+
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def wait_for_idle(pool):
+    while pool.active_job_ids:
+        sleep(0.01)
+
+
+def run_threads(port, hosts, commands, workers):
+    session_pool = SSHSessionPool(max_connections=hosts)
+
+    def installation(user):
+        connection = SSHConnection(host='127.0.0.1', port=port, user=user, password=PASSWORD,
+                                   session_pool=session_pool)
+        try:
+            for number in range(commands):
+                connection.execute_command(command=f'step {number}')
+        finally:
+            connection.close()
+
+    pool = WorkerPool(max_workers=workers).start()
+    for number in range(hosts):
+        user = f'user_{number}'
+        pool.submit(Job(job_id=number, function=lambda user=user: installation(user)))
+    wait_for_idle(pool)
+    pool.shutdown()
+
+
+def run_asyncio(port, hosts, commands, workers):
+    async def installation(user):
+        connection = AsyncSSHConnection(host='127.0.0.1', port=port, user=user, password=PASSWORD)
+        try:
+            for number in range(commands):
+                await connection.execute_command(command=f'step {number}')
+        finally:
+            await connection.close()
+
+    pool = AsyncWorkerPool(max_workers=workers).start()
+    for number in range(hosts):
+        user = f'user_{number}'
+        pool.submit(Job(job_id=number, function=lambda user=user: installation(user), concurrency_key=user))
+    wait_for_idle(pool)
+    pool.shutdown()
+
+
+def measure(engine, port, hosts, commands, workers):
+    # every engine runs in its own process, so the peak RSS belongs to that engine only
+    baseline = peak_rss_mb()
+    started = perf_counter()
+    engine(port=port, hosts=hosts, commands=commands, workers=workers)
+    elapsed = perf_counter() - started
+    return hosts / elapsed, (peak_rss_mb() - baseline) / min(hosts, workers)
+
+
+def measure_in_process(engine, port, args, result_pipe):
+    try:
+        result_pipe.send(measure(engine=engine, port=port, hosts=args.hosts, commands=args.commands,
+                                 workers=args.workers))
+    except Exception as e:
+        result_pipe.send(e)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='The script runs fake installations against a fake SSH server and '
+                                                 'compares throughput and memory of the threads and asyncio engines')
+    parser.add_argument('-n', '--hosts', help='Number of simulated hosts', type=int, default=500)
+    parser.add_argument('-k', '--commands', help='Commands per installation', type=int, default=10)
+    parser.add_argument('-w', '--workers', help='Concurrent installations', type=int, default=200)
+    parser.add_argument('-l', '--latency', help='Latency of every command in seconds', type=float, default=0.05)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    port_pipe, server_pipe = multiprocessing.Pipe()
+    stop_event = multiprocessing.Event()
+    server = multiprocessing.Process(target=serve_fake_nodes, args=(args.latency, server_pipe, stop_event),
+                                     daemon=True)
+    server.start()
+    port = port_pipe.recv()
+    print(f'{args.hosts} hosts, {args.commands} commands each, {args.workers} concurrent installations, '
+          f'{args.latency * 1000:.0f} ms per command')
+    print(f"{'engine':10} {'hosts/s':>10} {'MB per installation':>20}")
+    try:
+        for name, engine in (('threads', run_threads), ('asyncio', run_asyncio)):
+            if engine == run_asyncio and async_ssh.asyncssh is None:
+                print(f'{name:10} skipped: install the "asyncssh" package to measure it')
+                continue
+            result_pipe, child_pipe = multiprocessing.Pipe()
+            process = multiprocessing.Process(target=measure_in_process, args=(engine, port, args, child_pipe))
+            process.start()
+            result = result_pipe.recv()
+            process.join()
+            if isinstance(result, Exception):
+                print(f'{name:10} skipped: {result}')
+                continue
+            throughput, memory = result
+            print(f'{name:10} {throughput:10.1f} {memory:20.3f}')
+    finally:
+        stop_event.set()
+        server.join()
+
+
+if __name__ == '__main__':
+    main()
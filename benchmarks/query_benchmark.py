@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+
+import argparse
+import random
+import sys
+from os import path
+from datetime import datetime, timedelta
+from statistics import quantiles
+from time import perf_counter
+from config import ConfigObject
+from db_interface.sql_database_interface import MySQLDatabase
+from db_interface.query_builder import SelectQuery, Join, Operator
+from db_interface.migrations import apply_migrations
+from template_service import templates
+
+STATUS_NAMES = ('OS identified', 'Scylla installed', 'scylla.yaml created', 'Scylla configured', 'Scylla started',
+                'cassandra-stress completed')
+FINISHED_STATES = ('failed', 'succeeded')
+SYSTEM_SCHEMAS = ('mysql', 'sys', 'information_schema', 'performance_schema')
+
+
+def controller_queries(hosts, clusters, period_start):
+    queries = {}
+    query = SelectQuery(columns=('nodes.host', 'installations.id'), joins=(Join.INSTALLATIONS,))
+    queries['installer poll of new installations'] = query.where('installations.global_status', Operator.EQ, 'new')
+    query = SelectQuery(columns=('nodes.host', 'installations.global_status', 'statuses.status_name'),
+                        joins=(Join.INSTALLATIONS, Join.STATUSES))
+    queries['/status of one host'] = query.where('nodes.host', Operator.EQ, random.choice(hosts))
+    query = SelectQuery(columns=('nodes.host',), joins=(Join.INSTALLATIONS,))
+    queries['/status of active hosts'] = query.where('installations.global_status', Operator.EQ, 'in progress')
+    query = SelectQuery(columns=('nodes.host',), joins=(Join.INSTALLATIONS,), distinct=True)
+    queries['/statistics filter options'] = query.where('installations.global_status', Operator.IN, FINISHED_STATES)
+    query = SelectQuery(columns=('nodes.cluster_name', 'nodes.host', 'installations.start_timestamp',
+                                 'installations.finish_timestamp', 'installations.global_status'),
+                        joins=(Join.INSTALLATIONS,))
+    query.where('installations.start_timestamp', Operator.BETWEEN,
+                (period_start, period_start + timedelta(days=7)))
+    query.where('nodes.cluster_name', Operator.EQ, random.choice(clusters))
+    queries['/get_stat for one cluster and week'] = query.where('installations.global_status', Operator.IN,
+                                                                FINISHED_STATES)
+    return queries
+
+
+def check_scratch_schema(database_config, schema):
+    # the scratch schema is dropped by the benchmark, which connects with the credentials of the installer
+    configured = path.splitext(path.basename(database_config['database']))[0] if database_config['type'] == 'sqlite' \
+        else database_config['database']
+    if schema.lower() == configured.lower() or schema.lower() in SYSTEM_SCHEMAS:
+        sys.exit(f'Schema {schema} is not a scratch schema, the benchmark would drop it. Choose another one with -s')
+
+
+def create_schema(database, schema):
+    database.execute(query=f'drop database if exists {schema}')
+    database.execute(query=f'create database {schema}')
+    for script in ['create_nodes.sql', 'create_installations.sql', 'create_statuses.sql']:
+        database.execute(query=templates.render(f'mysql/{script}', database=schema))
+
+
+def seed_data(database, schema, installations, statuses_per_installation, hosts, clusters, batch_size=5000):
+    for number in range(0, len(hosts), batch_size):
+        database.insert_data(table=f'{schema}.nodes',
+                             columns=('host', 'port', 'username', 'password', 'db_version', 'cluster_name',
+                                      'seed_node'),
+                             values=[(x, '22', 'root', 'null', '4.4', clusters[i % len(clusters)], hosts[0])
+                                     for i, x in enumerate(hosts[number:number + batch_size], start=number)])
+    start = datetime.now() - timedelta(days=3 * 365)
+    for first_id in range(1, installations + 1, batch_size):
+        installation_rows = []
+        status_rows = []
+        for installation_id in range(first_id, min(first_id + batch_size, installations + 1)):
+            started = start + timedelta(minutes=installation_id)
+            if installation_id > installations - 20:
+                global_status = random.choice(('new', 'in progress'))
+            else:
+                global_status = random.choice(FINISHED_STATES)
+            installation_rows.append((installation_id, started, started + timedelta(minutes=30), global_status,
+                                      random.choice(hosts)))
+            for number, status_name in enumerate(STATUS_NAMES[:statuses_per_installation]):
+                status_rows.append((status_name, started + timedelta(minutes=number), installation_id))
+        database.insert_data(table=f'{schema}.installations',
+                             columns=('id', 'start_timestamp', 'finish_timestamp', 'global_status', 'host'),
+                             values=installation_rows)
+        database.insert_data(table=f'{schema}.statuses',
+                             columns=('status_name', 'status_timestamp', 'installation_id'), values=status_rows)
+    return start
+
+
+def measure(database, schema, queries, repetitions):
+    database.execute(query=f'use {schema}')
+    results = {}
+    for name, query in queries.items():
+        statement, params = query.build()
+        timings = []
+        for _ in range(repetitions):
+            started = perf_counter()
+            database.execute(query=statement, params=params)
+            timings.append((perf_counter() - started) * 1000)
+        percentiles = quantiles(timings, n=100)
+        results[name] = (percentiles[49], percentiles[98])
+    return results
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='The script seeds a scratch schema with installation history and '
+                                                 'reports latency of the controller queries before and after the '
+                                                 'schema migrations')
+    parser.add_argument('config_path', help='Path to config file', type=str)
+    parser.add_argument('-s', '--schema', help='Scratch schema to create', type=str, default='scylla_benchmark')
+    parser.add_argument('-i', '--installations', help='Number of installations', type=int, default=1000000)
+    parser.add_argument('-st', '--statuses', help='Statuses per installation', type=int, default=6)
+    parser.add_argument('-n', '--nodes', help='Number of nodes', type=int, default=5000)
+    parser.add_argument('-r', '--repetitions', help='Runs of every query', type=int, default=50)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    database_config = ConfigObject(config_path=args.config_path).db_config
+    check_scratch_schema(database_config=database_config, schema=args.schema)
+    database = MySQLDatabase(user=database_config['user'], password=database_config['password'], database='',
+                             host=database_config['host'], port=database_config['port'], db_type='mysql',
+                             pool_size=1)
+    hosts = [f'10.{x // 65536 % 256}.{x // 256 % 256}.{x % 256}' for x in range(args.nodes)]
+    clusters = [f'cluster_{x}' for x in range(max(args.nodes // 10, 1))]
+    create_schema(database=database, schema=args.schema)
+    print(f'Seeding {args.installations} installations and {args.installations * args.statuses} statuses...')
+    period_start = seed_data(database=database, schema=args.schema, installations=args.installations,
+                             statuses_per_installation=args.statuses, hosts=hosts, clusters=clusters)
+    queries = controller_queries(hosts=hosts, clusters=clusters, period_start=period_start + timedelta(days=365))
+    before = measure(database=database, schema=args.schema, queries=queries, repetitions=args.repetitions)
+    apply_migrations(database=database, template_environment=templates.environment, db_type='mysql',
+                     schema=args.schema)
+    after = measure(database=database, schema=args.schema, queries=queries, repetitions=args.repetitions)
+    print(f"{'query':40} {'p50 before':>12} {'p99 before':>12} {'p50 after':>12} {'p99 after':>12}")
+    for name in queries:
+        print(f'{name:40} {before[name][0]:12.2f} {before[name][1]:12.2f} {after[name][0]:12.2f} '
+              f'{after[name][1]:12.2f}')
+    database.execute(query=f'drop database {args.schema}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,350 @@
+#!/usr/bin/env python3
+
+import argparse
+import cherrypy
+import json
+import multiprocessing
+import os
+import random
+import re
+import resource
+import shlex
+import socket
+import tempfile
+import threading
+from base64 import b64decode, b64encode
+from hashlib import sha256
+from time import perf_counter, sleep, time_ns
+from urllib.request import Request, urlopen
+from benchmarks.query_benchmark import create_schema, check_scratch_schema
+from bootstrap import ClusterBootstrapScheduler, AsyncClusterBootstrapScheduler
+from config import ConfigObject
+from controller import Controller, ACTIVE_STATES
+from dispatch_channel import DispatchNotifier, DispatchListener
+from db_interface.migrations import apply_migrations, create_tables
+from db_interface.query_builder import SelectQuery, Join, Operator
+from db_interface.sql_database_interface import MySQLDatabase, SQLiteDatabase, QUERY_SECONDS
+from host_facts import FACT_COMMANDS
+from installer import ScyllaInstaller, AsyncScyllaInstaller, InstallationDispatcher, Status
+from scylla_installer_test_package.fake_ssh_server import FakeSSHServer
+from ssh_interface.command_batch import ENCODED_LINE_WIDTH, STEP_OUTPUT_LIMIT
+from ssh_interface.ssh import default_session_pool
+from status_writer import StatusWriter
+from template_service import templates
+from worker_pool import WorkerPool, AsyncWorkerPool
+from worker_lease import WorkerLease
+
+BATCH_PATTERN = re.compile(r'echo (\S+) \| base64 -d')
+MARKER_PATTERN = re.compile(r'echo "(__SCYLLA_INSTALLER_STEP_\w+__) ')
+STEP_PATTERN = re.compile(r'^\( (.*)$', re.MULTILINE)
+FACTS = dict(zip([x[1] for x in FACT_COMMANDS], [b'ID=ubuntu\nVERSION_ID="20.04"\n', b'ens5\n', b'8\n', b'16318480\n',
+                                                  b'nvme0n1 1000204886016\n', b'']))
+
+
+class SimulatedNode:
+    def __init__(self, address, seed_node, output_size, failure_rate, random_seed):
+        self._address = address
+        self._seed_node = seed_node
+        self._output = self._fake_output(size=output_size)
+        self._failure_rate = failure_rate
+        self._random = random.Random(random_seed)
+        self._checksums = {}
+        self._staged = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, command):
+        if BATCH_PATTERN.search(command):
+            return self._run_batch(command=command)
+        stdout, exit_code = self._run(command=command)
+        return stdout, b'' if exit_code == 0 else b'Simulated failure\n', exit_code
+
+    def _run_batch(self, command):
+        script = b64decode(BATCH_PATTERN.search(command).group(1)).decode('utf-8')
+        marker = MARKER_PATTERN.search(script).group(1)
+        stdout = b''
+        live_output = b''
+        for number, step in enumerate(STEP_PATTERN.findall(script)):
+            started = time_ns()
+            output, exit_code = self._run(command=step)
+            errors = b'' if exit_code == 0 else b'Simulated failure\n'
+            stdout += f'{marker} {number} {exit_code} {started} {time_ns()}\n'.encode('utf-8')
+            for data in (output, errors):
+                encoded = b64encode(data[-STEP_OUTPUT_LIMIT:])
+                for position in range(0, len(encoded), ENCODED_LINE_WIDTH):
+                    stdout += encoded[position:position + ENCODED_LINE_WIDTH] + b'\n'
+                stdout += f'{marker} end\n'.encode('utf-8')
+            live_output += output
+            if exit_code != 0:
+                break
+        return stdout, live_output, 0
+
+    def _run(self, command):
+        if self._random.random() < self._failure_rate:
+            return b'', 1
+        words = shlex.split(command)
+        with self._lock:
+            # the upload of scylla.yaml is followed through the placement commands, so that its checksum matches
+            if words[:2] == ['install', '-m']:
+                with open(words[3], 'rb') as file:
+                    self._staged[words[4]] = sha256(file.read()).hexdigest()
+            elif words[:2] == ['mv', '-f']:
+                self._checksums[words[3]] = self._staged.pop(words[2], None)
+            elif words[:2] == ['rm', '-f'] and len(words) == 3 and os.path.isabs(words[2]):
+                os.remove(words[2])
+            elif words[0] == 'sha256sum':
+                if self._checksums.get(words[1]) is None:
+                    return b'', 1
+                return f'{self._checksums[words[1]]}  {words[1]}\n'.encode('utf-8'), 0
+        if command in FACTS:
+            return FACTS[command], 0
+        if command == 'nodetool status':
+            return f'UN  {self._address}  1.1 MB  256  ?  7c1e0ea6-1111-4e0b-a1a5-0b5c1f1e2d11  rack1\n'.encode(), 0
+        if command == 'nodetool gossipinfo':
+            return f'/{self._seed_node}\n  STATUS:20:NORMAL,-456\n/{self._address}\n  STATUS:20:NORMAL,1\n'.encode(), 0
+        if words[0] in ('scylla', 'test'):
+            return b'', 1
+        return self._output, 0
+
+    @staticmethod
+    def _fake_output(size):
+        line = b'Simulated output of a remote command on the node ........................................\n'
+        return (line * (size // len(line) + 1))[:size]
+
+
+def node_addresses(hosts):
+    return [f'127.1.{x // 250}.{x % 250 + 1}' for x in range(hosts)]
+
+
+def seed_of(addresses, number, cluster_size):
+    return addresses[number - number % cluster_size]
+
+
+def serve_nodes(args, hosts, port_pipe, stop_event):
+    raise_file_limit()
+    addresses = node_addresses(hosts=hosts)
+    home = tempfile.mkdtemp(prefix='rollout-nodes-')
+    servers = []
+    for number, address in enumerate(addresses):
+        node = SimulatedNode(address=address, seed_node=seed_of(addresses, number, args.cluster_size),
+                             output_size=args.output_size, failure_rate=args.failure_rate, random_seed=number)
+        servers.append(FakeSSHServer(command_handler=node, latency=args.latency, host=address, home=home))
+    port_pipe.send([x.port for x in servers])
+    stop_event.wait()
+    for server in servers:
+        server.stop()
+
+
+def raise_file_limit():
+    # every node holds an SSH socket and an installation log file open
+    soft_limit, hard_limit = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard_limit, hard_limit))
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def post_json(url, data):
+    request = Request(url, data=json.dumps(data).encode('utf-8'), headers={'Content-Type': 'application/json'})
+    with urlopen(request, timeout=60) as response:
+        return response.read()
+
+
+def scratch_database(database_config, schema, pool_size):
+    if database_config['type'] == 'sqlite':
+        # the scratch database is created next to the configured one
+        return SQLiteDatabase(database=os.path.join(os.path.dirname(os.path.abspath(database_config['database'])),
+                                                    f'{schema}.sqlite'))
+    return MySQLDatabase(user=database_config['user'], password=database_config['password'], database=schema,
+                         host=database_config['host'], port=database_config['port'], db_type='mysql',
+                         pool_size=pool_size)
+
+
+def open_connections(database):
+    if isinstance(database, SQLiteDatabase):
+        return database.opened
+    return database.pool.opened
+
+
+def rollout(args, hosts, ports, database_config, schema, result_pipe):
+    raise_file_limit()
+    database = scratch_database(database_config=database_config, schema=schema, pool_size=args.pool_size)
+    log_dir = tempfile.mkdtemp(prefix='rollout-logs-')
+    socket_dir = tempfile.mkdtemp(prefix='rollout-dispatch-')
+    listener = DispatchListener(socket_dir=socket_dir, name='installer').start()
+    if args.engine == 'asyncio':
+        scheduler = AsyncClusterBootstrapScheduler(concurrent_joins=args.concurrent_joins, readiness_timeout=600)
+        pool = AsyncWorkerPool(max_workers=args.max_workers, on_job_done=listener.wake).start()
+        installer_class = AsyncScyllaInstaller
+    else:
+        scheduler = ClusterBootstrapScheduler(concurrent_joins=args.concurrent_joins, readiness_timeout=600)
+        pool = WorkerPool(max_workers=args.max_workers, on_job_done=listener.wake).start()
+        installer_class = ScyllaInstaller
+    worker_lease = WorkerLease(database=database).start()
+    status_writer = StatusWriter(database=database, worker_id=worker_lease.worker_id).start()
+    dispatcher = InstallationDispatcher(database=database, log_config={'log_level': 'INFO', 'log_root_dir': log_dir},
+                                        worker_pool=pool, bootstrap_scheduler=scheduler, job_timeout=args.timeout,
+                                        installer_class=installer_class, status_writer=status_writer,
+                                        worker_lease=worker_lease)
+    controller_port = free_port()
+    cherrypy.config.update({'server.socket_host': '127.0.0.1', 'server.socket_port': controller_port,
+                            'server.thread_pool': 30, 'log.screen': False, 'engine.autoreload.on': False,
+                            'checker.on': False})
+    cherrypy.tree.mount(Controller(database=database, dispatch_notifier=DispatchNotifier(socket_dir=socket_dir)), '/')
+    cherrypy.engine.start()
+    peaks = {'threads': 0, 'ssh_sessions': 0, 'database_connections': 0}
+    stopping = threading.Event()
+
+    def sample_resources():
+        while not stopping.wait(0.1):
+            peaks['threads'] = max(peaks['threads'], threading.active_count())
+            peaks['ssh_sessions'] = max(peaks['ssh_sessions'], len(default_session_pool))
+            peaks['database_connections'] = max(peaks['database_connections'], open_connections(database))
+
+    def run_dispatcher():
+        while not stopping.is_set():
+            dispatcher.poll()
+            listener.wait(timeout=args.poll_interval)
+
+    addresses = node_addresses(hosts=hosts)
+    nodes = [{'host': address, 'port': str(port), 'username': 'root', 'password': 'test_password',
+              'db_version': '4.4', 'cluster_name': f'cluster_{number // args.cluster_size}',
+              'seed_node': seed_of(addresses, number, args.cluster_size)}
+             for number, (address, port) in enumerate(zip(addresses, ports))]
+    threading.Thread(target=sample_resources, daemon=True).start()
+    dispatcher_thread = threading.Thread(target=run_dispatcher, daemon=True)
+    dispatcher_thread.start()
+    started = perf_counter()
+    # the installer is already waiting, the submission wakes it up through the dispatch socket
+    post_json(url=f'http://127.0.0.1:{controller_port}/install', data={'nodes': nodes})
+    query = SelectQuery(columns=('installations.id',), joins=(Join.INSTALLATIONS,))
+    query.where('installations.global_status', Operator.IN, ACTIVE_STATES)
+    while database.select_data(query=query, columns=('installation_id',)):
+        post_json(url=f'http://127.0.0.1:{controller_port}/status', data={})
+        sleep(0.5)
+    elapsed = perf_counter() - started
+    stopping.set()
+    DispatchNotifier(socket_dir=socket_dir).notify()
+    dispatcher_thread.join()
+    listener.close()
+    os.rmdir(socket_dir)
+    pool.shutdown()
+    worker_lease.stop()
+    status_writer.stop()
+    cherrypy.engine.exit()
+    query = SelectQuery(columns=('installations.id', 'installations.start_timestamp', 'installations.global_status',
+                                 'statuses.status_name', 'statuses.status_timestamp'),
+                        joins=(Join.INSTALLATIONS, Join.STATUSES))
+    query.order_by('installations.id', 'statuses.status_timestamp')
+    stage_durations = {x.value: [] for x in Status}
+    previous = {}
+    for record in database.select_data(query=query, columns=('installation_id', 'start_timestamp', 'global_status',
+                                                              'status_name', 'status_timestamp')):
+        since = previous.get(record['installation_id'], record['start_timestamp'])
+        stage_durations.setdefault(record['status_name'], []).append(
+            (record['status_timestamp'] - since).total_seconds())
+        previous[record['installation_id']] = record['status_timestamp']
+    # an installation which failed before its first status has no statuses to join
+    query = SelectQuery(columns=('installations.id',), table='installations')
+    failed = database.select_data(query=query.where('installations.global_status', Operator.NE, 'succeeded'),
+                                  columns=('installation_id',))
+    queries = sum([x[2] for x in QUERY_SECONDS.family()['samples'] if x[0].endswith('_count')])
+    result_pipe.send({'hosts': hosts, 'elapsed': elapsed, 'failed': len(failed),
+                      'stages': {k: (percentile(v, 0.5), percentile(v, 0.99)) for k, v in stage_durations.items() if v},
+                      'queries_per_install': queries / hosts,
+                      'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, **peaks})
+
+
+def run_scale(args, hosts, database_config):
+    if database_config['type'] == 'sqlite':
+        database = scratch_database(database_config=database_config, schema=args.schema, pool_size=1)
+        drop_sqlite_database(database=database)
+        create_tables(database=database, template_environment=templates.environment, db_type='sqlite',
+                      schema=database.schema)
+    else:
+        database = scratch_database(database_config=database_config, schema='', pool_size=1)
+        create_schema(database=database, schema=args.schema)
+        apply_migrations(database=database, template_environment=templates.environment, db_type='mysql',
+                         schema=args.schema)
+    port_pipe, server_pipe = multiprocessing.Pipe()
+    stop_event = multiprocessing.Event()
+    server = multiprocessing.Process(target=serve_nodes, args=(args, hosts, server_pipe, stop_event), daemon=True)
+    server.start()
+    try:
+        ports = port_pipe.recv()
+        result_pipe, child_pipe = multiprocessing.Pipe()
+        # every scale runs in a fresh process, so the peak RSS and the counters belong to that run only
+        process = multiprocessing.Process(target=rollout, args=(args, hosts, ports, database_config, args.schema,
+                                                                child_pipe))
+        process.start()
+        result = result_pipe.recv()
+        process.join()
+        return result
+    finally:
+        stop_event.set()
+        server.join()
+        if isinstance(database, SQLiteDatabase):
+            drop_sqlite_database(database=database)
+        else:
+            database.execute(query=f'drop database {args.schema}')
+
+
+def drop_sqlite_database(database):
+    database.close()
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(database.path + suffix):
+            os.remove(database.path + suffix)
+
+
+def print_result(result):
+    print(f"\n{result['hosts']} hosts: rollout {result['elapsed']:.1f} s, {result['failed']} failed, "
+          f"{result['queries_per_install']:.1f} queries per installation, peak {result['threads']} threads, "
+          f"{result['ssh_sessions']} SSH sessions, {result['database_connections']} database connections, "
+          f"{result['peak_rss_mb']:.0f} MB RSS")
+    print(f"  {'stage':30} {'p50, s':>10} {'p99, s':>10}")
+    for stage, (p50, p99) in result['stages'].items():
+        print(f'  {stage:30} {p50:10.2f} {p99:10.2f}')
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='The script rolls ScyllaDB out to simulated nodes through the '
+                                                 'controller and the installer and reports the rollout time, stage '
+                                                 'latencies and resource usage for a growing number of nodes')
+    parser.add_argument('config_path', help='Path to config file', type=str)
+    parser.add_argument('-n', '--hosts', help='Numbers of simulated nodes', type=int, nargs='+',
+                        default=[1, 10, 100, 1000])
+    parser.add_argument('-s', '--schema', help='Scratch schema to create', type=str, default='scylla_rollout')
+    parser.add_argument('-l', '--latency', help='Latency of every command in seconds', type=float, default=0.05)
+    parser.add_argument('-o', '--output_size', help='Bytes of output of every command', type=int, default=4096)
+    parser.add_argument('-f', '--failure_rate', help='Probability of a command to fail', type=float, default=0.0)
+    parser.add_argument('-c', '--cluster_size', help='Nodes per cluster', type=int, default=10)
+    parser.add_argument('-j', '--concurrent_joins', help='Nodes of a cluster joining at the same time', type=int,
+                        default=1)
+    parser.add_argument('-w', '--max_workers', help='Installations running at the same time', type=int, default=16)
+    parser.add_argument('-p', '--pool_size', help='Database connections', type=int, default=10)
+    parser.add_argument('-e', '--engine', help='Installer engine', choices=['threads', 'asyncio'], default='threads')
+    parser.add_argument('-i', '--poll_interval', help='Seconds the installer waits for a notification before it polls',
+                        type=float, default=10)
+    parser.add_argument('-t', '--timeout', help='Seconds one installation may run', type=int, default=3600)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    database_config = ConfigObject(config_path=args.config_path).db_config
+    check_scratch_schema(database_config=database_config, schema=args.schema)
+    print(f'{args.latency * 1000:.0f} ms and {args.output_size} bytes per command, failure rate {args.failure_rate}, '
+          f'{args.max_workers} workers ({args.engine}), {args.cluster_size} nodes per cluster')
+    for hosts in args.hosts:
+        print_result(run_scale(args=args, hosts=hosts, database_config=database_config))
+
+
+if __name__ == '__main__':
+    main()
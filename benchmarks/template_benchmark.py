@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+
+import argparse
+import random
+from tempfile import TemporaryDirectory
+from time import perf_counter
+from jinja2 import FileSystemLoader, Environment, select_autoescape
+from db_interface.migrations import create_tables
+from db_interface.query_builder import SelectQuery, Join, Operator, render_select
+from db_interface.sql_database_interface import SQLiteDatabase
+from template_service import TemplateService
+
+SCYLLA_PARAMS = {'cluster_name': '"cluster_0"', 'seed_node': '"10.0.0.1"', 'listen_address': '10.0.0.2',
+                 'rpc_address': '10.0.0.2'}
+
+
+def per_second(function, seconds):
+    calls = 0
+    started = perf_counter()
+    while perf_counter() - started < seconds:
+        for _ in range(100):
+            function()
+        calls += 100
+    return calls / (perf_counter() - started)
+
+
+def render_throughput(seconds):
+    # every module used to have an environment of its own with the defaults of jinja, which check the template
+    # file on every get_template
+    environment = Environment(loader=FileSystemLoader('templates'), autoescape=select_autoescape())
+    service = TemplateService().configure(auto_reload=False)
+    service.precompile()
+    before = per_second(lambda: environment.get_template('./scylla_yaml/scylla.yaml').render(SCYLLA_PARAMS),
+                        seconds=seconds)
+    after = per_second(lambda: service.render('scylla_yaml/scylla.yaml', **SCYLLA_PARAMS), seconds=seconds)
+    return before, after
+
+
+def compile_time(cache_dir, repetitions):
+    # a process compiles every template it uses once, the bytecode cache keeps the result for the next processes
+    def precompile(bytecode_cache_dir):
+        started = perf_counter()
+        TemplateService().configure(auto_reload=False, bytecode_cache_dir=bytecode_cache_dir).precompile()
+        return (perf_counter() - started) * 1000
+
+    before = min(precompile(bytecode_cache_dir=None) for _ in range(repetitions))
+    precompile(bytecode_cache_dir=cache_dir)
+    after = min(precompile(bytecode_cache_dir=cache_dir) for _ in range(repetitions))
+    return before, after
+
+
+def select_throughput(database_path, hosts, seconds):
+    database = SQLiteDatabase(database=database_path)
+    create_tables(database=database, template_environment=TemplateService().environment, db_type='sqlite',
+                  schema=database.schema)
+    host_names = [f'10.0.{x // 256}.{x % 256}' for x in range(hosts)]
+    database.insert_data(table='nodes', columns=('host', 'port', 'username', 'password', 'db_version',
+                                                 'cluster_name', 'seed_node'),
+                         values=[(x, '22', 'root', 'null', '4.4', 'cluster_0', host_names[0]) for x in host_names])
+    database.insert_data(table='installations', columns=('host', 'global_status'),
+                         values=[(x, 'succeeded') for x in host_names])
+
+    def status_of_one_host():
+        query = SelectQuery(columns=('nodes.host', 'installations.global_status'), joins=(Join.INSTALLATIONS,))
+        query.where('nodes.host', Operator.EQ, random.choice(host_names))
+        database.select_data(query=query, columns=('host', 'global_status'))
+
+    def uncached():
+        render_select.cache_clear()
+        status_of_one_host()
+
+    before = per_second(uncached, seconds=seconds)
+    after = per_second(status_of_one_host, seconds=seconds)
+    database.close()
+    return before, after
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='The script reports the throughput of scylla.yaml rendering and '
+                                                 'select_data with and without the shared template service and the '
+                                                 'cached query shapes')
+    parser.add_argument('-s', '--seconds', help='Seconds every measurement runs', type=float, default=2)
+    parser.add_argument('-r', '--repetitions', help='Runs of the template compilation', type=int, default=5)
+    parser.add_argument('-n', '--hosts', help='Nodes in the scratch database', type=int, default=1000)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    with TemporaryDirectory() as scratch_dir:
+        results = {'scylla.yaml renders per second': render_throughput(seconds=args.seconds),
+                   'template compilation at startup, ms': compile_time(cache_dir=f'{scratch_dir}/template_cache',
+                                                                      repetitions=args.repetitions),
+                   'select_data calls per second': select_throughput(database_path=f'{scratch_dir}/bench.sqlite',
+                                                                     hosts=args.hosts, seconds=args.seconds)}
+    print(f"{'measurement':40} {'before':>12} {'after':>12}")
+    for name, (before, after) in results.items():
+        print(f'{name:40} {before:12.1f} {after:12.1f}')
+
+
+if __name__ == '__main__':
+    main()
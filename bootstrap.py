@@ -0,0 +1,151 @@
+import asyncio
+import threading
+from contextlib import contextmanager, asynccontextmanager
+from readiness import ReadinessTimeout
+from time import monotonic
+
+
+class SeedNodeFailed(Exception):
+    pass
+
+
+class ClusterState:
+    def __init__(self, concurrent_joins):
+        self.seed_expected = False
+        self.seed_done = threading.Event()
+        self.seed_failed = False
+        self.installations = 0
+        self.join_slots = threading.BoundedSemaphore(concurrent_joins)
+
+
+class ClusterBootstrapScheduler:
+    def __init__(self, concurrent_joins=1, readiness_timeout=900):
+        self._concurrent_joins = concurrent_joins
+        self._readiness_timeout = readiness_timeout
+        self._clusters = {}
+        self._lock = threading.Lock()
+
+    @property
+    def concurrent_joins(self):
+        return self._concurrent_joins
+
+    @property
+    def readiness_timeout(self):
+        return self._readiness_timeout
+
+    def __len__(self):
+        with self._lock:
+            return len(self._clusters)
+
+    def register_seed(self, cluster_name):
+        with self._lock:
+            state = self._get_state(cluster_name)
+            state.seed_expected = True
+            state.seed_failed = False
+            state.seed_done.clear()
+
+    def seed_ready(self, cluster_name):
+        with self._lock:
+            state = self._get_state(cluster_name)
+            state.seed_expected = False
+            state.seed_done.set()
+
+    def seed_failed(self, cluster_name):
+        with self._lock:
+            state = self._get_state(cluster_name)
+            # a seed which fails after it was ready, e.g. in the stress step, does not keep the others from joining
+            if not state.seed_expected:
+                return
+            state.seed_expected = False
+            state.seed_failed = True
+            state.seed_done.set()
+
+    @contextmanager
+    def installation(self, cluster_name, is_seed):
+        with self._lock:
+            self._get_state(cluster_name).installations += 1
+        try:
+            yield
+        except BaseException:
+            if is_seed:
+                self.seed_failed(cluster_name=cluster_name)
+            raise
+        finally:
+            with self._lock:
+                state = self._clusters[cluster_name]
+                state.installations -= 1
+                # the state of a cluster lives as long as its installations, the next ones probe the seed again
+                if not state.installations and not state.seed_expected:
+                    del self._clusters[cluster_name]
+
+    def _seed_installed(self, cluster_name):
+        with self._lock:
+            state = self._get_state(cluster_name)
+            # the seed is installed by this process, so its own readiness check tells when it is UN; after a failure
+            # of the seed, which may be fixed by hand, the seed node itself is probed
+            return state, state.seed_expected or (state.seed_done.is_set() and not state.seed_failed)
+
+    @contextmanager
+    def join_slot(self, cluster_name, wait_for_seed):
+        deadline = monotonic() + self._readiness_timeout
+        state, seed_installed = self._seed_installed(cluster_name=cluster_name)
+        if seed_installed:
+            if not state.seed_done.wait(timeout=self._readiness_timeout):
+                raise ReadinessTimeout(f"Seed node of cluster {cluster_name} did not become ready "
+                                       f"within {self._readiness_timeout} seconds")
+            if state.seed_failed:
+                raise SeedNodeFailed(f"Installation of the seed node of cluster {cluster_name} failed")
+        else:
+            wait_for_seed()
+        if not state.join_slots.acquire(timeout=max(deadline - monotonic(), 0)):
+            raise ReadinessTimeout(f"No free join slot in cluster {cluster_name} "
+                                   f"within {self._readiness_timeout} seconds")
+        try:
+            yield
+        finally:
+            state.join_slots.release()
+
+    def _get_state(self, cluster_name):
+        if cluster_name not in self._clusters:
+            self._clusters[cluster_name] = ClusterState(concurrent_joins=self._concurrent_joins)
+        return self._clusters[cluster_name]
+
+
+class AsyncClusterState:
+    def __init__(self, concurrent_joins):
+        self.seed_expected = False
+        self.seed_done = asyncio.Event()
+        self.seed_failed = False
+        self.installations = 0
+        self.join_slots = asyncio.BoundedSemaphore(concurrent_joins)
+
+
+class AsyncClusterBootstrapScheduler(ClusterBootstrapScheduler):
+    def _get_state(self, cluster_name):
+        if cluster_name not in self._clusters:
+            self._clusters[cluster_name] = AsyncClusterState(concurrent_joins=self._concurrent_joins)
+        return self._clusters[cluster_name]
+
+    @asynccontextmanager
+    async def join_slot(self, cluster_name, wait_for_seed):
+        deadline = monotonic() + self._readiness_timeout
+        state, seed_installed = self._seed_installed(cluster_name=cluster_name)
+        if seed_installed:
+            try:
+                await asyncio.wait_for(state.seed_done.wait(), timeout=self._readiness_timeout)
+            except asyncio.TimeoutError:
+                raise ReadinessTimeout(f"Seed node of cluster {cluster_name} did not become ready "
+                                       f"within {self._readiness_timeout} seconds")
+            if state.seed_failed:
+                raise SeedNodeFailed(f"Installation of the seed node of cluster {cluster_name} failed")
+        else:
+            await wait_for_seed()
+        try:
+            await asyncio.wait_for(state.join_slots.acquire(), timeout=max(deadline - monotonic(), 0))
+        except asyncio.TimeoutError:
+            raise ReadinessTimeout(f"No free join slot in cluster {cluster_name} "
+                                   f"within {self._readiness_timeout} seconds")
+        try:
+            yield
+        finally:
+            state.join_slots.release()
@@ -0,0 +1,49 @@
+import threading
+from collections import deque
+
+
+class FeedOverrun(Exception):
+    pass
+
+
+class ChangeFeed:
+    def __init__(self, history_size=1000):
+        self._events = deque(maxlen=history_size)
+        self._sequence = 0
+        self._subscribers = 0
+        self._condition = threading.Condition()
+
+    @property
+    def last_sequence(self):
+        with self._condition:
+            return self._sequence
+
+    @property
+    def subscribers(self):
+        with self._condition:
+            return self._subscribers
+
+    def subscribe(self):
+        with self._condition:
+            self._subscribers += 1
+            return self._sequence
+
+    def unsubscribe(self):
+        with self._condition:
+            self._subscribers -= 1
+
+    def publish(self, event):
+        with self._condition:
+            self._sequence += 1
+            self._events.append((self._sequence, event))
+            self._condition.notify_all()
+            return self._sequence
+
+    def read(self, after, timeout=None):
+        with self._condition:
+            self._condition.wait_for(lambda: self._sequence > after, timeout=timeout)
+            # the history is bounded, a reader which fell behind it would silently miss the discarded events
+            if self._events and self._events[0][0] > after + 1:
+                raise FeedOverrun(f'Events {after + 1} to {self._events[0][0] - 1} were discarded before they '
+                                  f'were read')
+            return [(sequence, event) for sequence, event in self._events if sequence > after]
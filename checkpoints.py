@@ -0,0 +1,66 @@
+from db_interface.query_builder import SelectQuery, Operator
+from hashlib import sha256
+
+
+class InstallationStep:
+    def __init__(self, name, run, probe=None, status=None, on_skip=None):
+        self._name = name
+        self._run = run
+        self._probe = probe
+        self._status = status
+        self._on_skip = on_skip
+
+    @property
+    def name(self):
+        return self._name
+
+    @property
+    def status(self):
+        return self._status
+
+    def run(self):
+        return self._run()
+
+    def is_done(self):
+        return self._probe is not None and self._probe()
+
+    def skip(self):
+        if self._on_skip is not None:
+            return self._on_skip()
+
+
+class CheckpointStore:
+    def __init__(self, database):
+        self._database = database
+
+    @staticmethod
+    def fingerprint(*values):
+        return sha256('\n'.join([str(x) for x in values]).encode('utf-8')).hexdigest()
+
+    def completed_steps(self, host, fingerprint, step_names):
+        query = SelectQuery(columns=('installation_checkpoints.step_name', 'installation_checkpoints.fingerprint',
+                                     'installation_checkpoints.installation_id',
+                                     'installation_checkpoints.checkpoint_timestamp'),
+                            table='installation_checkpoints')
+        query.where('installation_checkpoints.host', Operator.EQ, host)
+        checkpoints = {x['step_name']: x for x in self._database.select_data(
+            query=query, columns=('step_name', 'fingerprint', 'installation_id', 'checkpoint_timestamp'))}
+        completed = []
+        previous_timestamp = None
+        for step_name in step_names:
+            checkpoint = checkpoints.get(step_name)
+            if checkpoint is None or checkpoint['fingerprint'] != fingerprint:
+                break
+            # a checkpoint older than the one of the previous step was left by a run that later redid that step
+            if previous_timestamp is not None and checkpoint['checkpoint_timestamp'] < previous_timestamp:
+                break
+            previous_timestamp = checkpoint['checkpoint_timestamp']
+            completed.append(checkpoint)
+        return completed
+
+    def save(self, host, step_name, fingerprint, installation_id):
+        self._database.upsert_data(table='installation_checkpoints',
+                                   columns=('host', 'step_name', 'fingerprint', 'installation_id',
+                                            'checkpoint_timestamp'),
+                                   values=[(host, step_name, fingerprint, installation_id, 'get_system_timestamp')],
+                                   update_columns=('fingerprint', 'installation_id', 'checkpoint_timestamp'))
@@ -10,12 +10,54 @@ class ConfigObject:
         config.read(config_path)
         db_params = {}
         log_params = {}
+        installer_params = {'concurrent_joins': '1',
+                            'readiness_timeout': '900',
+                            'max_workers': '16',
+                            'job_timeout': '3600',
+                            'engine': 'threads',
+                            'facts_ttl': '3600',
+                            'facts_workers': '32',
+                            'facts_timeout': '10',
+                            'status_flush_interval': '0.2',
+                            'status_batch_size': '1000',
+                            'poll_interval': '10',
+                            'dispatch_socket_dir': 'installer_dispatch',
+                            'lease_timeout': '60',
+                            'heartbeat_interval': '10',
+                            'replication_factor': '3'}
+        artifact_cache_params = {'enabled': 'false',
+                                 'cache_dir': 'artifact_cache',
+                                 'listen_host': '0.0.0.0',
+                                 'listen_port': '8090',
+                                 'advertised_address': '',
+                                 'metadata_ttl': '300'}
+        metrics_params = {'snapshot_file': 'installer_metrics.json',
+                          'snapshot_interval': '5',
+                          'snapshot_max_age': '60'}
+        templates_params = {'auto_reload': 'false',
+                            'bytecode_cache_dir': 'template_cache'}
         for k, v in config['db'].items():
             db_params[k] = v.replace('"', '')
         for k, v in config['log'].items():
             log_params[k] = v.replace('"', '')
+        if config.has_section('installer'):
+            for k, v in config['installer'].items():
+                installer_params[k] = v.replace('"', '')
+        if config.has_section('artifact_cache'):
+            for k, v in config['artifact_cache'].items():
+                artifact_cache_params[k] = v.replace('"', '')
+        if config.has_section('metrics'):
+            for k, v in config['metrics'].items():
+                metrics_params[k] = v.replace('"', '')
+        if config.has_section('templates'):
+            for k, v in config['templates'].items():
+                templates_params[k] = v.replace('"', '')
         self._db_config = db_params
         self._log_config = log_params
+        self._installer_config = installer_params
+        self._artifact_cache_config = artifact_cache_params
+        self._metrics_config = metrics_params
+        self._templates_config = templates_params
 
     @property
     def db_config(self):
@@ -24,3 +66,19 @@ class ConfigObject:
     @property
     def log_config(self):
         return self._log_config
+
+    @property
+    def installer_config(self):
+        return self._installer_config
+
+    @property
+    def artifact_cache_config(self):
+        return self._artifact_cache_config
+
+    @property
+    def metrics_config(self):
+        return self._metrics_config
+
+    @property
+    def templates_config(self):
+        return self._templates_config
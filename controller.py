@@ -4,18 +4,22 @@ import cherrypy
 import datetime
 import logging.config
 import argparse
-from db_interface.sql_database_interface import MySQLDatabase
+import json
+import threading
+from change_feed import ChangeFeed, FeedOverrun
+from dispatch_channel import DispatchNotifier
+from manifest import parse_manifest, node_from_fields, InvalidManifest, NODE_COLUMNS
+from metrics import registry, read_snapshot, render, installer_snapshots
+from rolling import is_valid_batch_size
+from db_interface.sql_database_interface import MySQLDatabase, SQLiteDatabase
+from db_interface.query_builder import SelectQuery, Join, Operator
 from base64 import b64encode
 from enum import Enum, unique
 from config import ConfigObject
-from time import sleep
-from jinja2 import FileSystemLoader, Environment, select_autoescape
+from template_service import templates
 from os import path
 
-env = Environment(
-    loader=FileSystemLoader('templates'),
-    autoescape=select_autoescape(['html', 'xml'])
-)
+logger = logging.getLogger()
 
 
 @unique
@@ -26,6 +30,31 @@ class InstallationState(Enum):
     SUCCEEDED = 'succeeded'
 
 
+@unique
+class Operation(Enum):
+    INSTALL = 'install'
+    UPGRADE = 'upgrade'
+    CONFIG = 'config'
+    RESTART = 'restart'
+
+
+ACTIVE_STATES = (InstallationState.NEW.value, InstallationState.IN_PROGRESS.value)
+FINISHED_STATES = (InstallationState.FAILED.value, InstallationState.SUCCEEDED.value)
+STATISTICS_COLUMNS = ('cluster', 'host', 'user', 'db_version', 'os_version', 'seed_node', 'installation_start',
+                      'installation_finish', 'status')
+# a keyset for pagination can only be built on columns that are never null for finished installations
+STATISTICS_SORT_FIELDS = {'cluster': 'nodes.cluster_name',
+                          'host': 'nodes.host',
+                          'user': 'nodes.username',
+                          'db_version': 'nodes.db_version',
+                          'seed_node': 'nodes.seed_node',
+                          'installation_start': 'installations.start_timestamp',
+                          'installation_finish': 'installations.finish_timestamp',
+                          'status': 'installations.global_status'}
+STATISTICS_PAGE_SIZE = 200
+STATISTICS_MAX_PAGE_SIZE = 1000
+
+
 class UnknownDataBaseType(Exception):
     pass
 
@@ -40,7 +69,12 @@ class ControllerDataBase:
                                            database=database_config['database'],
                                            host=database_config['host'],
                                            port=database_config['port'],
-                                           db_type=database_config['type'])
+                                           db_type=database_config['type'],
+                                           pool_size=database_config.get('pool_size', 10),
+                                           pool_recycle=database_config.get('pool_recycle', 3600))
+        elif database_config['type'] == 'sqlite':
+            self._instance = SQLiteDatabase(database=database_config['database'],
+                                            busy_timeout=database_config.get('busy_timeout', 30))
         else:
             logger.critical(f"Critical error!\"{database_config['type']}\" is unknown type of database")
             raise UnknownDataBaseType(f"{database_config['type']} is unknown type of database")
@@ -50,34 +84,97 @@ class ControllerDataBase:
         return self._instance
 
 
+class StatusFeedPublisher:
+    def __init__(self, database, change_feed):
+        self._database = database
+        self._change_feed = change_feed
+        self._installations = {}
+        self._synchronized = False
+        self._lock = threading.Lock()
+
+    def snapshot(self):
+        with self._lock:
+            if not self._synchronized:
+                self._poll()
+            # events are published only under this lock, so the sequence matches the returned state exactly
+            return self._change_feed.last_sequence, [dict(x, statuses=list(x['statuses']))
+                                                     for x in self._installations.values()]
+
+    def poll(self):
+        with self._lock:
+            if self._change_feed.subscribers:
+                self._poll()
+            else:
+                # nobody listens, so the database is not queried until the next subscriber comes
+                self._installations = {}
+                self._synchronized = False
+
+    def _poll(self):
+        query = SelectQuery(columns=('nodes.host', 'installations.id', 'installations.global_status'),
+                            joins=(Join.INSTALLATIONS,))
+        query.where('installations.global_status', Operator.IN, ACTIVE_STATES)
+        active_installations = self._database.select_data(query=query, columns=('host', 'installation_id',
+                                                                                'global_status'))
+        current = {x['installation_id']: {'host': x['host'], 'installation_id': x['installation_id'],
+                                          'global_status': x['global_status'], 'progress': None,
+                                          'operation': Operation.INSTALL.value, 'statuses': []}
+                   for x in active_installations}
+        for installation_id, installation in self._installations.items():
+            if installation_id not in current:
+                current[installation_id] = dict(installation, statuses=[])
+        if current:
+            query = SelectQuery(columns=('installations.id', 'installations.global_status', 'installations.progress',
+                                         'installations.operation'), table='installations')
+            query.where('installations.id', Operator.IN, list(current.keys()))
+            for record in self._database.select_data(query=query, columns=('installation_id', 'global_status',
+                                                                           'progress', 'operation')):
+                current[record['installation_id']].update(global_status=record['global_status'],
+                                                          progress=record['progress'],
+                                                          operation=record['operation'])
+            query = SelectQuery(columns=('statuses.installation_id', 'statuses.status_name'), table='statuses')
+            query.where('statuses.installation_id', Operator.IN, list(current.keys()))
+            query.order_by('statuses.status_timestamp')
+            for record in self._database.select_data(query=query, columns=('installation_id', 'status_name')):
+                current[record['installation_id']]['statuses'].append(record['status_name'])
+        for installation_id, installation in current.items():
+            if self._installations.get(installation_id) != installation:
+                self._change_feed.publish(event=installation)
+        self._installations = {k: v for k, v in current.items() if v['global_status'] in ACTIVE_STATES}
+        self._synchronized = True
+
+
 class Controller(object):
-    def __init__(self):
-        self._database = ControllerDataBase(config_path=path_to_config).instance
+    def __init__(self, database=None, status_feed=None, status_publisher=None, installer_metrics_file=None,
+                 installer_metrics_max_age=60, dispatch_notifier=None):
+        self._database = database or ControllerDataBase(config_path=path_to_config).instance
+        self._status_feed = status_feed or ChangeFeed()
+        self._status_publisher = status_publisher or StatusFeedPublisher(database=self._database,
+                                                                         change_feed=self._status_feed)
+        self._installer_metrics_file = installer_metrics_file
+        self._installer_metrics_max_age = installer_metrics_max_age
+        self._dispatch_notifier = dispatch_notifier
+
+    @property
+    def status_publisher(self):
+        return self._status_publisher
 
     @cherrypy.expose
     def index(self):
-        template = env.get_template('./html/installer.html')
-        return template.render()
+        return templates.render_static('html/installer.html')
 
     @cherrypy.expose
     def statistics(self):
-        template = env.get_template('./html/statistics.html')
-        query_dictionary = {'host': 'nodes.host',
-                            'cluster': 'nodes.cluster_name',
-                            'user': 'nodes.username',
-                            'db_version': 'nodes.db_version',
-                            'os_version': 'nodes.os_version',
-                            'seed_node': 'nodes.seed_node',
-                            'status': 'installations.global_status'}
-        option_dictionary = {}
-        for key, value in query_dictionary.items():
-            query_data = {'columns': f'distinct {value}', 'join_installations': 'yes', 'join_statuses': 'no',
-                          'filter': f'installations.global_status in (\'{InstallationState.FAILED.value}\', \
-                                                        \'{InstallationState.SUCCEEDED.value}\')'}
-            query_result = self._database.select_data(query_params=query_data, columns=(f'{key}',))
-            option_dictionary[key] = [x.get(key) for x in query_result]
-            logger.debug(msg=f"Found following options for the select \"{key}\": {option_dictionary[key]}")
-            option_dictionary['today'] = datetime.datetime.now().strftime('%Y-%m-%d')
+        template = templates.get_template('html/statistics.html')
+        option_dictionary = {x: [] for x in ('host', 'cluster', 'user', 'db_version', 'os_version', 'seed_node',
+                                             'status')}
+        # the filter options are maintained by the installer in a summary table when installations finish
+        query = SelectQuery(columns=('statistics_facets.facet_name', 'statistics_facets.facet_value'),
+                            table='statistics_facets')
+        query.order_by('statistics_facets.facet_name', 'statistics_facets.facet_value')
+        for facet in self._database.select_data(query=query, columns=('facet_name', 'facet_value')):
+            option_dictionary.setdefault(facet['facet_name'], []).append(facet['facet_value'])
+        logger.debug(msg=f"Found following options for the statistics filters: {option_dictionary}")
+        option_dictionary['today'] = datetime.datetime.now().strftime('%Y-%m-%d')
         return template.render(options=option_dictionary)
 
     @cherrypy.expose
@@ -86,47 +183,111 @@ class Controller(object):
     def get_stat(self):
         data = cherrypy.request.json
         response = {}
-        where_string = "installations.start_timestamp between " \
-                       f"timestamp(\'{data.get('start_date_from')} {data.get('start_time_from')}\') " \
-                       f"and timestamp(\'{data.get('start_date_to')} {data.get('start_time_to')}\')"
-        if data.get('cluster') != 'all':
-            where_string += f" and nodes.cluster_name = \'{data.get('cluster')}\'"
-        if data.get('host') != 'all':
-            where_string += f" and nodes.host = \'{data.get('host')}\'"
-        if data.get('user') != 'all':
-            where_string += f" and nodes.username = \'{data.get('user')}\'"
-        if data.get('db_version') != 'all':
-            where_string += f" and nodes.db_version = \'{data.get('db_version')}\'"
-        if data.get('os_version') == 'None':
-            where_string += f" and nodes.os_version is null"
-        elif data.get('os_version') != 'all':
-            where_string += f" and nodes.os_version = \'{data.get('os_version')}\'"
-        if data.get('seed_node') != 'all':
-            where_string += f" and nodes.seed_node = \'{data.get('seed_node')}\'"
+        sort_field, sort_order = self._statistics_sort(data)
+        page_size = min(self._statistics_page_size(data), STATISTICS_MAX_PAGE_SIZE)
+        # the sort value as it is stored and the installation id are selected as well to build the cursor of the
+        # next page
+        query = self._statistics_query(data=data, extra_columns=(self._database.as_stored(sort_field),
+                                                                 'installations.id'))
+        if data.get('after'):
+            sort_value, installation_id = self._statistics_cursor(data)
+            query.where((sort_field, 'installations.id'),
+                        Operator.AFTER if sort_order == 'asc' else Operator.BEFORE,
+                        (sort_value, installation_id))
+        query.order_by((sort_field, sort_order), ('installations.id', sort_order))
+        query.limit(page_size + 1)
+        statistics = self._database.select_data(query=query,
+                                                columns=STATISTICS_COLUMNS + ('sort_value', 'installation_id'))
+        logger.debug(msg=f"Found {len(statistics)} statistics records for the page after {data.get('after')}")
+        response['next'] = None
+        if len(statistics) > page_size:
+            statistics = statistics[:page_size]
+            last_record = statistics[-1]
+            sort_value = last_record['sort_value']
+            if isinstance(sort_value, datetime.datetime):
+                sort_value = str(sort_value)
+            response['next'] = [sort_value, last_record['installation_id']]
+        response['message'] = [self._format_statistics_record(x) for x in statistics]
+        return response
+
+    @cherrypy.expose
+    @cherrypy.tools.json_in()
+    def get_stat_stream(self):
+        data = cherrypy.request.json
+        sort_field, sort_order = self._statistics_sort(data)
+        query = self._statistics_query(data=data)
+        query.order_by((sort_field, sort_order), ('installations.id', sort_order))
+        cherrypy.response.headers['Content-Type'] = 'application/x-ndjson'
+        return self._stream_statistics(query=query)
+    get_stat_stream._cp_config = {'response.stream': True}
+
+    def _stream_statistics(self, query):
+        for record in self._database.iterate_data(query=query, columns=STATISTICS_COLUMNS):
+            yield json.dumps(self._format_statistics_record(record)) + '\n'
+
+    @staticmethod
+    def _statistics_page_size(data):
+        page_size = data.get('page_size')
+        if page_size in (None, ''):
+            return STATISTICS_PAGE_SIZE
+        if isinstance(page_size, bool) or not str(page_size).isdigit() or int(page_size) <= 0:
+            raise cherrypy.HTTPError(400, f"Page size must be a positive number, got {page_size}")
+        return int(page_size)
+
+    @staticmethod
+    def _statistics_cursor(data):
+        cursor = data.get('after')
+        if not isinstance(cursor, list) or len(cursor) != 2 or isinstance(cursor[1], bool) or \
+                not isinstance(cursor[1], int):
+            raise cherrypy.HTTPError(400, f"Cursor must be a sort value and an installation id, got {cursor}")
+        return cursor
+
+    @staticmethod
+    def _statistics_sort(data):
+        sort_field = STATISTICS_SORT_FIELDS.get(data.get('sort_by') or 'installation_start')
+        if sort_field is None:
+            raise cherrypy.HTTPError(400, f"Statistics can't be sorted by {data.get('sort_by')}")
+        sort_order = data.get('sort_order') or 'desc'
+        if sort_order not in ('asc', 'desc'):
+            raise cherrypy.HTTPError(400, f"Unknown sort order {sort_order}")
+        return sort_field, sort_order
+
+    @staticmethod
+    def _statistics_query(data, extra_columns=()):
+        query = SelectQuery(columns=('nodes.cluster_name', 'nodes.host', 'nodes.username', 'nodes.db_version',
+                                     'nodes.os_version', 'nodes.seed_node', 'installations.start_timestamp',
+                                     'installations.finish_timestamp', 'installations.global_status') +
+                            tuple(extra_columns),
+                            joins=(Join.INSTALLATIONS,))
+        query.where('installations.start_timestamp', Operator.BETWEEN,
+                    (f"{data.get('start_date_from')} {data.get('start_time_from')}",
+                     f"{data.get('start_date_to')} {data.get('start_time_to')}"))
+        filter_fields = {'cluster': 'nodes.cluster_name',
+                         'host': 'nodes.host',
+                         'user': 'nodes.username',
+                         'db_version': 'nodes.db_version',
+                         'os_version': 'nodes.os_version',
+                         'seed_node': 'nodes.seed_node'}
+        for key, field in filter_fields.items():
+            if key == 'os_version' and data.get(key) == 'None':
+                query.where(field, Operator.IS_NULL)
+            elif data.get(key) != 'all':
+                query.where(field, Operator.EQ, data.get(key))
         if data.get('status') != 'all':
-            where_string += f" and installations.global_status = \'{data.get('status')}\'"
+            query.where('installations.global_status', Operator.EQ, data.get('status'))
         else:
-            where_string += f" and installations.global_status in (\'{InstallationState.FAILED.value}\', " \
-                            f"\'{InstallationState.SUCCEEDED.value}\')"
-        query_data = {'columns': 'nodes.cluster_name, nodes.host, nodes.username, nodes.db_version, nodes.os_version,'
-                                 'nodes.seed_node, installations.start_timestamp, installations.finish_timestamp,'
-                                 'installations.global_status', 'join_installations': 'yes', 'join_statuses': 'no',
-                      'filter': where_string}
-        statistics = self._database.select_data(query_params=query_data, columns=('cluster', 'host', 'user',
-                                                                                  'db_version', 'os_version',
-                                                                                  'seed_node', 'installation_start',
-                                                                                  'installation_finish', 'status'))
-        logger.debug(msg=f"Found following statistics records: {statistics}")
-        for record in statistics:
-            if record['installation_start']:
-                record['installation_start'] = record.get('installation_start').strftime('%d.%m.%Y %H:%M:%S.%f')
-            if record['installation_finish']:
-                record['installation_finish'] = record.get('installation_finish').strftime('%d.%m.%Y %H:%M:%S.%f')
-            for key in record.keys():
-                if not record[key]:
-                    record[key] = ''
-        response['message'] = [list(x.values()) for x in statistics]
-        return response
+            query.where('installations.global_status', Operator.IN, FINISHED_STATES)
+        return query
+
+    @staticmethod
+    def _format_statistics_record(record):
+        row = []
+        for key in STATISTICS_COLUMNS:
+            value = record[key]
+            if key in ('installation_start', 'installation_finish') and value:
+                value = value.strftime('%d.%m.%Y %H:%M:%S.%f')
+            row.append(value or '')
+        return row
 
     @cherrypy.expose
     @cherrypy.tools.json_in()
@@ -136,72 +297,144 @@ class Controller(object):
         host = data.get('host')
         response = {}
         if host:
-            sleep(1)
-            query_data = {'columns': 'nodes.host, installations.global_status, statuses.status_name',
-                          'join_installations': 'yes', 'join_statuses': 'yes', 'filter': f'nodes.host = \'{host}\''}
-            available_statuses = self._database.select_data(query_params=query_data, columns=('host', 'global_status',
-                                                                                              'status_name'))
+            query = SelectQuery(columns=('nodes.host', 'installations.global_status', 'statuses.status_name'),
+                                joins=(Join.INSTALLATIONS, Join.STATUSES)).where('nodes.host', Operator.EQ, host)
+            available_statuses = self._database.select_data(query=query, columns=('host', 'global_status',
+                                                                                  'status_name'))
             logger.debug(msg=f"Found following statuses for active installations: {available_statuses}")
             response['message'] = available_statuses
         else:
-            sleep(3)
-            query_data = {'columns': 'nodes.host', 'join_installations': 'yes', 'join_statuses': 'no',
-                          'filter': f'installations.global_status = \'{InstallationState.IN_PROGRESS.value}\''}
-            active_hosts = self._database.select_data(query_params=query_data, columns=('host',))
+            query = SelectQuery(columns=('nodes.host',), joins=(Join.INSTALLATIONS,))
+            query.where('installations.global_status', Operator.EQ, InstallationState.IN_PROGRESS.value)
+            active_hosts = self._database.select_data(query=query, columns=('host',))
             logger.debug(msg=f"Found active installations on hosts: {', '.join([x['host'] for x in active_hosts])}")
             response['message'] = active_hosts
         return response
 
+    @cherrypy.expose
+    def progress_stream(self):
+        cherrypy.response.headers['Content-Type'] = 'text/event-stream'
+        cherrypy.response.headers['Cache-Control'] = 'no-cache'
+        return self._stream_progress()
+    progress_stream._cp_config = {'response.stream': True}
+
+    def _stream_progress(self, keepalive_interval=15):
+        self._status_feed.subscribe()
+        try:
+            sequence, snapshot = self._status_publisher.snapshot()
+            logger.debug(msg=f"Progress stream started with {len(snapshot)} active installations")
+            yield f'event: snapshot\ndata: {json.dumps(snapshot)}\n\n'
+            while True:
+                try:
+                    events = self._status_feed.read(after=sequence, timeout=keepalive_interval)
+                except FeedOverrun as e:
+                    # a slow reader gets the whole state again instead of the events it missed
+                    sequence, snapshot = self._status_publisher.snapshot()
+                    logger.debug(msg=f"Progress stream resynchronized with {len(snapshot)} active installations: {e}")
+                    yield f'event: snapshot\ndata: {json.dumps(snapshot)}\n\n'
+                    continue
+                if not events:
+                    yield ': keepalive\n\n'
+                for sequence, event in events:
+                    yield f'id: {sequence}\ndata: {json.dumps(event)}\n\n'
+        finally:
+            self._status_feed.unsubscribe()
+
+    @cherrypy.expose
+    def metrics(self):
+        cherrypy.response.headers['Content-Type'] = 'text/plain; version=0.0.4; charset=utf-8'
+        process_families = [('controller', registry.families())]
+        if self._installer_metrics_file:
+            # a snapshot older than max age means that the installer is not running
+            for process, snapshot_path in installer_snapshots(snapshot_path=self._installer_metrics_file):
+                process_families.append((process, read_snapshot(snapshot_path=snapshot_path,
+                                                                max_age=self._installer_metrics_max_age)))
+        return render(process_families=process_families)
+
     @cherrypy.expose
     @cherrypy.tools.json_in()
     def install(self):
         data = cherrypy.request.json
-        query_data = {'columns': 'nodes.host', 'join_installations': 'yes', 'join_statuses': 'no',
-                      'filter': f'installations.global_status in (\'{InstallationState.NEW.value}\', \
-                      \'{InstallationState.IN_PROGRESS.value}\')'}
-        active_hosts = self._database.select_data(query_params=query_data, columns=('host',))
-        logger.debug(msg=f"Following nodes already have active installations and will be skipped: "
-                         f"{', '.join([x['host'] for x in active_hosts])}.")
-        new_nodes = ''
-        new_installations = ''
-        nodes_to_install = []
-        for node in data['nodes']:
-            active_node = False
-            for host in active_hosts:
-                if node['host'] == host['host'] and not node.get('force_install'):
-                    active_node = True
-            if not active_node:
-                if node.get('force_install'):
-                    values_to_update = {'global_status': InstallationState.FAILED.value,
-                                        'finish_timestamp': 'get_system_timestamp'}
-                    self._database.update_data(table='installations',
-                                               condition=f'host = \'{node["host"]}\' and global_status in '
-                                                         f'(\'{InstallationState.NEW.value}\','
-                                                         f'\'{InstallationState.IN_PROGRESS.value}\')',
-                                               **values_to_update)
-                node.pop('force_install', None)
-                nodes_to_install.append(node)
-        logger.debug(msg=f"ScyllaDB will be installed on hosts: "
-                         f"{', '.join([x['host'] for x in nodes_to_install])}")
-        for node in nodes_to_install:
-            if node['password'] != 'null':
-                node['password'] = b64encode(node.get('password').encode('utf-8')).decode('utf-8')
-            query_data = {'columns': 'nodes.host', 'join_installations': 'no', 'join_statuses': 'no',
-                          'filter': f'host = \'{node["host"]}\''}
-            existing_node = self._database.select_data(query_params=query_data, columns=('host',))
-            if existing_node:
-                node_to_update = {x: node[x] for x in list(node.keys())[1:]}
-                self._database.update_data(table='nodes', condition=f'host = \'{node["host"]}\'', **node_to_update)
-                new_installations += f'(\'new\', \'{node["host"]}\'),'
-            else:
-                new_nodes += f'{tuple(node.values())},'
-                new_installations += f'(\'new\', \'{node["host"]}\'),'
-        if new_nodes != '':
-            columns_to_insert = tuple(nodes_to_install[0].keys())
-            self._database.insert_data(table='nodes', columns=columns_to_insert, values=new_nodes[:-1])
-        if new_installations != '':
-            columns_to_insert = ('global_status', 'host')
-            self._database.insert_data(table='installations', columns=columns_to_insert, values=new_installations[:-1])
+        operation, batch_size = self._operation_options(operation=data.get('operation', Operation.INSTALL.value),
+                                                        batch_size=data.get('batch_size', '1'))
+        try:
+            nodes = [node_from_fields(fields=x, number=number) for number, x in enumerate(data['nodes'], start=1)]
+        except InvalidManifest as e:
+            raise cherrypy.HTTPError(400, str(e))
+        self._submit_nodes(nodes=nodes, operation=operation, batch_size=batch_size)
+
+    @cherrypy.expose
+    @cherrypy.tools.json_out()
+    def install_manifest(self, manifest, operation=Operation.INSTALL.value, batch_size='1'):
+        operation, batch_size = self._operation_options(operation=operation, batch_size=batch_size)
+        # cherrypy gives a form field without a file name as a string
+        content, filename = (manifest, '') if isinstance(manifest, str) else (manifest.file.read(),
+                                                                                manifest.filename or '')
+        try:
+            nodes = parse_manifest(content=content, filename=filename)
+        except InvalidManifest as e:
+            raise cherrypy.HTTPError(400, str(e))
+        return self._submit_nodes(nodes=nodes, operation=operation, batch_size=batch_size)
+
+    @staticmethod
+    def _operation_options(operation, batch_size):
+        batch_size = str(batch_size)
+        if operation not in [x.value for x in Operation]:
+            raise cherrypy.HTTPError(400, f"Unknown operation {operation}")
+        if not is_valid_batch_size(batch_size):
+            raise cherrypy.HTTPError(400, f"Batch size must be a positive number or 'rack', got {batch_size}")
+        return operation, batch_size
+
+    def _submit_nodes(self, nodes, operation, batch_size):
+        # a host listed twice is installed once with its last parameters
+        nodes = list({x['host']: x for x in nodes}.values())
+        # the whole submission is a few set-based statements in one transaction however many nodes it has
+        with self._database.transaction():
+            query = SelectQuery(columns=('nodes.host', 'nodes.cluster_name', 'nodes.username', 'nodes.db_version',
+                                         'nodes.os_version', 'nodes.seed_node'),
+                                joins=(Join.INSTALLATIONS,), distinct=True)
+            query.where('installations.global_status', Operator.IN, ACTIVE_STATES)
+            query.where('nodes.host', Operator.IN, [x['host'] for x in nodes])
+            active_nodes = {x['host']: x for x in self._database.select_data(
+                query=query, columns=('host', 'cluster', 'user', 'db_version', 'os_version', 'seed_node'))}
+            active_hosts = set(active_nodes)
+            nodes_to_install = [x for x in nodes if x['force_install'] or x['host'] not in active_hosts]
+            skipped_hosts = [x['host'] for x in nodes if not x['force_install'] and x['host'] in active_hosts]
+            forced_hosts = [x['host'] for x in nodes_to_install if x['host'] in active_hosts]
+            logger.debug(msg=f"Following nodes already have active installations and will be skipped: "
+                             f"{', '.join(skipped_hosts)}.")
+            if forced_hosts:
+                values_to_update = {'global_status': InstallationState.FAILED.value,
+                                    'finish_timestamp': 'get_system_timestamp'}
+                self._database.update_data(table='installations',
+                                           condition=f"host in ({', '.join(['%s'] * len(forced_hosts))}) "
+                                                     f"and global_status in (%s, %s)",
+                                           condition_params=forced_hosts + list(ACTIVE_STATES), **values_to_update)
+                # the installations failed here never reach the installer, which maintains the filter options
+                facets = {('status', InstallationState.FAILED.value)}
+                for host in forced_hosts:
+                    facets.update([(k, str(v)) for k, v in active_nodes[host].items()])
+                self._database.upsert_data(table='statistics_facets', columns=('facet_name', 'facet_value'),
+                                           values=sorted(facets))
+            logger.debug(msg=f"ScyllaDB will be installed on hosts: "
+                             f"{', '.join([x['host'] for x in nodes_to_install])}")
+            if nodes_to_install:
+                new_nodes = []
+                for node in nodes_to_install:
+                    if node['password'] != 'null':
+                        node['password'] = b64encode(node['password'].encode('utf-8')).decode('utf-8')
+                    new_nodes.append(tuple(node[x] for x in NODE_COLUMNS))
+                self._database.upsert_data(table='nodes', columns=NODE_COLUMNS, values=new_nodes,
+                                           update_columns=NODE_COLUMNS[1:])
+                # the nodes of a rolling operation are picked up together by the installer and processed in batches
+                self._database.insert_data(table='installations',
+                                           columns=('global_status', 'host', 'operation', 'batch_size'),
+                                           values=[(InstallationState.NEW.value, x['host'], operation, batch_size)
+                                                   for x in nodes_to_install])
+        # the installers are woken up only after the commit, otherwise they could miss the new installations
+        if nodes_to_install and self._dispatch_notifier is not None:
+            self._dispatch_notifier.notify()
+        return {'submitted': [x['host'] for x in nodes_to_install], 'skipped': skipped_hosts}
 
 
 def setup_logging():
@@ -290,6 +523,16 @@ if __name__ == '__main__':
     cherrypy.engine.unsubscribe('graceful', cherrypy.log.reopen_files)
     logger = logging.getLogger()
     logging.config.dictConfig(setup_logging())
-    webapp = Controller()
+    configuration = ConfigObject(config_path=path_to_config)
+    templates_configuration = configuration.templates_config
+    templates.configure(auto_reload=templates_configuration['auto_reload'].lower() == 'true',
+                        bytecode_cache_dir=templates_configuration['bytecode_cache_dir'] or None).precompile()
+    metrics_configuration = configuration.metrics_config
+    webapp = Controller(installer_metrics_file=metrics_configuration['snapshot_file'],
+                        installer_metrics_max_age=int(metrics_configuration['snapshot_max_age']),
+                        dispatch_notifier=DispatchNotifier(
+                            socket_dir=configuration.installer_config['dispatch_socket_dir']))
+    cherrypy.process.plugins.Monitor(cherrypy.engine, webapp.status_publisher.poll, frequency=1,
+                                     name='StatusFeedPublisher').subscribe()
     logger.info(msg="Controller is starting up")
     cherrypy.quickstart(webapp, '/', path_to_config)
@@ -0,0 +1,145 @@
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from time import monotonic
+
+
+class ConnectionPoolExhausted(Exception):
+    pass
+
+
+class PooledConnection:
+    def __init__(self, connection, statement_cache_size=64):
+        self._connection = connection
+        self._statement_cache_size = statement_cache_size
+        self._statements = OrderedDict()
+        self.created = monotonic()
+        self.last_used = self.created
+
+    @property
+    def connection(self):
+        return self._connection
+
+    def get_statement(self, query, factory):
+        statement = self._statements.get(query)
+        if statement is None:
+            statement = factory(self._connection)
+            self._statements[query] = statement
+            if len(self._statements) > self._statement_cache_size:
+                old_query, old_statement = self._statements.popitem(last=False)
+                old_statement.close()
+        else:
+            self._statements.move_to_end(query)
+        return statement
+
+    def close(self):
+        for statement in self._statements.values():
+            try:
+                statement.close()
+            except Exception:
+                pass
+        self._statements.clear()
+        try:
+            self._connection.close()
+        except Exception:
+            pass
+
+
+class ConnectionPool:
+    def __init__(self, connection_factory, health_check=None, pool_size=10, recycle=3600, health_check_interval=30,
+                 acquire_timeout=30):
+        self._connection_factory = connection_factory
+        self._health_check = health_check
+        self._pool_size = pool_size
+        self._recycle = recycle
+        self._health_check_interval = health_check_interval
+        self._acquire_timeout = acquire_timeout
+        self._idle = []
+        self._opened = 0
+        self._condition = threading.Condition()
+
+    @property
+    def pool_size(self):
+        return self._pool_size
+
+    @property
+    def opened(self):
+        with self._condition:
+            return self._opened
+
+    @property
+    def idle(self):
+        with self._condition:
+            return len(self._idle)
+
+    @contextmanager
+    def connection(self):
+        pooled_connection = self._acquire()
+        try:
+            yield pooled_connection
+        except BaseException:
+            # the state of a connection that failed in the middle of a query is unknown, so it is not reused;
+            # this also covers a streaming generator closed before its cursor was exhausted
+            self._discard(pooled_connection)
+            raise
+        else:
+            self._release(pooled_connection)
+
+    def close_all(self):
+        with self._condition:
+            idle_connections = self._idle
+            self._idle = []
+            self._opened -= len(idle_connections)
+            self._condition.notify_all()
+        for pooled_connection in idle_connections:
+            pooled_connection.close()
+
+    def _acquire(self):
+        deadline = monotonic() + self._acquire_timeout
+        with self._condition:
+            while True:
+                if self._idle:
+                    pooled_connection = self._idle.pop()
+                    break
+                if self._opened < self._pool_size:
+                    self._opened += 1
+                    pooled_connection = None
+                    break
+                remaining = deadline - monotonic()
+                if remaining <= 0:
+                    raise ConnectionPoolExhausted(f"All {self._pool_size} database connections are busy")
+                self._condition.wait(timeout=remaining)
+        if pooled_connection is not None:
+            pooled_connection = self._validate(pooled_connection)
+        if pooled_connection is None:
+            try:
+                pooled_connection = PooledConnection(connection=self._connection_factory())
+            except Exception:
+                with self._condition:
+                    self._opened -= 1
+                    self._condition.notify()
+                raise
+        return pooled_connection
+
+    def _validate(self, pooled_connection):
+        now = monotonic()
+        if now - pooled_connection.created >= self._recycle:
+            pooled_connection.close()
+            return None
+        if self._health_check and now - pooled_connection.last_used >= self._health_check_interval:
+            if not self._health_check(pooled_connection.connection):
+                pooled_connection.close()
+                return None
+        return pooled_connection
+
+    def _release(self, pooled_connection):
+        pooled_connection.last_used = monotonic()
+        with self._condition:
+            self._idle.append(pooled_connection)
+            self._condition.notify()
+
+    def _discard(self, pooled_connection):
+        pooled_connection.close()
+        with self._condition:
+            self._opened -= 1
+            self._condition.notify()
@@ -0,0 +1,41 @@
+from os import path
+
+TABLE_SCRIPTS = ('create_nodes.sql', 'create_installations.sql', 'create_statuses.sql')
+
+
+def list_migrations(template_environment, db_type):
+    migrations = template_environment.list_templates(
+        filter_func=lambda x: path.dirname(x) == f'{db_type}/migrations' and x.endswith('.sql'))
+    return sorted(migrations)
+
+
+def split_statements(script):
+    return [x.strip() for x in script.split(';') if x.strip()]
+
+
+def applied_migrations(database, schema):
+    return {x[0] for x in database.execute(query=f'select version from {schema}.schema_migrations')}
+
+
+def apply_migrations(database, template_environment, db_type, schema):
+    template = template_environment.get_template(f'./{db_type}/create_schema_migrations.sql')
+    database.execute(query=template.render(database=schema))
+    already_applied = applied_migrations(database=database, schema=schema)
+    applied_now = []
+    for migration in list_migrations(template_environment=template_environment, db_type=db_type):
+        version = path.splitext(path.basename(migration))[0]
+        if version in already_applied:
+            continue
+        script = template_environment.get_template(migration).render(database=schema)
+        for statement in split_statements(script=script):
+            database.execute(query=statement)
+        database.insert_data(table=f'{schema}.schema_migrations', columns=('version',), values=[(version,)])
+        applied_now.append(version)
+    return applied_now
+
+
+def create_tables(database, template_environment, db_type, schema):
+    for script in TABLE_SCRIPTS:
+        database.execute(query=template_environment.get_template(f'./{db_type}/{script}').render(database=schema))
+    return apply_migrations(database=database, template_environment=template_environment, db_type=db_type,
+                            schema=schema)
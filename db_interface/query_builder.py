@@ -0,0 +1,120 @@
+from enum import Enum, unique
+from functools import lru_cache
+
+
+class InvalidQuery(Exception):
+    pass
+
+
+@unique
+class Join(Enum):
+    INSTALLATIONS = 'join installations on nodes.host = installations.host'
+    STATUSES = 'join statuses on installations.id = statuses.installation_id'
+
+
+@unique
+class Operator(Enum):
+    EQ = '='
+    NE = '!='
+    GT = '>'
+    GE = '>='
+    LT = '<'
+    LE = '<='
+    IN = 'in'
+    BETWEEN = 'between'
+    IS_NULL = 'is null'
+    AFTER = 'after'
+    BEFORE = 'before'
+
+
+class SelectQuery:
+    def __init__(self, columns, joins=(), table='nodes', distinct=False):
+        self._table = table
+        self._columns = tuple(columns)
+        self._joins = tuple(joins)
+        self._distinct = distinct
+        self._filters = []
+        self._params = []
+        self._order = ()
+        self._limit = None
+
+    @property
+    def shape(self):
+        return (self._table, self._columns, self._joins, self._distinct, tuple(self._filters), self._order,
+                self._limit is not None)
+
+    @property
+    def params(self):
+        params = list(self._params)
+        if self._limit is not None:
+            params.append(self._limit)
+        return params
+
+    def where(self, field, operator=Operator.EQ, value=None):
+        if operator == Operator.IS_NULL:
+            self._filters.append((field, operator, 0))
+        elif operator == Operator.IN:
+            values = list(value)
+            if not values:
+                raise InvalidQuery(f'Empty list of values for the filter on {field}')
+            self._filters.append((field, operator, len(values)))
+            self._params.extend(values)
+        elif operator == Operator.BETWEEN:
+            low, high = value
+            self._filters.append((field, operator, 2))
+            self._params.extend([low, high])
+        elif operator in (Operator.AFTER, Operator.BEFORE):
+            # keyset condition on a (sort field, unique tie breaker) pair, both given as tuples
+            fields, values = tuple(field), tuple(value)
+            if len(fields) != 2 or len(values) != 2:
+                raise InvalidQuery(f'Keyset filter needs a sort field and a tie breaker, got {field}')
+            self._filters.append((fields, operator, 3))
+            self._params.extend([values[0], values[0], values[1]])
+        else:
+            self._filters.append((field, operator, 1))
+            self._params.append(value)
+        return self
+
+    def order_by(self, *fields):
+        order = tuple(x if isinstance(x, tuple) else (x, 'asc') for x in fields)
+        for field, direction in order:
+            if direction not in ('asc', 'desc'):
+                raise InvalidQuery(f'Unknown sort direction "{direction}" for {field}')
+        self._order = order
+        return self
+
+    def limit(self, row_count):
+        self._limit = int(row_count)
+        return self
+
+    def build(self):
+        return render_select(self.shape), self.params
+
+
+@lru_cache(maxsize=256)
+def render_select(shape):
+    table, columns, joins, distinct, filters, order, has_limit = shape
+    query = f"select {'distinct ' if distinct else ''}{', '.join(columns)} from {table}"
+    for join in joins:
+        query += f' {join.value}'
+    conditions = []
+    for field, operator, arity in filters:
+        if operator == Operator.IS_NULL:
+            conditions.append(f'{field} is null')
+        elif operator == Operator.IN:
+            conditions.append(f"{field} in ({', '.join(['%s'] * arity)})")
+        elif operator == Operator.BETWEEN:
+            conditions.append(f'{field} between %s and %s')
+        elif operator in (Operator.AFTER, Operator.BEFORE):
+            sort_field, tie_breaker = field
+            sign = '>' if operator == Operator.AFTER else '<'
+            conditions.append(f'({sort_field} {sign} %s or ({sort_field} = %s and {tie_breaker} {sign} %s))')
+        else:
+            conditions.append(f'{field} {operator.value} %s')
+    if conditions:
+        query += ' where ' + ' and '.join(conditions)
+    if order:
+        query += ' order by ' + ', '.join([f'{field} {direction}' for field, direction in order])
+    if has_limit:
+        query += ' limit %s'
+    return query
@@ -1,18 +1,28 @@
 import mysql.connector
+import sqlite3
+import threading
 from abc import ABC, abstractmethod
 from base64 import b64decode
-from jinja2 import FileSystemLoader, Environment, select_autoescape
+from contextlib import contextmanager
+from datetime import datetime
+from db_interface.connection_pool import ConnectionPool
+from metrics import registry
 
-env = Environment(
-    loader=FileSystemLoader('templates'),
-    autoescape=select_autoescape()
-)
+QUERY_SECONDS = registry.histogram('installer_database_query_seconds', 'Duration of database queries including the '
+                                                                      'wait for a pooled connection', ('operation',))
+QUERY_ERRORS = registry.counter('installer_database_query_errors_total', 'Database queries which raised an error',
+                                ('operation',))
+SQLITE_SCHEMA = 'main'
+
+# timestamps are kept as ISO 8601 text and returned as datetime objects like the ones of MySQL
+sqlite3.register_adapter(datetime, lambda value: value.isoformat(' '))
+sqlite3.register_converter('timestamp', lambda value: datetime.fromisoformat(value.decode('utf-8')))
 
 
 class SQLDataBase(ABC):
 
     @abstractmethod
-    def execute(self, query):
+    def execute(self, query, params=None, prepared=False):
         pass
 
     @abstractmethod
@@ -20,64 +30,376 @@ class SQLDataBase(ABC):
         pass
 
     @abstractmethod
-    def update_data(self, table, condition, **kwargs):
+    def upsert_data(self, table, columns, values, update_columns=()):
+        pass
+
+    @abstractmethod
+    def update_data(self, table, condition, condition_params=(), **kwargs):
+        pass
+
+    @abstractmethod
+    def update_rows(self, table, key_column, rows, condition=None, condition_params=()):
         pass
 
     @abstractmethod
     def select_data(self, query, columns):
         pass
 
+    @abstractmethod
+    def iterate_data(self, query, columns, batch_size=500):
+        pass
+
+    @abstractmethod
+    def transaction(self):
+        pass
+
+    @abstractmethod
+    def current_timestamp(self):
+        pass
+
+    @abstractmethod
+    def as_stored(self, column):
+        pass
+
 
 class MySQLDatabase(SQLDataBase):
-    def __init__(self, user, password, database, host, port, db_type):
+    def __init__(self, user, password, database, host, port, db_type, pool_size=10, pool_recycle=3600):
         self._user = user
         self._password = b64decode(password).decode('utf-8')
         self._database = database
         self._host = host
         self._port = int(port)
         self._db_type = db_type
+        self._local = threading.local()
+        self._pool = ConnectionPool(connection_factory=self._connect, health_check=self._is_healthy,
+                                    pool_size=int(pool_size), recycle=int(pool_recycle))
+
+    @property
+    def pool(self):
+        return self._pool
+
+    @property
+    def schema(self):
+        return self._database
+
+    def _connect(self):
+        return mysql.connector.connect(user=self._user,
+                                       password=self._password,
+                                       database=self._database,
+                                       host=self._host,
+                                       port=self._port,
+                                       autocommit=True)
+
+    @staticmethod
+    def _is_healthy(connection):
+        try:
+            connection.ping(reconnect=False)
+        except mysql.connector.Error:
+            return False
+        return True
+
+    def execute(self, query, params=None, prepared=False):
+        operation = (query.split(None, 1) or [''])[0].lower()
+        try:
+            with QUERY_SECONDS.time(operation=operation):
+                return self._execute(query=query, params=params, prepared=prepared)
+        except Exception:
+            QUERY_ERRORS.inc(operation=operation)
+            raise
 
-    def execute(self, query):
+    @contextmanager
+    def transaction(self):
+        if getattr(self._local, 'connection', None) is not None:
+            # a nested transaction is a part of the outer one
+            yield
+            return
+        with self._pool.connection() as pooled_connection:
+            # the statements of this thread run on the connection of the transaction until it is finished
+            self._local.connection = pooled_connection
+            try:
+                pooled_connection.connection.start_transaction()
+                yield
+            except BaseException:
+                try:
+                    pooled_connection.connection.rollback()
+                except mysql.connector.Error:
+                    pass
+                raise
+            else:
+                pooled_connection.connection.commit()
+            finally:
+                self._local.connection = None
+
+    @contextmanager
+    def _connection(self):
+        pooled_connection = getattr(self._local, 'connection', None)
+        if pooled_connection is not None:
+            yield pooled_connection
+        else:
+            with self._pool.connection() as pooled_connection:
+                yield pooled_connection
+
+    def _execute(self, query, params, prepared):
         result = []
-        with mysql.connector.connect(user=self._user,
-                                     password=self._password,
-                                     database=self._database,
-                                     host=self._host,
-                                     port=self._port,
-                                     autocommit=True) as connection:
-            with connection.cursor() as cursor:
-                cursor.execute(query)
-                for row in cursor:
-                    result.append(row)
+        with self._connection() as pooled_connection:
+            if prepared:
+                # prepared cursors are kept per connection, so a repeated statement is prepared only once
+                cursor = pooled_connection.get_statement(query=query,
+                                                         factory=lambda x: x.cursor(prepared=True))
+                cursor.execute(query, params)
+                if cursor.with_rows:
+                    result = cursor.fetchall()
+            else:
+                with pooled_connection.connection.cursor() as cursor:
+                    cursor.execute(query, params)
+                    for row in cursor:
+                        result.append(row)
         return result
 
     def insert_data(self, table, columns, values):
-        raw_query = f"insert into {table} " + f"{columns} ".replace("'", "") + f"values {values}"
-        query = self.replace_string(query=raw_query)
-        self.execute(query=query)
+        params = []
+        rows = self._bind_rows(values=values, params=params)
+        query = f"insert into {table} ({', '.join(columns)}) values {', '.join(rows)}"
+        self.execute(query=query, params=params, prepared=len(rows) == 1)
+
+    def upsert_data(self, table, columns, values, update_columns=()):
+        params = []
+        rows = self._bind_rows(values=values, params=params)
+        if update_columns:
+            updates = ', '.join([f'{x} = values({x})' for x in update_columns])
+            query = f"insert into {table} ({', '.join(columns)}) values {', '.join(rows)} " \
+                    f"on duplicate key update {updates}"
+        else:
+            query = f"insert ignore into {table} ({', '.join(columns)}) values {', '.join(rows)}"
+        self.execute(query=query, params=params, prepared=len(rows) == 1)
+
+    def update_data(self, table, condition, condition_params=(), **kwargs):
+        params = []
+        values = ", ".join([f"{k} = {self._bind_value(value=v, params=params)}" for k, v in kwargs.items()])
+        query = f"update {table} set {values} where {condition}"
+        self.execute(query=query, params=params + list(condition_params), prepared=True)
 
-    def update_data(self, table, condition, **kwargs):
-        values = ", ".join([f"{k} = '{v}'" for k, v in kwargs.items()])
-        raw_query = f"update {table} set {values} where {condition}"
-        query = self.replace_string(query=raw_query)
-        self.execute(query=query)
+    def update_rows(self, table, key_column, rows, condition=None, condition_params=()):
+        query, params = update_rows_query(table=table, key_column=key_column, rows=rows,
+                                          bind_value=lambda value, params: self._bind_value(value=value, params=params),
+                                          condition=condition, condition_params=condition_params)
+        self.execute(query=query, params=params)
 
-    def select_data(self, query_params, columns):
+    def select_data(self, query, columns):
         result = []
-        for k, v in query_params.items():
-            if 'join' in k:
-                query_params[k] = v.replace('no', '--').replace('yes', '')
-        template = env.get_template(f'./{self._db_type}/select_query.sql')
-        query = template.render(query_params)
-        data = self.execute(query=query)
+        statement, params = query.build()
+        data = self.execute(query=statement, params=params, prepared=True)
         for record in data:
             result.append(dict(zip(columns, record)))
         return result
 
+    def iterate_data(self, query, columns, batch_size=500):
+        statement, params = query.build()
+        with self._connection() as pooled_connection:
+            # an unbuffered cursor reads the result set in batches instead of materialising it
+            with pooled_connection.connection.cursor() as cursor:
+                cursor.execute(statement, params)
+                while True:
+                    rows = cursor.fetchmany(size=batch_size)
+                    if not rows:
+                        break
+                    for record in rows:
+                        yield dict(zip(columns, record))
+
+    def _bind_rows(self, values, params):
+        rows = []
+        for row in values:
+            placeholders = []
+            for value in row:
+                placeholders.append(self._bind_value(value=value, params=params))
+            rows.append(f"({', '.join(placeholders)})")
+        return rows
+
+    def current_timestamp(self):
+        # the clock of the database server, shared by the processes on all machines which use it
+        return self.execute(query='select current_timestamp(6)')[0][0]
+
     @staticmethod
-    def replace_string(query):
-        replacement = {'\'null\'': 'null',
-                       '\'get_system_timestamp\'': 'current_timestamp(6)'}
-        for k, v in replacement.items():
-            query = query.replace(k, v)
-        return query
+    def as_stored(column):
+        return column
+
+    @staticmethod
+    def _bind_value(value, params):
+        if value == 'get_system_timestamp':
+            return 'current_timestamp(6)'
+        params.append(None if value == 'null' else value)
+        return '%s'
+
+
+class SQLiteDatabase(SQLDataBase):
+    def __init__(self, database, busy_timeout=30):
+        self._database = database
+        self._busy_timeout = float(busy_timeout)
+        self._local = threading.local()
+        self._connections = {}
+        self._lock = threading.Lock()
+
+    @property
+    def path(self):
+        return self._database
+
+    @property
+    def schema(self):
+        return SQLITE_SCHEMA
+
+    @property
+    def opened(self):
+        with self._lock:
+            return len(self._connections)
+
+    def close(self):
+        with self._lock:
+            connections, self._connections = list(self._connections.values()), {}
+        for connection in connections:
+            connection.close()
+        self._local = threading.local()
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = self._connect()
+            self._local.connection = connection
+            with self._lock:
+                # a thread can't close its connection when it finishes, so it is closed by the next new thread
+                for thread in [x for x in self._connections if not x.is_alive()]:
+                    self._connections.pop(thread).close()
+                self._connections[threading.current_thread()] = connection
+        return connection
+
+    def _connect(self):
+        # every thread has its own connection, the controller and the installer processes share the file through
+        # the write-ahead log and wait up to busy_timeout seconds for each other's writes
+        connection = sqlite3.connect(self._database, timeout=self._busy_timeout, isolation_level=None,
+                                     detect_types=sqlite3.PARSE_DECLTYPES, check_same_thread=False)
+        connection.execute('pragma journal_mode = wal')
+        connection.execute('pragma synchronous = normal')
+        connection.execute('pragma foreign_keys = on')
+        return connection
+
+    def execute(self, query, params=None, prepared=False):
+        return self._observe(query=query, params=params or (), many=False)
+
+    def _observe(self, query, params, many):
+        operation = (query.split(None, 1) or [''])[0].lower()
+        try:
+            with QUERY_SECONDS.time(operation=operation):
+                return self._execute(query=query.replace('%s', '?'), params=params, many=many)
+        except Exception:
+            QUERY_ERRORS.inc(operation=operation)
+            raise
+
+    def _execute(self, query, params, many):
+        connection = self._connection()
+        if not many:
+            # statements are prepared once per connection by the statement cache of sqlite3
+            return connection.execute(query, params).fetchall()
+        # the rows of a batch are written by one transaction, so the file is locked and synced once per batch
+        with self.transaction():
+            connection.executemany(query, params)
+        return []
+
+    @contextmanager
+    def transaction(self):
+        connection = self._connection()
+        if connection.in_transaction:
+            # a nested transaction is a part of the outer one
+            yield
+            return
+        # the write lock is taken up front, so a concurrent writer waits instead of failing with a deadlock
+        connection.execute('begin immediate')
+        try:
+            yield
+        except BaseException:
+            connection.execute('rollback')
+            raise
+        connection.execute('commit')
+
+    def insert_data(self, table, columns, values):
+        self._write_rows(query=f"insert into {table} ({', '.join(columns)}) values", values=values)
+
+    def upsert_data(self, table, columns, values, update_columns=()):
+        if update_columns:
+            updates = ', '.join([f'{x} = excluded.{x}' for x in update_columns])
+            self._write_rows(query=f"insert into {table} ({', '.join(columns)}) values", values=values,
+                             suffix=f'on conflict do update set {updates}')
+        else:
+            self._write_rows(query=f"insert or ignore into {table} ({', '.join(columns)}) values", values=values)
+
+    def _write_rows(self, query, values, suffix=''):
+        rows = [[self._bind_value(value=x) for x in row] for row in values]
+        if not rows:
+            return
+        query = f"{query} ({', '.join(['%s'] * len(rows[0]))}) {suffix}".strip()
+        if len(rows) == 1:
+            self.execute(query=query, params=rows[0])
+        else:
+            self._observe(query=query, params=rows, many=True)
+
+    def update_data(self, table, condition, condition_params=(), **kwargs):
+        values = ', '.join([f'{k} = %s' for k in kwargs])
+        self.execute(query=f'update {table} set {values} where {condition}',
+                     params=[self._bind_value(value=x) for x in kwargs.values()] + list(condition_params))
+
+    def update_rows(self, table, key_column, rows, condition=None, condition_params=()):
+        def bind_value(value, params):
+            params.append(self._bind_value(value=value))
+            return '%s'
+
+        query, params = update_rows_query(table=table, key_column=key_column, rows=rows, bind_value=bind_value,
+                                          condition=condition, condition_params=condition_params)
+        self.execute(query=query, params=params)
+
+    def select_data(self, query, columns):
+        statement, params = query.build()
+        return [dict(zip(columns, record)) for record in self.execute(query=statement, params=params)]
+
+    def iterate_data(self, query, columns, batch_size=500):
+        statement, params = query.build()
+        cursor = self._connection().execute(statement.replace('%s', '?'), params)
+        try:
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                for record in rows:
+                    yield dict(zip(columns, record))
+        finally:
+            cursor.close()
+
+    def current_timestamp(self):
+        return self._bind_value(value='get_system_timestamp')
+
+    @staticmethod
+    def as_stored(column):
+        # timestamps are stored as text in different precisions and compared as text, an expression is not
+        # converted by the declared type, so the value can be compared with its own row again
+        return f'cast({column} as text)'
+
+    @staticmethod
+    def _bind_value(value):
+        # the database file is local, so the clock of this process is the clock of the database
+        if value == 'get_system_timestamp':
+            return datetime.now()
+        return None if value == 'null' else value
+
+
+def update_rows_query(table, key_column, rows, bind_value, condition=None, condition_params=()):
+    # rows with different values are updated by one statement, every column takes the value of the row's key
+    params = []
+    assignments = []
+    for column in dict.fromkeys([x for values in rows.values() for x in values]):
+        cases = []
+        for key, values in rows.items():
+            if column in values:
+                params.append(key)
+                cases.append(f'when %s then {bind_value(values[column], params)}')
+        assignments.append(f"{column} = case {key_column} {' '.join(cases)} else {column} end")
+    params.extend(rows)
+    params.extend(condition_params)
+    return f"update {table} set {', '.join(assignments)} where {key_column} in " \
+           f"({', '.join(['%s'] * len(rows))})" + (f' and {condition}' if condition else ''), params
@@ -0,0 +1,95 @@
+import logging
+import select
+import socket
+from glob import glob
+from os import path, makedirs, remove
+from metrics import registry
+
+logger = logging.getLogger('installer')
+
+DISPATCH_WAKEUPS = registry.counter('installer_dispatch_wakeups_total', 'Wake-ups of the installer dispatch loop',
+                                    ('reason',))
+SOCKET_SUFFIX = '.sock'
+
+
+class DispatchNotifier:
+    def __init__(self, socket_dir):
+        self._socket_dir = socket_dir
+
+    def notify(self):
+        # every installer process listening on this machine is woken up, the database decides which one claims what
+        notified = 0
+        with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as sender:
+            sender.setblocking(False)
+            for socket_path in glob(path.join(self._socket_dir, f'*{SOCKET_SUFFIX}')):
+                try:
+                    sender.sendto(b'new', socket_path)
+                except BlockingIOError:
+                    # the listener has not read its previous notifications yet, one more would change nothing
+                    pass
+                except (ConnectionRefusedError, FileNotFoundError):
+                    # the socket of a process which died without removing it
+                    self._remove_stale_socket(socket_path=socket_path)
+                    continue
+                except OSError as e:
+                    logger.warning(msg=f'Installer listening on {socket_path} could not be notified: {e}')
+                    continue
+                notified += 1
+        return notified
+
+    @staticmethod
+    def _remove_stale_socket(socket_path):
+        try:
+            remove(socket_path)
+        except FileNotFoundError:
+            pass
+
+
+class DispatchListener:
+    def __init__(self, socket_dir, name):
+        self._socket_path = path.join(socket_dir, f'{name}{SOCKET_SUFFIX}')
+        self._socket = None
+
+    @property
+    def socket_path(self):
+        return self._socket_path
+
+    def start(self):
+        makedirs(path.dirname(self._socket_path) or '.', exist_ok=True)
+        if path.exists(self._socket_path):
+            remove(self._socket_path)
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._socket.setblocking(False)
+        self._socket.bind(self._socket_path)
+        return self
+
+    def wait(self, timeout):
+        readable, _, _ = select.select([self._socket], [], [], timeout)
+        if not readable:
+            DISPATCH_WAKEUPS.inc(reason='poll_interval')
+            return False
+        # several submissions made while the installer was busy are handled by one poll
+        while True:
+            try:
+                self._socket.recv(64)
+            except BlockingIOError:
+                break
+        DISPATCH_WAKEUPS.inc(reason='notification')
+        return True
+
+    def wake(self):
+        # e.g. a finished job freed a worker, so more installations can be taken over without waiting for the poll
+        listening_socket = self._socket
+        if listening_socket is None:
+            return
+        try:
+            listening_socket.sendto(b'wake', self._socket_path)
+        except OSError:
+            # the listener has unread notifications already or it has just been closed
+            pass
+
+    def close(self):
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
+            DispatchNotifier._remove_stale_socket(socket_path=self._socket_path)
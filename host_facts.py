@@ -0,0 +1,208 @@
+import json
+import logging
+from concurrent.futures import wait
+from concurrent.futures.thread import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from db_interface.query_builder import SelectQuery, Operator
+from ssh_interface.ssh import SSHConnection
+from ssh_interface.command_batch import CommandBatch
+
+logger = logging.getLogger('installer')
+
+# all the facts of a host are read by one batch, only the OS release is mandatory
+FACT_COMMANDS = (('os_release', 'cat /etc/os-release'),
+                 ('nic_names', 'ls /sys/class/net/ | grep -E \'eno|ens|enp|enx|wlo|wls|wnp|wnx\' || true'),
+                 ('cpu_count', 'nproc'),
+                 ('memory_kb', 'awk \'/^MemTotal:/ {print $2}\' /proc/meminfo'),
+                 ('disks', 'lsblk -d -n -b -o NAME,SIZE,TYPE 2>/dev/null | awk \'$3 == "disk" {print $1, $2}\' '
+                           '|| true'),
+                 ('scylla_version', 'scylla --version 2>/dev/null || true'))
+FACT_COLUMNS = ('host', 'os_id', 'os_version_id', 'nic_names', 'cpu_count', 'memory_mb', 'disks', 'scylla_version',
+                'gathered_timestamp')
+
+
+class HostFactsError(Exception):
+    pass
+
+
+def parse_os_release(lines):
+    os_release = {}
+    for line in lines:
+        line = line.strip()
+        if '=' in line and not line.startswith('#'):
+            key, value = line.split('=', 1)
+            os_release[key] = value.replace('"', '')
+    return os_release
+
+
+class HostFacts:
+    def __init__(self, host, os_release, nic_names=(), cpu_count=None, memory_mb=None, disks=(),
+                 scylla_version=None, gathered_timestamp=None):
+        self._host = host
+        self._os_release = dict(os_release)
+        self._nic_names = list(nic_names)
+        self._cpu_count = cpu_count
+        self._memory_mb = memory_mb
+        self._disks = list(disks)
+        self._scylla_version = scylla_version
+        self._gathered_timestamp = gathered_timestamp or datetime.now()
+
+    @property
+    def host(self):
+        return self._host
+
+    @property
+    def os_release(self):
+        return dict(self._os_release)
+
+    @property
+    def nic_names(self):
+        return list(self._nic_names)
+
+    @property
+    def cpu_count(self):
+        return self._cpu_count
+
+    @property
+    def memory_mb(self):
+        return self._memory_mb
+
+    @property
+    def disks(self):
+        return list(self._disks)
+
+    @property
+    def scylla_version(self):
+        return self._scylla_version
+
+    @property
+    def gathered_timestamp(self):
+        return self._gathered_timestamp
+
+    @staticmethod
+    def batch():
+        batch = CommandBatch(name='Host facts')
+        for name, command in FACT_COMMANDS:
+            batch.add(command)
+        return batch
+
+    @classmethod
+    def from_results(cls, host, batch, results, stderr=()):
+        if len(results) < len(batch) or any(x.exit_code != 0 for x in results):
+            error_msg = '\n'.join([line for x in results for line in x.stderr] + list(stderr))
+            raise HostFactsError(f'Facts of {host} could not be read: {error_msg.strip()}')
+        output = {name: [line.strip() for line in result.stdout if line.strip()]
+                  for (name, command), result in zip(FACT_COMMANDS, results)}
+        os_release = parse_os_release(lines=output['os_release'])
+        memory_kb = _first_int(output['memory_kb'])
+        disks = []
+        for line in output['disks']:
+            fields = line.split()
+            if len(fields) == 2 and fields[1].isdigit():
+                disks.append({'name': fields[0], 'size_bytes': int(fields[1])})
+        return cls(host=host, os_release=os_release, nic_names=output['nic_names'],
+                   cpu_count=_first_int(output['cpu_count']),
+                   memory_mb=None if memory_kb is None else memory_kb // 1024, disks=disks,
+                   scylla_version=output['scylla_version'][0] if output['scylla_version'] else None)
+
+    @classmethod
+    def from_record(cls, record):
+        return cls(host=record['host'], os_release={'ID': record['os_id'], 'VERSION_ID': record['os_version_id']},
+                   nic_names=json.loads(record['nic_names'] or '[]'), cpu_count=record['cpu_count'],
+                   memory_mb=record['memory_mb'], disks=json.loads(record['disks'] or '[]'),
+                   scylla_version=record['scylla_version'], gathered_timestamp=record['gathered_timestamp'])
+
+    def to_row(self):
+        return (self._host, self._os_release.get('ID'), self._os_release.get('VERSION_ID'),
+                json.dumps(self._nic_names), self._cpu_count, self._memory_mb, json.dumps(self._disks),
+                self._scylla_version, self._gathered_timestamp)
+
+
+class HostFactsStore:
+    def __init__(self, database, ttl=3600):
+        self._database = database
+        self._ttl = ttl
+
+    @property
+    def ttl(self):
+        return self._ttl
+
+    def fresh_facts(self, hosts):
+        hosts = list(hosts)
+        if not hosts:
+            return {}
+        query = SelectQuery(columns=[f'host_facts.{x}' for x in FACT_COLUMNS], table='host_facts')
+        query.where('host_facts.host', Operator.IN, hosts)
+        # the timestamps are written by the installer, so they are compared with its own clock
+        query.where('host_facts.gathered_timestamp', Operator.GE, datetime.now() - timedelta(seconds=self._ttl))
+        return {x['host']: HostFacts.from_record(record=x)
+                for x in self._database.select_data(query=query, columns=FACT_COLUMNS)}
+
+    def get(self, host):
+        return self.fresh_facts(hosts=[host]).get(host)
+
+    def save(self, facts):
+        self._database.upsert_data(table='host_facts', columns=FACT_COLUMNS, values=[x.to_row() for x in facts],
+                                   update_columns=FACT_COLUMNS[1:])
+
+
+class HostFactsGatherer:
+    def __init__(self, store, max_workers=32, connection_class=SSHConnection, timeout=10):
+        self._store = store
+        self._max_workers = max_workers
+        self._connection_class = connection_class
+        self._timeout = timeout
+
+    @property
+    def store(self):
+        return self._store
+
+    def gather(self, nodes):
+        facts = self._store.fresh_facts(hosts=[x['host'] for x in nodes])
+        missing = [x for x in nodes if x['host'] not in facts]
+        if not missing:
+            return facts
+        gathered = []
+        executor = ThreadPoolExecutor(max_workers=max(min(self._max_workers, len(missing)), 1))
+        futures = [(x['host'], executor.submit(self._gather_host, node=x)) for x in missing]
+        # an unreachable host doesn't hold the installations of the other hosts back until its connect timeout,
+        # the facts of the hosts which answer late are saved for their installations in the background
+        done, pending = wait([x[1] for x in futures], timeout=self._timeout)
+        executor.shutdown(wait=False)
+        for host, future in futures:
+            if future in pending:
+                future.add_done_callback(self._save_late_facts)
+                continue
+            try:
+                gathered.append(future.result())
+            except Exception as e:
+                # the installation of the host reads its facts itself and fails with the actual error
+                logger.warning(msg=f'Facts of {host} were not gathered: {e}')
+        if gathered:
+            self._store.save(facts=gathered)
+        logger.info(msg=f'Facts gathered from {len(gathered)} of {len(missing)} hosts, {len(pending)} hosts did not '
+                        f'answer within {self._timeout} s, {len(facts)} hosts had fresh facts')
+        facts.update({x.host: x for x in gathered})
+        return facts
+
+    def _save_late_facts(self, future):
+        try:
+            self._store.save(facts=[future.result()])
+        except Exception as e:
+            logger.warning(msg=f'Facts which were gathered late were not saved: {e}')
+
+    def _gather_host(self, node):
+        connection = self._connection_class(host=node['host'], port=node['port'], user=node['username'],
+                                            password=node['password'])
+        batch = HostFacts.batch()
+        try:
+            results, stderr, exit_code = connection.execute_batch(batch=batch)
+        finally:
+            connection.close()
+        return HostFacts.from_results(host=node['host'], batch=batch, results=results, stderr=stderr)
+
+
+def _first_int(lines):
+    if lines and lines[0].isdigit():
+        return int(lines[0])
+    return None
@@ -1,19 +1,16 @@
 #!/usr/bin/env python3
 
 import argparse
-from os import path, makedirs
-from jinja2 import FileSystemLoader, Environment, select_autoescape
+from os import path, makedirs, remove
+from template_service import templates
 from base64 import b64encode
-from db_interface.sql_database_interface import MySQLDatabase
-
-env = Environment(
-    loader=FileSystemLoader('templates'),
-    autoescape=select_autoescape()
-)
+from db_interface.sql_database_interface import MySQLDatabase, SQLiteDatabase
+from db_interface.migrations import create_tables
 
 
 def parse_args():
-    supported_db = ['mysql']
+    supported_db = ['mysql', 'sqlite']
+    server_arguments = ['database_user', 'database_password', 'database_host', 'database_port']
     supported_log_level = ['DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL']
     parser = argparse.ArgumentParser(description='The script creates all the required database objects and config '
                                                  'file for ScyllaDB installer application')
@@ -22,24 +19,33 @@ def parse_args():
                         metavar='', required=True)
     parser.add_argument('-sp', '--port', help='Port of socket to connect to installer', type=int, metavar='',
                         required=True)
-    parser.add_argument('-du', '--database_user', help='Username to connect to database', type=str, metavar='',
-                        required=True)
-    parser.add_argument('-ds', '--database_password', help='Password to connect to database', type=str, metavar='',
-                        required=True)
-    parser.add_argument('-db', '--database', help='Database or schema name', type=str, metavar='',
-                        required=True)
-    parser.add_argument('-dh', '--database_host', help='IP address or hostname of database server', type=str,
-                        metavar='',
-                        required=True)
-    parser.add_argument('-dp', '--database_port', help='Port to connect to database', type=int, metavar='',
-                        required=True)
+    parser.add_argument('-du', '--database_user', help='Username to connect to database (mysql only)', type=str,
+                        metavar='')
+    parser.add_argument('-ds', '--database_password', help='Password to connect to database (mysql only)', type=str,
+                        metavar='')
+    parser.add_argument('-db', '--database', help='Database or schema name, path to database file for sqlite',
+                        type=str, metavar='', required=True)
+    parser.add_argument('-dh', '--database_host', help='IP address or hostname of database server (mysql only)',
+                        type=str, metavar='')
+    parser.add_argument('-dp', '--database_port', help='Port to connect to database (mysql only)', type=int,
+                        metavar='')
     parser.add_argument('-dt', '--database_type', help=f"Type of database. Supported types: {', '.join(supported_db)}",
                         choices=supported_db, metavar='', required=True)
     parser.add_argument('-ld', '--log_dir', help='Directory to contain log files', type=str, metavar='', required=True)
     parser.add_argument('-ll', '--log_level',
                         help=f"Level of log files verbosity. Supported values: {', '.join(supported_log_level)}",
                         choices=supported_log_level, metavar='', required=True)
-    return parser.parse_args()
+    args = parser.parse_args()
+    if args.database_type == 'mysql':
+        missing = [f'--{x}' for x in server_arguments if getattr(args, x) is None]
+        if missing:
+            parser.exit(status=2, message=f"{parser.prog}: error: the following arguments are required for mysql "
+                                          f"database: {', '.join(missing)}\n")
+    else:
+        # an embedded database has no server to connect to
+        for argument in server_arguments:
+            setattr(args, argument, getattr(args, argument) or '')
+    return args
 
 
 def init_config(args):
@@ -52,7 +58,7 @@ def init_config(args):
     with open(args['config_path'], mode='w') as file:
         args.pop('config_path')
         args['database_password'] = b64encode(args['database_password'].encode('utf-8')).decode('utf-8')
-        template = env.get_template('./config/generic.conf')
+        template = templates.get_template('config/generic.conf')
         config_content = template.render(args)
         file.write(config_content)
         print(f'Config file "{config_filename}" has been created successfully.')
@@ -63,15 +69,25 @@ def init_config(args):
 
 
 def init_database(args):
-    database = MySQLDatabase(user=args['database_user'], password=args['database_password'],
-                             database='', host=args['database_host'], port=args['database_port'],
-                             db_type=args['database_type'])
     if args['database_type'] == 'mysql':
+        database = MySQLDatabase(user=args['database_user'], password=args['database_password'],
+                                 database='', host=args['database_host'], port=args['database_port'],
+                                 db_type=args['database_type'])
         database.execute(query=f"drop database if exists {args['database']}")
         database.execute(query=f"create database {args['database']}")
-        for script in ['create_nodes.sql', 'create_installations.sql', 'create_statuses.sql']:
-            template = env.get_template(f"./{args['database_type']}/{script}")
-            database.execute(query=template.render(database=args['database']))
+        create_tables(database=database, template_environment=templates.environment, db_type=args['database_type'],
+                      schema=args['database'])
+    elif args['database_type'] == 'sqlite':
+        database_dir = path.dirname(args['database'])
+        if database_dir and not path.exists(database_dir):
+            makedirs(database_dir)
+        for suffix in ('', '-wal', '-shm'):
+            if path.exists(args['database'] + suffix):
+                remove(args['database'] + suffix)
+        database = SQLiteDatabase(database=args['database'])
+        create_tables(database=database, template_environment=templates.environment, db_type=args['database_type'],
+                      schema=database.schema)
+        database.close()
     print(f"The content of the database/schema \"{args['database']}\" has been created successfully.")
 
 
@@ -1,22 +1,57 @@
 #!/usr/bin/env python3
 
-from controller import ControllerDataBase, InstallationState
-from concurrent.futures.thread import ThreadPoolExecutor
+from controller import ControllerDataBase, InstallationState, Operation, FINISHED_STATES
+from db_interface.query_builder import SelectQuery, Join, Operator
 from enum import Enum, unique
-from time import sleep
+from time import monotonic, perf_counter
 from datetime import datetime
 from ssh_interface.ssh import SSHConnection
+from ssh_interface.async_ssh import AsyncSSHConnection
+from ssh_interface.command_batch import CommandBatch
+from readiness import NodeReadiness, AsyncNodeReadiness
+from bootstrap import ClusterBootstrapScheduler, AsyncClusterBootstrapScheduler
+from worker_pool import WorkerPool, AsyncWorkerPool, Job, JobCancelled
+from artifact_cache import ArtifactCache
+from checkpoints import InstallationStep, CheckpointStore
+from host_facts import HostFacts, HostFactsStore, HostFactsGatherer, HostFactsError, FACT_COMMANDS, \
+    parse_os_release
+from rolling import RollingOperation, DEFAULT_REPLICATION_FACTOR
+from status_writer import StatusWriter
+from dispatch_channel import DispatchListener, DispatchNotifier
+from worker_lease import WorkerLease
+from metrics import registry, command_name, worker_snapshot_path, SnapshotWriter
+from hashlib import sha256
 import logging
 import logging.config
+import threading
 import argparse
+import signal
+import sys
+import asyncio
+import inspect
 from config import ConfigObject
-from jinja2 import FileSystemLoader, Environment, select_autoescape
-from os import path
+from template_service import templates
+from os import path, getpid
 
-env = Environment(
-    loader=FileSystemLoader('templates'),
-    autoescape=select_autoescape()
-)
+
+logger = logging.getLogger('installer')
+
+SCYLLA_YAML_PATH = '/etc/scylla/scylla.yaml'
+# output of the commands is logged as it arrives, only its tail is kept for the error messages
+OUTPUT_TAIL_LINES = 200
+PROGRESS_INTERVAL = 5
+PROGRESS_LENGTH = 255
+# yum doesn't upgrade an installed package with "install"
+UPGRADE_COMMANDS = {'yum install -y scylla': "yum update -y 'scylla*'"}
+
+INSTALLATIONS = registry.counter('installer_installations_total', 'Finished installations', ('result',))
+INSTALLATION_SECONDS = registry.histogram('installer_installation_seconds', 'Duration of installations',
+                                          ('result',))
+STEP_SECONDS = registry.histogram('installer_step_seconds', 'Duration of installation steps', ('host', 'stage'))
+STEPS_SKIPPED = registry.counter('installer_steps_skipped_total', 'Installation steps skipped on a resumed '
+                                                                  'installation', ('stage',))
+COMMAND_SECONDS = registry.histogram('installer_command_seconds', 'Duration of installation commands',
+                                     ('host', 'stage', 'command'))
 
 
 class CommandExecutionError(Exception):
@@ -35,6 +70,10 @@ class Status(Enum):
     SCYLLA_CONFIGURED = 'Scylla configured'
     SCYLLA_STARTED = 'Scylla started'
     SCYLLA_STRESSED = 'cassandra-stress completed'
+    SCYLLA_STOPPED = 'Scylla stopped'
+    SCYLLA_UPGRADED = 'Scylla upgraded'
+    SCYLLA_YAML_UPDATED = 'scylla.yaml updated'
+    SCYLLA_RESTARTED = 'Scylla restarted'
 
 
 @unique
@@ -51,31 +90,16 @@ class SupportedDistributions(Enum):
         return f"{self.value['ID'].capitalize()} {self.value['VERSION_ID']}"
 
 
-class ParallelObject:
-    def __init__(self, timeout=1800):
-        self._timeout = timeout
-
-    @property
-    def timeout(self):
-        return self._timeout
-
-    def run(self, functions):
-        futures = []
-        with ThreadPoolExecutor(max_workers=len(functions)) as executor:
-            for fn in functions:
-                future = executor.submit(fn)
-                futures.append(future)
-            for future in futures:
-                try:
-                    future.result(timeout=self.timeout)
-                except Exception:
-                    raise
-
-
 class ScyllaInstaller:
+    connection_class = SSHConnection
+    readiness_class = NodeReadiness
+
     def __init__(self, installer_db, log_config, host, port, username, password, db_version, cluster_name, seed_node,
-                 os_version, installation_id):
+                 os_version, installation_id, bootstrap_scheduler=None, cancel_event=None, artifact_cache=None,
+                 host_facts=None, facts_store=None, status_writer=None):
         self._installer_db = installer_db
+        # without a running writer of the installer process the events are written at once
+        self._status_writer = status_writer or StatusWriter(database=installer_db)
         self._host = host
         self._port = port
         self._username = username
@@ -84,8 +108,22 @@ class ScyllaInstaller:
         self._seed_node = seed_node
         self._os_version = os_version
         self._installation_id = installation_id
-        self._ssh_connection = SSHConnection(host=host, port=port, user=username, password=password)
+        self._cancel_event = cancel_event or threading.Event()
+        self._ssh_connection = self.connection_class(host=host, port=port, user=username, password=password,
+                                                     cancel_event=self._cancel_event)
         self._installation_logger = self._log_setup(log_config=log_config, host=host)
+        self._bootstrap_scheduler = bootstrap_scheduler or ClusterBootstrapScheduler()
+        self._artifact_cache = artifact_cache
+        self._progress_reported = None
+        self._stage = None
+        self._checkpoints = CheckpointStore(database=installer_db)
+        self._host_facts = host_facts
+        self._refresh_facts = False
+        self._facts_store = facts_store or HostFactsStore(database=installer_db)
+        self._readiness = self.readiness_class(execute_command=self._execute_probe_command, host=host,
+                                               timeout=self._bootstrap_scheduler.readiness_timeout)
+        if self.is_seed:
+            self._bootstrap_scheduler.register_seed(cluster_name=cluster_name)
 
     @staticmethod
     def _log_setup(log_config, host):
@@ -104,173 +142,352 @@ class ScyllaInstaller:
     def host(self):
         return self._host
 
+    @property
+    def is_seed(self):
+        return self._host == self._seed_node
+
+    @property
+    def installation_id(self):
+        return self._installation_id
+
+    @property
+    def cancel_event(self):
+        return self._cancel_event
+
     def get_os_version(self):
-        shell_command = 'cat /etc/os-release'
-        os_release_dict = {}
-        stdout, stderr, exit_code = self._execute_shell_command(command_to_execute=shell_command)
-        for line in stdout:
-            os_release_parameter = line.strip().split('=')
-            os_release_dict[os_release_parameter[0]] = os_release_parameter[1].replace('"', '')
+        return self._match_distribution(os_release=self._current_facts().os_release)
+
+    def _current_facts(self):
+        # the facts are usually gathered by the dispatcher for all queued hosts, the host reads them itself otherwise
+        if self._host_facts is None and not self._refresh_facts:
+            self._host_facts = self._facts_store.get(host=self._host)
+        if self._host_facts is None:
+            batch = HostFacts.batch()
+            results = self._execute_shell_batch(batch=batch)
+            self._host_facts = HostFacts.from_results(host=self._host, batch=batch, results=results)
+            self._facts_store.save(facts=[self._host_facts])
+            self._refresh_facts = False
+        return self._host_facts
+
+    def _os_identified(self):
+        stdout, stderr, exit_code = self._execute_probe_command(command=dict(FACT_COMMANDS)['os_release'])
+        return self._is_identified_os(os_release=parse_os_release(lines=stdout) if exit_code == 0 else {})
+
+    def _is_identified_os(self, os_release):
+        # the node may have been re-imaged since the checkpoint, then its stored facts are stale and read again
+        try:
+            identified = self._os_version is not None and self._match_distribution(os_release=os_release) == \
+                self._os_version
+        except OSIdentificationError:
+            identified = False
+        if not identified:
+            self._host_facts = None
+            self._refresh_facts = True
+        return identified
+
+    @staticmethod
+    def _match_distribution(os_release):
         for os_type in SupportedDistributions:
-            if os_type.value['ID'] == os_release_dict['ID'] \
-                    and os_type.value['VERSION_ID'] == os_release_dict['VERSION_ID']:
+            if os_type.value['ID'] == os_release.get('ID') \
+                    and os_type.value['VERSION_ID'] == os_release.get('VERSION_ID'):
                 linux_distribution = os_type.get_name()
                 return linux_distribution
-        raise OSIdentificationError(f"OS type of {os_release_dict['ID']} {os_release_dict['VERSION_ID']} "
+        raise OSIdentificationError(f"OS type of {os_release.get('ID')} {os_release.get('VERSION_ID')} "
                                     "has not been recognized")
 
+    def _nic_name(self, facts):
+        if not facts.nic_names:
+            raise HostFactsError(f'No network interface has been found on {self._host}')
+        return facts.nic_names[0]
+
     def install(self):
+        try:
+            with self._bootstrap_scheduler.installation(cluster_name=self._cluster_name, is_seed=self.is_seed):
+                self._install()
+        finally:
+            # the pooled SSH transport is kept for the whole run and released only when it is over
+            self._ssh_connection.close()
+
+    def _install(self):
+        started = perf_counter()
         self._set_global_status(global_status_value=InstallationState.IN_PROGRESS.value)
         self._installation_logger.info(msg=f'Installation on {self._host} started.')
         try:
-            self._os_version = self.get_os_version()
-        except Exception as e:
-            self._set_global_status(global_status_value=InstallationState.FAILED.value)
-            self._installation_logger.error(msg=f'Installation on {self._host} failed! Error message: {e}')
-            raise e
-        else:
-            value_to_update = {'os_version': self._os_version}
-            self._installer_db.update_data(table='nodes', condition=f'host = \'{self._host}\'', **value_to_update)
-            self._add_new_status(status=Status.OS_IDENTIFIED.value)
-            self._installation_logger.info(msg=f'Linux distribution on {self._host} is {self._os_version}.')
-        try:
-            self._install_on_node()
-        except Exception as e:
-            self._set_global_status(global_status_value=InstallationState.FAILED.value)
-            self._installation_logger.error(msg=f'Installation on {self._host} failed! Error message: {e}')
-            raise e
-        else:
-            self._add_new_status(status=Status.SCYLLA_INSTALLED.value)
-            self._installation_logger.info(msg=f'Scylla binaries installed on {self._host}.')
-        try:
-            self._execute_post_install()
+            self._run_steps(steps=self._installation_steps())
         except Exception as e:
+            self._count_installation(result=InstallationState.FAILED.value, started=started)
             self._set_global_status(global_status_value=InstallationState.FAILED.value)
             self._installation_logger.error(msg=f'Installation on {self._host} failed! Error message: {e}')
             raise e
+        self._count_installation(result=InstallationState.SUCCEEDED.value, started=started)
         self._set_global_status(global_status_value=InstallationState.SUCCEEDED.value)
         self._installation_logger.info(msg=f'Installation on {self._host} completed.')
 
+    @staticmethod
+    def _count_installation(result, started):
+        INSTALLATIONS.inc(result=result)
+        INSTALLATION_SECONDS.observe(perf_counter() - started, result=result)
+
+    def _installation_steps(self):
+        return [InstallationStep(name='detect_os', run=self._detect_os, probe=self._os_identified,
+                                 status=Status.OS_IDENTIFIED.value),
+                InstallationStep(name='install_packages', run=self._install_on_node, probe=self._packages_installed,
+                                 status=Status.SCYLLA_INSTALLED.value),
+                InstallationStep(name='write_scylla_yaml', run=self._write_scylla_yaml,
+                                 probe=self._scylla_yaml_written, status=Status.SCYLLA_YAML_CREATED.value),
+                InstallationStep(name='configure', run=self._configure_scylla, probe=self._scylla_configured,
+                                 status=Status.SCYLLA_CONFIGURED.value),
+                InstallationStep(name='start', run=self._start_node, probe=self._node_started,
+                                 status=Status.SCYLLA_STARTED.value, on_skip=self._node_already_started),
+                InstallationStep(name='stress', run=self._run_stress, status=Status.SCYLLA_STRESSED.value)]
+
+    def _run_steps(self, steps):
+        # checkpoints of another db version or cluster layout can't be reused
+        fingerprint = CheckpointStore.fingerprint(self._db_version, self._cluster_name, self._seed_node)
+        completed = self._checkpoints.completed_steps(host=self._host, fingerprint=fingerprint,
+                                                      step_names=[x.name for x in steps])
+        resuming = bool(completed)
+        for number, step in enumerate(steps):
+            self._check_cancelled()
+            self._stage = step.name
+            if resuming and number < len(completed) and step.is_done():
+                step.skip()
+                STEPS_SKIPPED.inc(stage=step.name)
+                self._installation_logger.info(msg=f'Step "{step.name}" on {self._host} was completed by '
+                                                   f'installation {completed[number]["installation_id"]}, '
+                                                   'skipping it.')
+            else:
+                # once a step has to be redone, all the following steps are redone as well
+                resuming = False
+                with STEP_SECONDS.time(host=self._host, stage=step.name):
+                    step.run()
+                self._checkpoints.save(host=self._host, step_name=step.name, fingerprint=fingerprint,
+                                       installation_id=self._installation_id)
+            if step.status:
+                self._add_new_status(status=step.status)
+
+    def _detect_os(self):
+        self._os_version = self.get_os_version()
+        self._status_writer.update_node(host=self._host, os_version=self._os_version)
+        self._installation_logger.info(msg=f'Linux distribution on {self._host} is {self._os_version}.')
+
+    def _packages_installed(self):
+        stdout, stderr, exit_code = self._execute_probe_command(command='scylla --version')
+        return self._is_installed_version(stdout=stdout, exit_code=exit_code)
+
+    def _is_installed_version(self, stdout, exit_code):
+        return exit_code == 0 and bool(stdout) and stdout[0].strip().startswith(f'{self._db_version}.')
+
     def _install_on_node(self):
+        self._execute_shell_batch(batch=self._package_batch())
+        self._installation_logger.info(msg=f'Scylla binaries installed on {self._host}.')
+
+    def _package_batch(self):
         if 'UBUNTU' in self._os_version.upper():
-            self._install_on_ubuntu()
+            return self._install_on_ubuntu()
         elif 'CENTOS' in self._os_version.upper():
-            self._install_on_centos()
+            return self._install_on_centos()
         elif 'DEBIAN' in self._os_version.upper():
-            self._install_on_debian()
+            return self._install_on_debian()
+        return CommandBatch(name=f'Scylla installation on {self._os_version}')
 
     def _install_on_ubuntu(self):
+        batch = CommandBatch(name='Scylla installation on Ubuntu')
         if '16.04' in self._os_version:
-            shell_command = 'apt-get install -y apt-transport-https'
-            self._execute_shell_command(command_to_execute=shell_command)
-        shell_command = 'apt-key adv --keyserver hkp://keyserver.ubuntu.com:80 --recv-keys 5e08fbd8b5d6ec9c'
-        self._execute_shell_command(command_to_execute=shell_command)
-        shell_command = ('curl -L --output /etc/apt/sources.list.d/scylla.list http://'
-                         f'downloads.scylladb.com/deb/ubuntu/scylla-{self._db_version}-$(lsb_release -s -c).list')
-        self._execute_shell_command(command_to_execute=shell_command)
-        shell_command = 'apt-get update'
-        self._execute_shell_command(command_to_execute=shell_command)
-        shell_command = 'apt-get install -y scylla'
-        self._execute_shell_command(command_to_execute=shell_command)
+            batch.add('apt-get install -y apt-transport-https')
+        batch.add('apt-key adv --keyserver hkp://keyserver.ubuntu.com:80 --recv-keys 5e08fbd8b5d6ec9c')
+        batch.add('curl -L --output /etc/apt/sources.list.d/scylla.list ' +
+                  self._repository_url('http://downloads.scylladb.com/deb/ubuntu/'
+                                       f'scylla-{self._db_version}-$(lsb_release -s -c).list'))
+        batch.add('apt-get update')
+        batch.add('apt-get install -y scylla')
         if '18.04' in self._os_version or '20.04' in self._os_version:
-            shell_command = 'apt-get install -y openjdk-8-jre-headless'
-            self._execute_shell_command(command_to_execute=shell_command)
-            shell_command = 'update-java-alternatives --jre-headless -s java-1.8.0-openjdk-amd64'
-            self._execute_shell_command(command_to_execute=shell_command)
+            batch.add('apt-get install -y openjdk-8-jre-headless')
+            batch.add('update-java-alternatives --jre-headless -s java-1.8.0-openjdk-amd64')
+        return batch
 
     def _install_on_centos(self):
-        shell_command = 'yum remove -y abrt'
-        self._execute_shell_command(command_to_execute=shell_command)
-        shell_command = 'yum install -y epel-release'
-        self._execute_shell_command(command_to_execute=shell_command)
-        shell_command = ('curl -o /etc/yum.repos.d/scylla.repo -L http://repositories.scylladb.com/scylla/repo/'
-                         f'a3df46bd-e48a-4a51-bef7-ccbdc819a9c5/centos/scylladb-{self._db_version}.repo')
-        self._execute_shell_command(command_to_execute=shell_command)
-        shell_command = 'yum install -y scylla'
-        self._execute_shell_command(command_to_execute=shell_command)
+        batch = CommandBatch(name='Scylla installation on CentOS')
+        batch.add('yum remove -y abrt')
+        batch.add('yum install -y epel-release')
+        batch.add('curl -o /etc/yum.repos.d/scylla.repo -L ' +
+                  self._repository_url('http://repositories.scylladb.com/scylla/repo/'
+                                       f'a3df46bd-e48a-4a51-bef7-ccbdc819a9c5/centos/scylladb-{self._db_version}.repo'))
+        batch.add('yum install -y scylla')
+        return batch
 
     def _install_on_debian(self):
-        shell_command = 'apt-get update'
-        self._execute_shell_command(command_to_execute=shell_command)
-        shell_command = 'apt-get install -y curl gnupg'
-        self._execute_shell_command(command_to_execute=shell_command)
+        batch = CommandBatch(name='Scylla installation on Debian')
+        batch.add('apt-get update')
+        batch.add('apt-get install -y curl gnupg')
         if '9' in self._os_version:
-            shell_command = 'apt-get install -y apt-transport-https dirmngr'
-            self._execute_shell_command(command_to_execute=shell_command)
-            shell_command = ('curl -L --output /etc/apt/sources.list.d/scylla.list http://repositories.scylladb.com/'
-                             f'scylla/repo/deb/debian/scylladb-{self._db_version}-$(lsb_release -s -c).list')
-            self._execute_shell_command(command_to_execute=shell_command)
+            batch.add('apt-get install -y apt-transport-https dirmngr')
+            batch.add('curl -L --output /etc/apt/sources.list.d/scylla.list ' +
+                      self._repository_url('http://repositories.scylladb.com/scylla/repo/deb/debian/'
+                                           f'scylladb-{self._db_version}-$(lsb_release -s -c).list'))
         else:
-            shell_command = ('curl -L --output /etc/apt/sources.list.d/scylla.list http://downloads.scylladb.com/deb/'
-                             f'debian/scylla-{self._db_version}-$(lsb_release -c -s).list')
-            self._execute_shell_command(command_to_execute=shell_command)
-        shell_command = 'apt-key adv --keyserver hkp://keyserver.ubuntu.com:80 --recv-keys 5e08fbd8b5d6ec9c'
-        self._execute_shell_command(command_to_execute=shell_command)
-        shell_command = 'apt-get update'
-        self._execute_shell_command(command_to_execute=shell_command)
-        shell_command = 'apt-get install -y scylla'
-        self._execute_shell_command(command_to_execute=shell_command)
+            batch.add('curl -L --output /etc/apt/sources.list.d/scylla.list ' +
+                      self._repository_url('http://downloads.scylladb.com/deb/debian/'
+                                           f'scylla-{self._db_version}-$(lsb_release -c -s).list'))
+        batch.add('apt-key adv --keyserver hkp://keyserver.ubuntu.com:80 --recv-keys 5e08fbd8b5d6ec9c')
+        batch.add('apt-get update')
+        batch.add('apt-get install -y scylla')
+        return batch
 
-    def _execute_post_install(self):
-        # scylla.yaml generator
+    def _repository_url(self, url):
+        # with the package cache the repository files point the node to the cache instead of the internet
+        if self._artifact_cache is None:
+            return url
+        return self._artifact_cache.url_for(url)
+
+    def _render_scylla_yaml(self):
         scylla_params = {'cluster_name': self._cluster_name,
                          'seed_node': f'"{self._seed_node}"',
                          'listen_address': self._host,
                          'rpc_address': self._host}
-        template = env.get_template('./scylla_yaml/scylla.yaml')
-        scylla_yaml = template.render(scylla_params).replace('"', '\\"')
-        shell_command = 'chmod o+w /etc/scylla/scylla.yaml'
-        self._execute_shell_command(command_to_execute=shell_command)
-        self._installation_logger.debug(msg='Granted write permission on "scylla.yaml" to other users '
-                                            f'on {self._host}.')
-        shell_command = f'echo "{scylla_yaml}" > /etc/scylla/scylla.yaml'
-        self._execute_shell_command(command_to_execute=shell_command)
-        self._add_new_status(status=Status.SCYLLA_YAML_CREATED.value)
-        self._installation_logger.info(msg=f'File "scylla.yaml" successfully created on {self._host}.')
-        shell_command = 'chmod o-w /etc/scylla/scylla.yaml'
-        self._execute_shell_command(command_to_execute=shell_command)
-        self._installation_logger.debug(msg='Revoked write permission on "scylla.yaml" from other users '
-                                            f'on {self._host}.')
-        # getting network interface name
-        shell_command = 'ls /sys/class/net/ | grep -E \'eno|ens|enp|enx|wlo|wls|wnp|wnx\''
-        stdout, stderr, exit_code = self._execute_shell_command(command_to_execute=shell_command)
-        nic_name = stdout[0].strip()
+        return templates.render('scylla_yaml/scylla.yaml', **scylla_params).encode('utf-8')
+
+    def _write_scylla_yaml(self):
+        self._check_cancelled()
+        if self._ssh_connection.upload(content=self._render_scylla_yaml(), remote_path=SCYLLA_YAML_PATH):
+            self._installation_logger.info(msg=f'File "scylla.yaml" successfully created on {self._host}.')
+            return True
+        self._installation_logger.info(msg=f'File "scylla.yaml" on {self._host} is already up to date.')
+        return False
+
+    def _scylla_yaml_written(self):
+        self._check_cancelled()
+        return self._ssh_connection.checksum(remote_path=SCYLLA_YAML_PATH) == \
+            sha256(self._render_scylla_yaml()).hexdigest()
+
+    def _configure_scylla(self):
+        nic_name = self._nic_name(facts=self._current_facts())
         self._installation_logger.info(msg=f'Detected network interface: {nic_name}')
         # run of "scylla_setup"
+        self._execute_shell_command(command_to_execute=self._scylla_setup_command(nic_name=nic_name))
+        self._installation_logger.info(msg=f'Command "scylla_setup" completed successfully on {self._host}.')
+
+    def _scylla_setup_command(self, nic_name):
         if self._db_version == '4.4':
-            shell_command = f'scylla_setup --no-raid-setup --nic {nic_name} --io-setup 1 --no-rsyslog-setup'
+            return f'scylla_setup --no-raid-setup --nic {nic_name} --io-setup 1 --no-rsyslog-setup'
         elif self._db_version == '4.3':
-            shell_command = f'scylla_setup --no-raid-setup --nic {nic_name} --io-setup 1'
-        self._execute_shell_command(command_to_execute=shell_command)
-        self._add_new_status(status=Status.SCYLLA_CONFIGURED.value)
-        self._installation_logger.info(msg=f'Command "scylla_setup" completed successfully on {self._host}.')
-        # starting up Scylla service
-        if self._host != self._seed_node:
-            sleep(120)
-        shell_command = 'systemctl start scylla-server.service'
-        self._execute_shell_command(command_to_execute=shell_command)
-        self._add_new_status(status=Status.SCYLLA_STARTED.value)
-        self._installation_logger.info(msg=f'Scylla service started successfully on {self._host}.')
+            return f'scylla_setup --no-raid-setup --nic {nic_name} --io-setup 1'
+
+    def _scylla_configured(self):
+        # the I/O setup is the last and the longest part of "scylla_setup"
+        stdout, stderr, exit_code = self._execute_probe_command(command='test -s /etc/scylla.d/io.conf')
+        return exit_code == 0
+
+    def _start_node(self):
+        if self.is_seed:
+            self._start_scylla_service()
+            self._bootstrap_scheduler.seed_ready(cluster_name=self._cluster_name)
+        else:
+            with self._bootstrap_scheduler.join_slot(cluster_name=self._cluster_name,
+                                                     wait_for_seed=self._wait_for_seed_node):
+                self._start_scylla_service()
+                self._readiness.wait_for_gossip_peer(address=self._seed_node)
+                self._installation_logger.info(msg=f'Node {self._host} joined the gossip ring of seed node '
+                                                   f'{self._seed_node}.')
+
+    def _node_started(self):
+        stdout, stderr, exit_code = self._execute_probe_command(command='systemctl is-active --quiet '
+                                                                        'scylla-server.service')
+        return exit_code == 0 and self._readiness.up_normal()
+
+    def _node_already_started(self):
+        if self.is_seed:
+            self._bootstrap_scheduler.seed_ready(cluster_name=self._cluster_name)
+
+    def _run_stress(self):
         # nodetool status check
-        sleep(120)
-        shell_command = 'nodetool status'
-        stdout, stderr, exit_code = self._execute_shell_command(command_to_execute=shell_command)
-        nodetool_status = '\n'.join(stdout)
-        self._installation_logger.debug(msg=f'Result of "nodetool status":\n{nodetool_status}')
+        stdout, stderr, exit_code = self._execute_shell_command(command_to_execute='nodetool status')
+        self._log_nodetool_status(stdout=stdout)
+        self._readiness.wait_for_cql()
         # run of "cassandra-stress"
-        shell_command = f"cassandra-stress write -mode cql3 native -node {self._host} -rate 'threads=2 " \
-                        f"throttle=500/s' -pop seq=1..10000 &> ~/cassandra-stress.log || true"
-        self._execute_shell_command(command_to_execute=shell_command)
-        self._add_new_status(status=Status.SCYLLA_STRESSED.value)
+        self._execute_shell_command(command_to_execute=self._stress_command())
         self._installation_logger.info(msg='Command "cassandra-stress" completed. '
                                            'Check result in ~/cassandra-stress.log.')
 
+    def _log_nodetool_status(self, stdout):
+        nodetool_status = '\n'.join(stdout)
+        self._installation_logger.debug(msg=f'Result of "nodetool status":\n{nodetool_status}')
+
+    def _stress_command(self):
+        return f"cassandra-stress write -mode cql3 native -node {self._host} -rate 'threads=2 " \
+               f"throttle=500/s' -pop seq=1..10000 &> ~/cassandra-stress.log || true"
+
+    def _start_scylla_service(self):
+        shell_command = 'systemctl start scylla-server.service'
+        self._execute_shell_command(command_to_execute=shell_command)
+        self._installation_logger.info(msg=f'Scylla service started successfully on {self._host}.')
+        self._readiness.wait_for_up_normal()
+        self._installation_logger.info(msg=f'Node {self._host} reports UN state.')
+
+    def _wait_for_seed_node(self):
+        self._installation_logger.info(msg=f'Waiting for CQL port of seed node {self._seed_node} '
+                                           f'on {self._host}.')
+        self._readiness.wait_for_cql(address=self._seed_node)
+
     def _add_new_status(self, status):
-        self._installer_db.insert_data(table='statuses', columns=('status_name', 'installation_id'),
-                                       values=f'(\'{status}\', \'{self._installation_id}\')')
+        self._status_writer.add_status(installation_id=self._installation_id, status_name=status)
+
+    def _check_cancelled(self):
+        if self._cancel_event.is_set():
+            self._installation_logger.error(msg=f'Installation on {self._host} was cancelled.')
+            raise JobCancelled(f'Installation on {self._host} was cancelled')
+
+    def _execute_probe_command(self, command):
+        self._check_cancelled()
+        return self._ssh_connection.execute_command(command=command)
 
     def _execute_shell_command(self, command_to_execute):
-        stdout, stderr, exit_code = self._ssh_connection.execute_command(command=command_to_execute)
+        self._check_cancelled()
+        with self._command_timer(command_to_execute=command_to_execute):
+            stdout, stderr, exit_code = self._ssh_connection.execute_command(command=command_to_execute,
+                                                                             on_line=self._log_command_output,
+                                                                             tail_lines=OUTPUT_TAIL_LINES)
+        self._check_command_result(command_to_execute=command_to_execute, stdout=stdout, stderr=stderr,
+                                   exit_code=exit_code)
+        return stdout, stderr, exit_code
+
+    def _execute_shell_batch(self, batch):
+        self._check_cancelled()
+        results, stderr, exit_code = self._ssh_connection.execute_batch(batch=batch, on_line=self._log_command_output,
+                                                                        tail_lines=OUTPUT_TAIL_LINES)
+        return self._check_batch_results(batch=batch, results=results, stderr=stderr)
+
+    def _log_command_output(self, stream_name, line):
+        self._installation_logger.info(msg=f'{self._host} {stream_name}: {line}')
+        now = monotonic()
+        if line.strip() and (self._progress_reported is None or now - self._progress_reported >= PROGRESS_INTERVAL):
+            self._progress_reported = now
+            self._report_progress(progress=line.strip()[:PROGRESS_LENGTH])
+
+    def _report_progress(self, progress):
+        try:
+            self._status_writer.update_installation(installation_id=self._installation_id, progress=progress)
+        except Exception as e:
+            self._installation_logger.warning(msg=f'Progress of the installation on {self._host} was not saved: {e}')
+
+    def _command_timer(self, command_to_execute):
+        return COMMAND_SECONDS.time(host=self._host, stage=self._stage or '', command=command_name(command_to_execute))
+
+    def _check_batch_results(self, batch, results, stderr):
+        for result in results:
+            COMMAND_SECONDS.observe(result.duration, host=self._host, stage=self._stage or '',
+                                    command=command_name(result.command))
+            self._check_command_result(command_to_execute=result.command, stdout=result.stdout,
+                                       stderr=result.stderr, exit_code=result.exit_code, duration=result.duration)
+        if len(results) < len(batch):
+            error_msg = '\n'.join(stderr)
+            self._installation_logger.error(msg=(f'Execution of command batch "{batch.name}" was interrupted '
+                                                 f'after {len(results)} of {len(batch)} commands! '
+                                                 f'Error message:\n{error_msg}'))
+            raise CommandExecutionError(f'Execution of command batch "{batch.name}" failed!')
+        return results
+
+    def _check_command_result(self, command_to_execute, stdout, stderr, exit_code, duration=None):
         if exit_code != 0:
             if stderr:
                 error_msg = '\n'.join(stderr)
@@ -279,8 +496,11 @@ class ScyllaInstaller:
             self._installation_logger.error(msg=(f'Execution of command "{command_to_execute}" failed! '
                                                  f'Error message:\n{error_msg}'))
             raise CommandExecutionError(f'Execution of command "{command_to_execute}" failed!')
-        self._installation_logger.debug(msg=f'Execution of command "{command_to_execute}" succeeded!')
-        return stdout, stderr, exit_code
+        if duration is None:
+            self._installation_logger.debug(msg=f'Execution of command "{command_to_execute}" succeeded!')
+        else:
+            self._installation_logger.debug(msg=f'Execution of command "{command_to_execute}" succeeded '
+                                                f'in {duration:.3f} s!')
 
     def _set_global_status(self, global_status_value):
         if global_status_value == InstallationState.FAILED.value or \
@@ -289,8 +509,421 @@ class ScyllaInstaller:
                                'finish_timestamp': 'get_system_timestamp'}
         else:
             value_to_update = {'global_status': global_status_value}
-        self._installer_db.update_data(table='installations', condition=f'id = {self._installation_id}',
-                                       **value_to_update)
+        self._status_writer.update_installation(installation_id=self._installation_id, **value_to_update)
+        if global_status_value in FINISHED_STATES:
+            self._update_statistics_facets(global_status_value=global_status_value)
+
+    def _update_statistics_facets(self, global_status_value):
+        facets = {'host': self._host,
+                  'cluster': self._cluster_name,
+                  'user': self._username,
+                  'db_version': self._db_version,
+                  'os_version': str(self._os_version),
+                  'seed_node': self._seed_node,
+                  'status': global_status_value}
+        self._status_writer.add_facets(**facets)
+
+
+class AsyncScyllaInstaller(ScyllaInstaller):
+    connection_class = AsyncSSHConnection
+    readiness_class = AsyncNodeReadiness
+    _progress_task = None
+
+    async def install(self):
+        try:
+            with self._bootstrap_scheduler.installation(cluster_name=self._cluster_name, is_seed=self.is_seed):
+                await self._install()
+        finally:
+            if self._progress_task is not None:
+                await self._progress_task
+            await self._ssh_connection.close()
+
+    async def _install(self):
+        started = perf_counter()
+        await self._set_global_status(global_status_value=InstallationState.IN_PROGRESS.value)
+        self._installation_logger.info(msg=f'Installation on {self._host} started.')
+        try:
+            await self._run_steps(steps=self._installation_steps())
+        except Exception as e:
+            self._count_installation(result=InstallationState.FAILED.value, started=started)
+            await self._set_global_status(global_status_value=InstallationState.FAILED.value)
+            self._installation_logger.error(msg=f'Installation on {self._host} failed! Error message: {e}')
+            raise e
+        self._count_installation(result=InstallationState.SUCCEEDED.value, started=started)
+        await self._set_global_status(global_status_value=InstallationState.SUCCEEDED.value)
+        self._installation_logger.info(msg=f'Installation on {self._host} completed.')
+
+    async def _run_steps(self, steps):
+        fingerprint = CheckpointStore.fingerprint(self._db_version, self._cluster_name, self._seed_node)
+        # the database driver is synchronous, its calls are moved off the event loop
+        completed = await asyncio.to_thread(self._checkpoints.completed_steps, host=self._host,
+                                            fingerprint=fingerprint, step_names=[x.name for x in steps])
+        resuming = bool(completed)
+        for number, step in enumerate(steps):
+            self._check_cancelled()
+            self._stage = step.name
+            if resuming and number < len(completed) and await _resolve(step.is_done()):
+                step.skip()
+                STEPS_SKIPPED.inc(stage=step.name)
+                self._installation_logger.info(msg=f'Step "{step.name}" on {self._host} was completed by '
+                                                   f'installation {completed[number]["installation_id"]}, '
+                                                   'skipping it.')
+            else:
+                resuming = False
+                with STEP_SECONDS.time(host=self._host, stage=step.name):
+                    await step.run()
+                await asyncio.to_thread(self._checkpoints.save, host=self._host, step_name=step.name,
+                                        fingerprint=fingerprint, installation_id=self._installation_id)
+            if step.status:
+                await self._add_new_status(status=step.status)
+
+    async def get_os_version(self):
+        return self._match_distribution(os_release=(await self._current_facts()).os_release)
+
+    async def _current_facts(self):
+        if self._host_facts is None and not self._refresh_facts:
+            self._host_facts = await asyncio.to_thread(self._facts_store.get, host=self._host)
+        if self._host_facts is None:
+            batch = HostFacts.batch()
+            results = await self._execute_shell_batch(batch=batch)
+            self._host_facts = HostFacts.from_results(host=self._host, batch=batch, results=results)
+            await asyncio.to_thread(self._facts_store.save, facts=[self._host_facts])
+            self._refresh_facts = False
+        return self._host_facts
+
+    async def _os_identified(self):
+        stdout, stderr, exit_code = await self._execute_probe_command(command=dict(FACT_COMMANDS)['os_release'])
+        return self._is_identified_os(os_release=parse_os_release(lines=stdout) if exit_code == 0 else {})
+
+    async def _detect_os(self):
+        self._os_version = await self.get_os_version()
+        await self._write_status(self._status_writer.update_node, host=self._host, os_version=self._os_version)
+        self._installation_logger.info(msg=f'Linux distribution on {self._host} is {self._os_version}.')
+
+    async def _packages_installed(self):
+        stdout, stderr, exit_code = await self._execute_probe_command(command='scylla --version')
+        return self._is_installed_version(stdout=stdout, exit_code=exit_code)
+
+    async def _install_on_node(self):
+        await self._execute_shell_batch(batch=self._package_batch())
+        self._installation_logger.info(msg=f'Scylla binaries installed on {self._host}.')
+
+    async def _write_scylla_yaml(self):
+        self._check_cancelled()
+        if await self._ssh_connection.upload(content=self._render_scylla_yaml(), remote_path=SCYLLA_YAML_PATH):
+            self._installation_logger.info(msg=f'File "scylla.yaml" successfully created on {self._host}.')
+            return True
+        self._installation_logger.info(msg=f'File "scylla.yaml" on {self._host} is already up to date.')
+        return False
+
+    async def _scylla_yaml_written(self):
+        self._check_cancelled()
+        return await self._ssh_connection.checksum(remote_path=SCYLLA_YAML_PATH) == \
+            sha256(self._render_scylla_yaml()).hexdigest()
+
+    async def _configure_scylla(self):
+        nic_name = self._nic_name(facts=await self._current_facts())
+        self._installation_logger.info(msg=f'Detected network interface: {nic_name}')
+        await self._execute_shell_command(command_to_execute=self._scylla_setup_command(nic_name=nic_name))
+        self._installation_logger.info(msg=f'Command "scylla_setup" completed successfully on {self._host}.')
+
+    async def _scylla_configured(self):
+        stdout, stderr, exit_code = await self._execute_probe_command(command='test -s /etc/scylla.d/io.conf')
+        return exit_code == 0
+
+    async def _start_node(self):
+        if self.is_seed:
+            await self._start_scylla_service()
+            self._bootstrap_scheduler.seed_ready(cluster_name=self._cluster_name)
+        else:
+            async with self._bootstrap_scheduler.join_slot(cluster_name=self._cluster_name,
+                                                           wait_for_seed=self._wait_for_seed_node):
+                await self._start_scylla_service()
+                await self._readiness.wait_for_gossip_peer(address=self._seed_node)
+                self._installation_logger.info(msg=f'Node {self._host} joined the gossip ring of seed node '
+                                                   f'{self._seed_node}.')
+
+    async def _node_started(self):
+        stdout, stderr, exit_code = await self._execute_probe_command(command='systemctl is-active --quiet '
+                                                                              'scylla-server.service')
+        return exit_code == 0 and await self._readiness.up_normal()
+
+    async def _run_stress(self):
+        stdout, stderr, exit_code = await self._execute_shell_command(command_to_execute='nodetool status')
+        self._log_nodetool_status(stdout=stdout)
+        await self._readiness.wait_for_cql()
+        await self._execute_shell_command(command_to_execute=self._stress_command())
+        self._installation_logger.info(msg='Command "cassandra-stress" completed. '
+                                           'Check result in ~/cassandra-stress.log.')
+
+    async def _start_scylla_service(self):
+        await self._execute_shell_command(command_to_execute='systemctl start scylla-server.service')
+        self._installation_logger.info(msg=f'Scylla service started successfully on {self._host}.')
+        await self._readiness.wait_for_up_normal()
+        self._installation_logger.info(msg=f'Node {self._host} reports UN state.')
+
+    async def _wait_for_seed_node(self):
+        self._installation_logger.info(msg=f'Waiting for CQL port of seed node {self._seed_node} '
+                                           f'on {self._host}.')
+        await self._readiness.wait_for_cql(address=self._seed_node)
+
+    def _report_progress(self, progress):
+        if self._status_writer.running:
+            super()._report_progress(progress=progress)
+        # the output is read on the event loop, the progress is written in a thread and a write still running
+        # makes the newer progress wait for the next interval
+        elif self._progress_task is None or self._progress_task.done():
+            self._progress_task = asyncio.ensure_future(asyncio.to_thread(super()._report_progress,
+                                                                          progress=progress))
+
+    async def _add_new_status(self, status):
+        await self._write_status(super()._add_new_status, status=status)
+
+    async def _set_global_status(self, global_status_value):
+        await self._write_status(super()._set_global_status, global_status_value=global_status_value)
+
+    async def _write_status(self, function, **kwargs):
+        # a running status writer only queues the event, a direct write is moved off the event loop
+        if self._status_writer.running:
+            function(**kwargs)
+        else:
+            await asyncio.to_thread(function, **kwargs)
+
+    async def _execute_probe_command(self, command):
+        self._check_cancelled()
+        return await self._ssh_connection.execute_command(command=command)
+
+    async def _execute_shell_command(self, command_to_execute):
+        self._check_cancelled()
+        with self._command_timer(command_to_execute=command_to_execute):
+            stdout, stderr, exit_code = await self._ssh_connection.execute_command(command=command_to_execute,
+                                                                                   on_line=self._log_command_output,
+                                                                                   tail_lines=OUTPUT_TAIL_LINES)
+        self._check_command_result(command_to_execute=command_to_execute, stdout=stdout, stderr=stderr,
+                                   exit_code=exit_code)
+        return stdout, stderr, exit_code
+
+    async def _execute_shell_batch(self, batch):
+        self._check_cancelled()
+        results, stderr, exit_code = await self._ssh_connection.execute_batch(batch=batch,
+                                                                              on_line=self._log_command_output,
+                                                                              tail_lines=OUTPUT_TAIL_LINES)
+        return self._check_batch_results(batch=batch, results=results, stderr=stderr)
+
+
+class ScyllaNodeOperation(ScyllaInstaller):
+    def __init__(self, operation, **kwargs):
+        super().__init__(**kwargs)
+        self._operation = operation
+        self._config_changed = True
+
+    @property
+    def operation(self):
+        return self._operation
+
+    def cluster_status(self):
+        return self._readiness.cluster_status()
+
+    def abort(self, reason):
+        self._installation_logger.error(msg=f'Operation "{self._operation}" on {self._host} was not started: {reason}')
+        self._set_global_status(global_status_value=InstallationState.FAILED.value)
+
+    def _installation_steps(self):
+        restart = InstallationStep(name='restart', run=self._restart_node, status=Status.SCYLLA_RESTARTED.value)
+        if self._operation == Operation.UPGRADE.value:
+            return [InstallationStep(name='detect_os', run=self._detect_os, probe=self._os_identified,
+                                     status=Status.OS_IDENTIFIED.value),
+                    InstallationStep(name='stop', run=self._stop_node, status=Status.SCYLLA_STOPPED.value),
+                    InstallationStep(name='upgrade_packages', run=self._upgrade_on_node,
+                                     probe=self._packages_installed, status=Status.SCYLLA_UPGRADED.value),
+                    InstallationStep(name='start_upgraded', run=self._start_scylla_service,
+                                     status=Status.SCYLLA_STARTED.value)]
+        if self._operation == Operation.CONFIG.value:
+            return [InstallationStep(name='push_scylla_yaml', run=self._push_scylla_yaml,
+                                     status=Status.SCYLLA_YAML_UPDATED.value),
+                    restart]
+        return [restart]
+
+    def _stop_node(self):
+        # the node flushes its memtables and leaves the ring cleanly before it goes down
+        self._execute_shell_command(command_to_execute='nodetool drain')
+        self._execute_shell_command(command_to_execute='systemctl stop scylla-server.service')
+        self._installation_logger.info(msg=f'Scylla service stopped on {self._host}.')
+
+    def _upgrade_on_node(self):
+        batch = CommandBatch(name=f'Scylla upgrade to {self._db_version} on {self._os_version}')
+        for command in self._package_batch().commands:
+            batch.add(UPGRADE_COMMANDS.get(command, command))
+        self._execute_shell_batch(batch=batch)
+        stdout, stderr, exit_code = self._execute_probe_command(command='scylla --version')
+        if not self._is_installed_version(stdout=stdout, exit_code=exit_code):
+            raise CommandExecutionError(f'Scylla {self._db_version} is not installed on {self._host} after the '
+                                        f"upgrade, found {''.join(stdout).strip() or 'nothing'}")
+        self._installation_logger.info(msg=f'Scylla upgraded to {self._db_version} on {self._host}.')
+
+    def _push_scylla_yaml(self):
+        self._config_changed = self._write_scylla_yaml()
+
+    def _restart_node(self):
+        if not self._config_changed:
+            self._installation_logger.info(msg=f'Configuration of {self._host} is unchanged, the node is not '
+                                               'restarted.')
+            return
+        self._execute_shell_command(command_to_execute='nodetool drain')
+        self._execute_shell_command(command_to_execute='systemctl restart scylla-server.service')
+        self._readiness.wait_for_up_normal()
+        self._installation_logger.info(msg=f'Node {self._host} restarted and reports UN state.')
+
+
+async def _resolve(value):
+    if inspect.isawaitable(value):
+        return await value
+    return value
+
+
+class InstallationDispatcher:
+    def __init__(self, database, log_config, worker_pool, bootstrap_scheduler, job_timeout=None,
+                 artifact_cache=None, installer_class=ScyllaInstaller, facts_gatherer=None, status_writer=None,
+                 worker_lease=None, replication_factor=DEFAULT_REPLICATION_FACTOR):
+        self._database = database
+        self._log_config = log_config
+        self._worker_pool = worker_pool
+        self._bootstrap_scheduler = bootstrap_scheduler
+        self._job_timeout = job_timeout
+        self._artifact_cache = artifact_cache
+        self._installer_class = installer_class
+        self._replication_factor = replication_factor
+        self._facts_gatherer = facts_gatherer or HostFactsGatherer(store=HostFactsStore(database=database))
+        self._worker_lease = worker_lease or WorkerLease(database=database)
+        self._status_writer = status_writer or StatusWriter(database=database, worker_id=self._worker_lease.worker_id)
+
+    @property
+    def worker_id(self):
+        return self._worker_lease.worker_id
+
+    def poll(self):
+        # the states of the installations are read only after their queued events are written, otherwise a finished
+        # installation could be seen as new and queued again
+        self._status_writer.flush()
+        self._cancel_abandoned_jobs()
+        self._worker_lease.requeue_expired()
+        logger.debug(msg='Looking for new installations...')
+        installation_ids = self._claim_new_installations()
+        if not installation_ids:
+            return 0
+        query = SelectQuery(columns=('nodes.host', 'nodes.port', 'nodes.username', 'nodes.password',
+                                     'nodes.db_version', 'nodes.cluster_name', 'nodes.seed_node', 'nodes.os_version',
+                                     'installations.id', 'installations.operation', 'installations.batch_size'),
+                            joins=(Join.INSTALLATIONS,))
+        query.where('installations.id', Operator.IN, installation_ids)
+        nodes_list = self._database.select_data(query=query, columns=('host', 'port', 'username', 'password',
+                                                                      'db_version', 'cluster_name', 'seed_node',
+                                                                      'os_version', 'installation_id', 'operation',
+                                                                      'batch_size'))
+        logger.debug(msg=f'Number of claimed installations: {len(nodes_list)}')
+        if not nodes_list:
+            return 0
+        # seed nodes are queued ahead of the other nodes so that they never wait behind their own cluster
+        nodes_list.sort(key=lambda x: x['host'] != x['seed_node'])
+        # the facts of all queued hosts are read at once instead of by every installation when its turn comes
+        host_facts = self._facts_gatherer.gather(nodes=nodes_list)
+        rolling_operations = {}
+        for node in nodes_list:
+            operation = node.pop('operation')
+            batch_size = node.pop('batch_size')
+            if operation != Operation.INSTALL.value:
+                rolling_operations.setdefault((node['cluster_name'], operation, batch_size), []).append(node)
+                continue
+            installation = self._installer_class(installer_db=self._database, log_config=self._log_config,
+                                                 bootstrap_scheduler=self._bootstrap_scheduler,
+                                                 cancel_event=threading.Event(),
+                                                 artifact_cache=self._artifact_cache,
+                                                 host_facts=host_facts.get(node['host']),
+                                                 facts_store=self._facts_gatherer.store,
+                                                 status_writer=self._status_writer, **node)
+            self._worker_pool.submit(Job(job_id=installation.installation_id, function=installation.install,
+                                         priority=0 if installation.is_seed else 1, timeout=self._job_timeout,
+                                         cancel_event=installation.cancel_event, concurrency_key=installation.host,
+                                         description=f'installation {installation.installation_id} '
+                                                     f'on {installation.host}'))
+        for (cluster_name, operation, batch_size), nodes in rolling_operations.items():
+            self._submit_rolling_operation(cluster_name=cluster_name, operation=operation, batch_size=batch_size,
+                                           nodes=nodes, host_facts=host_facts)
+        logger.info(msg=f"Installations queued for nodes: {', '.join([x['host'] for x in nodes_list])}. "
+                        f"Queue depth: {self._worker_pool.queue_depth}, "
+                        f"active workers: {self._worker_pool.active_workers}")
+        return len(nodes_list)
+
+    def _claim_new_installations(self):
+        # a worker takes over only as much as it can run, the rest is left to the other workers
+        free_workers = self._worker_pool.max_workers - len(self._worker_pool.active_job_ids)
+        if free_workers <= 0:
+            return []
+        query = SelectQuery(columns=('installations.id', 'nodes.cluster_name'), joins=(Join.INSTALLATIONS,))
+        query.where('installations.global_status', Operator.EQ, InstallationState.NEW.value)
+        query.order_by('installations.id')
+        clusters = {}
+        for installation in self._database.select_data(query=query, columns=('installation_id', 'cluster_name')):
+            clusters.setdefault(installation['cluster_name'], []).append(installation['installation_id'])
+        # the installations of a cluster are taken over together, so that one bootstrap scheduler orders its joins
+        installation_ids = []
+        for cluster_installation_ids in clusters.values():
+            if len(installation_ids) >= free_workers:
+                break
+            installation_ids += cluster_installation_ids
+        if not installation_ids:
+            return []
+        return self._worker_lease.claim(installation_ids=installation_ids)
+
+    def _submit_rolling_operation(self, cluster_name, operation, batch_size, nodes, host_facts):
+        installation_ids = [x['installation_id'] for x in nodes]
+        readiness_timeout = ClusterBootstrapScheduler().readiness_timeout if self._bootstrap_scheduler is None \
+            else self._bootstrap_scheduler.readiness_timeout
+        cancel_event = threading.Event()
+        node_operations = [ScyllaNodeOperation(operation=operation, installer_db=self._database,
+                                               log_config=self._log_config, cancel_event=cancel_event,
+                                               bootstrap_scheduler=ClusterBootstrapScheduler(
+                                                   readiness_timeout=readiness_timeout),
+                                               artifact_cache=self._artifact_cache,
+                                               host_facts=host_facts.get(x['host']),
+                                               facts_store=self._facts_gatherer.store,
+                                               status_writer=self._status_writer, **x) for x in nodes]
+        rolling_operation = RollingOperation(cluster_name=cluster_name, operation=operation,
+                                             node_operations=node_operations, batch_size=batch_size,
+                                             health_timeout=readiness_timeout, cancel_event=cancel_event,
+                                             replication_factor=self._replication_factor)
+
+        def run_in_thread():
+            # the batches run in threads of their own, the event loop of the asyncio engine only waits for them
+            return asyncio.to_thread(rolling_operation.run)
+
+        function = run_in_thread if inspect.iscoroutinefunction(self._installer_class.install) else \
+            rolling_operation.run
+        self._worker_pool.submit(Job(job_id=min(installation_ids), function=function,
+                                     timeout=self._job_timeout * len(nodes) if self._job_timeout else None,
+                                     cancel_event=cancel_event, concurrency_key=f'cluster {cluster_name}',
+                                     description=rolling_operation.description))
+
+    def _cancel_abandoned_jobs(self):
+        active_job_ids = self._worker_pool.active_job_ids
+        if not active_job_ids:
+            return
+        query = SelectQuery(columns=('installations.id', 'installations.global_status', 'installations.worker_id'),
+                            table='installations')
+        query.where('installations.id', Operator.IN, active_job_ids)
+        for installation in self._database.select_data(query=query, columns=('installation_id', 'global_status',
+                                                                             'worker_id')):
+            if installation['global_status'] in FINISHED_STATES:
+                # the installation was closed from outside, e.g. by a forced re-installation of the node
+                logger.warning(msg=f"Installation {installation['installation_id']} was closed from outside "
+                                   "and will be cancelled")
+                self._worker_pool.cancel(job_id=installation['installation_id'], reason='closed from outside')
+            elif installation['worker_id'] != self.worker_id:
+                # the lease of this worker expired, e.g. while the database was not reachable, and the installation
+                # was queued again for another worker
+                logger.warning(msg=f"Installation {installation['installation_id']} was taken over by "
+                                   f"{installation['worker_id'] or 'another worker'} and will be cancelled")
+                self._worker_pool.cancel(job_id=installation['installation_id'], reason='lease expired')
 
 
 def setup_logging(log_root_dir, log_level):
@@ -331,11 +964,14 @@ def setup_logging(log_root_dir, log_level):
 def parse_args():
     parser = argparse.ArgumentParser(description='This module runs ScyllaDB installer.')
     parser.add_argument('config_path', help='Path to config file', type=str)
+    parser.add_argument('-w', '--worker', help='Number of this installer worker when several of them are started',
+                        type=int)
     return parser.parse_args()
 
 
 if __name__ == '__main__':
-    path_to_config = vars(parse_args())['config_path']
+    arguments = vars(parse_args())
+    path_to_config = arguments['config_path']
     print(path_to_config)
     database = ControllerDataBase(config_path=path_to_config).instance
     config = ConfigObject(config_path=path_to_config)
@@ -343,30 +979,85 @@ if __name__ == '__main__':
     logging.config.dictConfig(setup_logging(**log_configuration))
     logger = logging.getLogger('installer')
     logger.info(msg="Installer is starting up")
-    while True:
-        installation_list = []
-        functions_list = []
-        hosts_list = []
-        logger.debug(msg='Looking for new installations...')
-        query_data = {'columns': 'nodes.host, nodes.port, nodes.username, nodes.password, nodes.db_version, \
-                       nodes.cluster_name, nodes.seed_node, nodes.os_version, installations.id as installation_id',
-                      'join_installations': 'yes', 'join_statuses': 'no',
-                      'filter': f'installations.global_status = \'{InstallationState.NEW.value}\''}
-        nodes_list = database.select_data(query_params=query_data, columns=('host', 'port', 'username', 'password',
-                                                                            'db_version', 'cluster_name', 'seed_node',
-                                                                            'os_version', 'installation_id'))
-        logger.debug(msg=f'Number of found installations: {len(nodes_list)}')
-        if nodes_list:
-            for node in nodes_list:
-                installation_list.append(ScyllaInstaller(installer_db=database, log_config=log_configuration, **node))
-            logger.info(msg=f"Number of nodes to install: {len(installation_list)}")
-            parallel_object = ParallelObject()
-            for installation in installation_list:
-                functions_list.append(installation.install)
-                hosts_list.append(installation.host)
-            logger.info(msg=f"Parallel installation threads will be created for nodes: {', '.join(hosts_list)}")
+    templates_configuration = config.templates_config
+    templates.configure(auto_reload=templates_configuration['auto_reload'].lower() == 'true',
+                        bytecode_cache_dir=templates_configuration['bytecode_cache_dir'] or None).precompile()
+    installer_configuration = config.installer_config
+    # a finished job wakes the dispatcher up, so that the worker takes over more installations at once
+    dispatch_listener = DispatchListener(socket_dir=installer_configuration['dispatch_socket_dir'],
+                                         name=f'installer-{getpid()}').start()
+    if installer_configuration['engine'] == 'asyncio':
+        # one event loop drives all the installations, max_workers only limits how many run at the same time
+        scheduler = AsyncClusterBootstrapScheduler(
+            concurrent_joins=int(installer_configuration['concurrent_joins']),
+            readiness_timeout=int(installer_configuration['readiness_timeout']))
+        pool = AsyncWorkerPool(max_workers=int(installer_configuration['max_workers']),
+                               on_job_done=dispatch_listener.wake).start()
+        installation_class = AsyncScyllaInstaller
+    else:
+        scheduler = ClusterBootstrapScheduler(concurrent_joins=int(installer_configuration['concurrent_joins']),
+                                              readiness_timeout=int(installer_configuration['readiness_timeout']))
+        pool = WorkerPool(max_workers=int(installer_configuration['max_workers']),
+                          on_job_done=dispatch_listener.wake).start()
+        installation_class = ScyllaInstaller
+    cache_configuration = config.artifact_cache_config
+    package_cache = None
+    if cache_configuration['enabled'].lower() == 'true':
+        package_cache = ArtifactCache(cache_dir=cache_configuration['cache_dir'],
+                                      advertised_address=cache_configuration['advertised_address'],
+                                      listen_host=cache_configuration['listen_host'],
+                                      listen_port=int(cache_configuration['listen_port']),
+                                      metadata_ttl=int(cache_configuration['metadata_ttl'])).start()
+    registry.gauge('installer_queue_depth', 'Installations waiting for a worker', function=lambda: pool.queue_depth)
+    registry.gauge('installer_active_workers', 'Installations running now', function=lambda: pool.active_workers)
+    registry.gauge('installer_max_workers', 'Installations allowed to run at the same time',
+                   function=lambda: pool.max_workers)
+    worker_lease = WorkerLease(database=database, lease_timeout=int(installer_configuration['lease_timeout']),
+                               heartbeat_interval=float(installer_configuration['heartbeat_interval'])).start()
+    status_writer = StatusWriter(database=database,
+                                 flush_interval=float(installer_configuration['status_flush_interval']),
+                                 batch_size=int(installer_configuration['status_batch_size']),
+                                 worker_id=worker_lease.worker_id).start()
+    registry.gauge('installer_status_queue_depth', 'Status events waiting to be written',
+                   function=lambda: status_writer.pending)
+    # the controller serves the metrics of this process from the snapshot file
+    metrics_configuration = config.metrics_config
+    snapshot_file = metrics_configuration['snapshot_file'] if arguments['worker'] is None else \
+        worker_snapshot_path(snapshot_path=metrics_configuration['snapshot_file'], worker=arguments['worker'])
+    SnapshotWriter(registry=registry, snapshot_path=snapshot_file,
+                   interval=float(metrics_configuration['snapshot_interval'])).start()
+    dispatcher = InstallationDispatcher(database=database, log_config=log_configuration, worker_pool=pool,
+                                        bootstrap_scheduler=scheduler,
+                                        job_timeout=int(installer_configuration['job_timeout']),
+                                        artifact_cache=package_cache, installer_class=installation_class,
+                                        facts_gatherer=HostFactsGatherer(
+                                            store=HostFactsStore(database=database,
+                                                                 ttl=int(installer_configuration['facts_ttl'])),
+                                            max_workers=int(installer_configuration['facts_workers']),
+                                            timeout=float(installer_configuration['facts_timeout'])),
+                                        status_writer=status_writer, worker_lease=worker_lease,
+                                        replication_factor=int(installer_configuration['replication_factor']))
+    logger.info(msg=f"Installer {installer_configuration['engine']} engine started "
+                    f"with {pool.max_workers} workers as worker {worker_lease.worker_id}")
+    # a stopped service leaves the loop like an interrupt, so the queued status events are still written
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        while True:
             try:
-                parallel_object.run(functions=functions_list)
+                dispatcher.poll()
             except Exception as ex:
-                logger.error(msg=f'Error in parallel execution: {ex}')
-        sleep(3)
+                logger.error(msg=f'Error while looking for new installations: {ex}')
+            # the controller wakes the installer up on every submission, the database is only polled when no
+            # notification comes, e.g. for installations submitted by another machine
+            dispatch_listener.wait(timeout=float(installer_configuration['poll_interval']))
+    finally:
+        logger.info(msg='Installer is shutting down, writing the queued status events')
+        dispatch_listener.close()
+        # the running jobs are stopped before their installations are handed over, otherwise they would keep
+        # driving nodes which another worker takes over; the leases are renewed until the jobs are gone
+        pool.shutdown(cancel_running=True)
+        worker_lease.stop()
+        status_writer.stop()
+        # the unfinished installations are handed over to the other workers, which are woken up to take them
+        worker_lease.release()
+        DispatchNotifier(socket_dir=installer_configuration['dispatch_socket_dir']).notify()
@@ -0,0 +1,62 @@
+import csv
+import io
+import json
+
+NODE_COLUMNS = ('host', 'port', 'username', 'password', 'db_version', 'cluster_name', 'seed_node')
+REQUIRED_COLUMNS = ('host', 'username', 'db_version', 'cluster_name', 'seed_node')
+DEFAULT_PORT = '22'
+TRUE_VALUES = ('1', 'true', 'yes', 'on')
+
+
+class InvalidManifest(Exception):
+    pass
+
+
+def parse_manifest(content, filename=''):
+    text = content.decode('utf-8-sig') if isinstance(content, bytes) else content
+    if filename.lower().endswith('.json') or text.lstrip().startswith(('[', '{')):
+        nodes = _json_nodes(text=text)
+    else:
+        nodes = _csv_nodes(text=text)
+    if not nodes:
+        raise InvalidManifest('The manifest has no nodes')
+    return [node_from_fields(fields=x, number=number) for number, x in enumerate(nodes, start=1)]
+
+
+def node_from_fields(fields, number):
+    node = {}
+    for column in NODE_COLUMNS:
+        value = fields.get(column)
+        node[column] = value.strip() if isinstance(value, str) else value
+    missing = [x for x in REQUIRED_COLUMNS if node[x] in (None, '', 'null')]
+    if missing:
+        raise InvalidManifest(f"Node {number} ({node['host'] or 'no host'}) has no {', '.join(missing)}")
+    node['port'] = str(node['port'] or DEFAULT_PORT)
+    if not node['port'].isdigit():
+        raise InvalidManifest(f"Node {number} ({node['host']}) has invalid SSH port {node['port']}")
+    # an empty password is stored as null like the one of the web form, the key of the user is used then
+    if node['password'] in (None, ''):
+        node['password'] = 'null'
+    node['force_install'] = str(fields.get('force_install') or '').strip().lower() in TRUE_VALUES
+    return node
+
+
+def _json_nodes(text):
+    try:
+        data = json.loads(text)
+    except ValueError as e:
+        raise InvalidManifest(f'The manifest is not valid JSON: {e}')
+    if isinstance(data, dict):
+        # the other keys of an object are shared by all its nodes, e.g. cluster_name or seed_node
+        defaults = {k: v for k, v in data.items() if k != 'nodes'}
+        data = [dict(defaults, **x) if isinstance(x, dict) else x for x in data.get('nodes') or []]
+    if not isinstance(data, list) or not all(isinstance(x, dict) for x in data):
+        raise InvalidManifest('The JSON manifest must be a list of nodes or an object with a list of nodes')
+    return data
+
+
+def _csv_nodes(text):
+    reader = csv.DictReader(io.StringIO(text))
+    if not reader.fieldnames or 'host' not in [x.strip() for x in reader.fieldnames]:
+        raise InvalidManifest(f"The CSV manifest must have a header with the columns {', '.join(NODE_COLUMNS)}")
+    return [{(k or '').strip(): v for k, v in x.items()} for x in reader]
@@ -0,0 +1,241 @@
+import json
+import logging
+import os
+import shlex
+import tempfile
+import threading
+from contextlib import contextmanager
+from glob import glob
+from time import perf_counter, time
+
+logger = logging.getLogger('installer')
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+
+
+class MetricTypeMismatch(Exception):
+    pass
+
+
+class Metric:
+    type_name = None
+
+    def __init__(self, name, description, label_names=()):
+        self._name = name
+        self._description = description
+        self._label_names = tuple(label_names)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    @property
+    def name(self):
+        return self._name
+
+    def family(self):
+        return {'name': self._name, 'type': self.type_name, 'help': self._description, 'samples': self._samples()}
+
+    def _key(self, labels):
+        return tuple(str(labels.get(x, '')) for x in self._label_names)
+
+    def _labels(self, key):
+        return dict(zip(self._label_names, key))
+
+    def _samples(self):
+        with self._lock:
+            return [[self._name, self._labels(key), value] for key, value in self._values.items()]
+
+
+class Counter(Metric):
+    type_name = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    type_name = 'gauge'
+
+    def __init__(self, name, description, label_names=(), function=None):
+        super().__init__(name=name, description=description, label_names=label_names)
+        self._function = function
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def _samples(self):
+        if self._function is not None:
+            return [[self._name, {}, self._function()]]
+        return super()._samples()
+
+
+class Histogram(Metric):
+    type_name = 'histogram'
+
+    def __init__(self, name, description, label_names=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name=name, description=description, label_names=label_names)
+        self._buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total, observations = self._values.get(key, ([0] * len(self._buckets), 0.0, 0))
+            # the bucket counts are cumulative like in the exposition format
+            counts = [count + (value <= bound) for count, bound in zip(counts, self._buckets)]
+            self._values[key] = (counts, total + value, observations + 1)
+
+    @contextmanager
+    def time(self, **labels):
+        started = perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(perf_counter() - started, **labels)
+
+    def _samples(self):
+        samples = []
+        with self._lock:
+            values = list(self._values.items())
+        for key, (counts, total, observations) in values:
+            labels = self._labels(key)
+            for count, bound in zip(counts, self._buckets):
+                samples.append([f'{self._name}_bucket', dict(labels, le=str(bound)), count])
+            samples.append([f'{self._name}_bucket', dict(labels, le='+Inf'), observations])
+            samples.append([f'{self._name}_sum', labels, total])
+            samples.append([f'{self._name}_count', labels, observations])
+        return samples
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def counter(self, name, description, label_names=()):
+        return self._register(metric_class=Counter, name=name, description=description, label_names=label_names)
+
+    def gauge(self, name, description, label_names=(), function=None):
+        return self._register(metric_class=Gauge, name=name, description=description, label_names=label_names,
+                              function=function)
+
+    def histogram(self, name, description, label_names=(), buckets=DEFAULT_BUCKETS):
+        return self._register(metric_class=Histogram, name=name, description=description, label_names=label_names,
+                              buckets=buckets)
+
+    def families(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return [x.family() for x in metrics]
+
+    def write_snapshot(self, snapshot_path):
+        # the snapshot is written aside and moved in place, so that a reader never sees a partial file
+        directory = os.path.dirname(os.path.abspath(snapshot_path))
+        file_descriptor, temporary_path = tempfile.mkstemp(dir=directory, prefix='.metrics-')
+        try:
+            with os.fdopen(file_descriptor, 'w') as file:
+                json.dump(self.families(), file)
+            os.replace(temporary_path, snapshot_path)
+        except BaseException:
+            os.unlink(temporary_path)
+            raise
+
+    def _register(self, metric_class, name, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = metric_class(name=name, **kwargs)
+            elif not isinstance(metric, metric_class):
+                raise MetricTypeMismatch(f'Metric {name} is already registered as a {metric.type_name}')
+            return metric
+
+
+class SnapshotWriter:
+    def __init__(self, registry, snapshot_path, interval=5):
+        self._registry = registry
+        self._snapshot_path = snapshot_path
+        self._interval = interval
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._write_loop, name='metrics-snapshot', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _write_loop(self):
+        while not self._stopping.wait(self._interval):
+            try:
+                self._registry.write_snapshot(snapshot_path=self._snapshot_path)
+            except OSError as e:
+                logger.warning(msg=f'Metrics snapshot {self._snapshot_path} was not written: {e}')
+
+
+def read_snapshot(snapshot_path, max_age):
+    try:
+        if time() - os.path.getmtime(snapshot_path) > max_age:
+            return []
+        with open(snapshot_path, 'r') as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return []
+
+
+def worker_snapshot_path(snapshot_path, worker):
+    root, extension = os.path.splitext(snapshot_path)
+    return f'{root}-{worker}{extension}'
+
+
+def installer_snapshots(snapshot_path):
+    # one installer writes the configured file, several installer workers write one file each next to it
+    root, extension = os.path.splitext(snapshot_path)
+    snapshots = [('installer', snapshot_path)]
+    for worker_path in sorted(glob(f'{root}-*{extension}')):
+        snapshots.append((f"installer-{worker_path[len(root) + 1:len(worker_path) - len(extension)]}", worker_path))
+    return snapshots
+
+
+def command_name(command):
+    # only the program is used as a label, arguments may hold passwords and make every command unique
+    try:
+        words = shlex.split(command)
+    except ValueError:
+        words = command.split()
+    return os.path.basename(words[0]) if words else ''
+
+
+def render(process_families):
+    # families of several processes are merged, every sample gets the name of the process as a label
+    merged = {}
+    for process, families in process_families:
+        for family in families:
+            merged_family = merged.setdefault(family['name'], dict(family, samples=[]))
+            merged_family['samples'] += [[name, dict(labels, process=process), value]
+                                         for name, labels, value in family['samples']]
+    lines = []
+    for family in merged.values():
+        lines.append(f"# HELP {family['name']} {family['help']}")
+        lines.append(f"# TYPE {family['name']} {family['type']}")
+        for name, labels, value in family['samples']:
+            label_text = ','.join([f'{k}="{_escape(v)}"' for k, v in labels.items()])
+            lines.append(f'{name}{{{label_text}}} {_format_value(value)}')
+    return '\n'.join(lines) + '\n'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_value(value):
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+registry = MetricsRegistry()
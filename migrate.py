@@ -0,0 +1,30 @@
+#!/usr/bin/env python3
+
+import argparse
+from config import ConfigObject
+from controller import ControllerDataBase
+from db_interface.migrations import apply_migrations
+from template_service import templates
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='The script applies pending schema migrations to the existing '
+                                                 'database of ScyllaDB installer application')
+    parser.add_argument('config_path', help='Path to config file', type=str)
+    return parser.parse_args()
+
+
+def main():
+    path_to_config = vars(parse_args())['config_path']
+    database_config = ConfigObject(config_path=path_to_config).db_config
+    database = ControllerDataBase(config_path=path_to_config).instance
+    applied = apply_migrations(database=database, template_environment=templates.environment,
+                               db_type=database_config['type'], schema=database.schema)
+    if applied:
+        print(f"Following migrations have been applied successfully: {', '.join(applied)}.")
+    else:
+        print('The database is already up to date.')
+
+
+if __name__ == '__main__':
+    main()
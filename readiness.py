@@ -0,0 +1,179 @@
+import asyncio
+from time import monotonic, sleep
+from metrics import registry
+
+READINESS_PROBES = registry.counter('installer_readiness_probes_total', 'Readiness probes of the nodes', ('result',))
+READINESS_SLEEP_SECONDS = registry.counter('installer_readiness_sleep_seconds_total', 'Time spent sleeping between '
+                                                                                      'readiness probes')
+
+
+class ReadinessTimeout(Exception):
+    pass
+
+
+class ExponentialBackoff:
+    def __init__(self, initial_delay=1.0, max_delay=15.0, factor=2.0):
+        self._initial_delay = initial_delay
+        self._max_delay = max_delay
+        self._factor = factor
+
+    def delays(self):
+        delay = self._initial_delay
+        while True:
+            yield delay
+            delay = min(delay * self._factor, self._max_delay)
+
+
+def wait_until(probe, timeout, description, backoff=None, sleep_function=sleep):
+    backoff = backoff or ExponentialBackoff()
+    deadline = monotonic() + timeout
+    last_error = None
+    for delay in backoff.delays():
+        try:
+            if probe():
+                READINESS_PROBES.inc(result='ready')
+                return
+            READINESS_PROBES.inc(result='not_ready')
+        except Exception as e:
+            READINESS_PROBES.inc(result='error')
+            last_error = e
+        remaining = deadline - monotonic()
+        if remaining <= 0:
+            message = f"{description} was not reached within {timeout} seconds"
+            if last_error:
+                message += f" (last error: {last_error})"
+            raise ReadinessTimeout(message)
+        READINESS_SLEEP_SECONDS.inc(min(delay, remaining))
+        sleep_function(min(delay, remaining))
+
+
+async def async_wait_until(probe, timeout, description, backoff=None):
+    backoff = backoff or ExponentialBackoff()
+    deadline = monotonic() + timeout
+    last_error = None
+    for delay in backoff.delays():
+        try:
+            if await probe():
+                READINESS_PROBES.inc(result='ready')
+                return
+            READINESS_PROBES.inc(result='not_ready')
+        except Exception as e:
+            READINESS_PROBES.inc(result='error')
+            last_error = e
+        remaining = deadline - monotonic()
+        if remaining <= 0:
+            message = f"{description} was not reached within {timeout} seconds"
+            if last_error:
+                message += f" (last error: {last_error})"
+            raise ReadinessTimeout(message)
+        READINESS_SLEEP_SECONDS.inc(min(delay, remaining))
+        await asyncio.sleep(min(delay, remaining))
+
+
+class NodeReadiness:
+    def __init__(self, execute_command, host, timeout=900, backoff=None):
+        self._execute_command = execute_command
+        self._host = host
+        self._timeout = timeout
+        self._backoff = backoff
+
+    @property
+    def timeout(self):
+        return self._timeout
+
+    def cql_port_open(self, address=None, port=9042):
+        stdout, stderr, exit_code = self._execute_command(self._cql_probe_command(address=address, port=port))
+        return exit_code == 0
+
+    def up_normal(self, address=None):
+        stdout, stderr, exit_code = self._execute_command('nodetool status')
+        return self._is_up_normal(stdout=stdout, exit_code=exit_code, address=address or self._host)
+
+    def knows_gossip_peer(self, address):
+        stdout, stderr, exit_code = self._execute_command('nodetool gossipinfo')
+        return self._knows_gossip_peer(stdout=stdout, exit_code=exit_code, address=address)
+
+    def cluster_status(self):
+        stdout, stderr, exit_code = self._execute_command('nodetool status')
+        return self._cluster_status(stdout=stdout, exit_code=exit_code)
+
+    def _cql_probe_command(self, address, port):
+        return f"timeout 5 bash -c '</dev/tcp/{address or self._host}/{port}'"
+
+    @staticmethod
+    def _is_up_normal(stdout, exit_code, address):
+        if exit_code != 0:
+            return False
+        for line in stdout:
+            fields = line.split()
+            if len(fields) > 1 and fields[0] == 'UN' and fields[1] == address:
+                return True
+        return False
+
+    @staticmethod
+    def _cluster_status(stdout, exit_code):
+        # a node line starts with its status and state and ends with its rack, e.g. "UN  10.0.0.1 ... rack1"
+        nodes = {}
+        if exit_code != 0:
+            return nodes
+        for line in stdout:
+            fields = line.split()
+            if len(fields) > 2 and len(fields[0]) == 2 and fields[0][0] in 'UD' and fields[0][1] in 'NLJM':
+                nodes[fields[1]] = (fields[0], fields[-1])
+        return nodes
+
+    @staticmethod
+    def _knows_gossip_peer(stdout, exit_code, address):
+        if exit_code != 0:
+            return False
+        peer_found = False
+        for line in stdout:
+            line = line.strip()
+            if line.startswith('/'):
+                peer_found = line.lstrip('/') == address
+            elif peer_found and line.startswith('STATUS:') and 'NORMAL' in line:
+                return True
+        return False
+
+    def wait_for_cql(self, address=None):
+        address = address or self._host
+        wait_until(probe=lambda: self.cql_port_open(address=address), timeout=self._timeout,
+                   description=f'CQL port of {address}', backoff=self._backoff)
+
+    def wait_for_up_normal(self, address=None):
+        address = address or self._host
+        wait_until(probe=lambda: self.up_normal(address=address), timeout=self._timeout,
+                   description=f'UN state of {address}', backoff=self._backoff)
+
+    def wait_for_gossip_peer(self, address):
+        wait_until(probe=lambda: self.knows_gossip_peer(address=address), timeout=self._timeout,
+                   description=f'Gossip membership of {self._host} with {address}', backoff=self._backoff)
+
+
+class AsyncNodeReadiness(NodeReadiness):
+    async def cql_port_open(self, address=None, port=9042):
+        stdout, stderr, exit_code = await self._execute_command(self._cql_probe_command(address=address, port=port))
+        return exit_code == 0
+
+    async def up_normal(self, address=None):
+        stdout, stderr, exit_code = await self._execute_command('nodetool status')
+        return self._is_up_normal(stdout=stdout, exit_code=exit_code, address=address or self._host)
+
+    async def knows_gossip_peer(self, address):
+        stdout, stderr, exit_code = await self._execute_command('nodetool gossipinfo')
+        return self._knows_gossip_peer(stdout=stdout, exit_code=exit_code, address=address)
+
+    async def wait_for_cql(self, address=None):
+        address = address or self._host
+        await async_wait_until(probe=lambda: self.cql_port_open(address=address), timeout=self._timeout,
+                               description=f'CQL port of {address}', backoff=self._backoff)
+
+    async def wait_for_up_normal(self, address=None):
+        address = address or self._host
+        await async_wait_until(probe=lambda: self.up_normal(address=address), timeout=self._timeout,
+                               description=f'UN state of {address}', backoff=self._backoff)
+
+    async def wait_for_gossip_peer(self, address):
+        await async_wait_until(probe=lambda: self.knows_gossip_peer(address=address), timeout=self._timeout,
+                               description=f'Gossip membership of {self._host} with {address}',
+                               backoff=self._backoff)
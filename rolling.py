@@ -0,0 +1,137 @@
+import logging
+import threading
+from math import ceil
+from concurrent.futures.thread import ThreadPoolExecutor
+from metrics import registry
+from readiness import wait_until
+from worker_pool import JobCancelled
+
+logger = logging.getLogger('installer')
+
+RACK_BATCH = 'rack'
+DEFAULT_REPLICATION_FACTOR = 3
+ROLLING_BATCH_SECONDS = registry.histogram('installer_rolling_batch_seconds', 'Duration of rolling operation batches',
+                                           ('operation',))
+
+
+class RollingOperationFailed(Exception):
+    pass
+
+
+def plan_batches(hosts, racks, batch_size, replication_factor=DEFAULT_REPLICATION_FACTOR):
+    # a quorum of a token range is kept while fewer than ceil(rf / 2) of its replicas are down; the replicas of a
+    # range are placed on different racks only when there are at least as many racks as replicas, then a batch
+    # within one rack takes down one replica of every range at most
+    unknown = [x for x in hosts if x not in racks]
+    if unknown or len(set(racks.values())) < replication_factor or ceil(replication_factor / 2) <= 1:
+        # any two nodes may share a range, so the nodes are taken down one by one
+        if batch_size != '1':
+            reason = f"racks of {', '.join(unknown)} are unknown" if unknown else \
+                f'{len(set(racks.values()))} racks and replication factor {replication_factor} do not allow more'
+            logger.warning(msg=f'Rolling operation runs one node at a time instead of batch size {batch_size}, '
+                               f'{reason}')
+        return [[x] for x in hosts]
+    rack_hosts = {}
+    for host in hosts:
+        rack_hosts.setdefault(racks[host], []).append(host)
+    batches = []
+    for members in rack_hosts.values():
+        size = len(members) if batch_size == RACK_BATCH else int(batch_size)
+        batches += [members[x:x + size] for x in range(0, len(members), size)]
+    return batches
+
+
+def is_valid_batch_size(batch_size):
+    return batch_size == RACK_BATCH or str(batch_size).isdigit() and int(batch_size) > 0
+
+
+class RollingOperation:
+    def __init__(self, cluster_name, operation, node_operations, batch_size='1', health_timeout=900,
+                 cancel_event=None, sleep_function=None, replication_factor=DEFAULT_REPLICATION_FACTOR):
+        self._cluster_name = cluster_name
+        self._operation = operation
+        self._node_operations = {x.host: x for x in node_operations}
+        self._batch_size = batch_size
+        self._health_timeout = health_timeout
+        self._replication_factor = replication_factor
+        self._cancel_event = cancel_event or threading.Event()
+        self._sleep_function = sleep_function or self._sleep_unless_cancelled
+
+    @property
+    def description(self):
+        return f'{self._operation} of cluster {self._cluster_name} on {len(self._node_operations)} nodes'
+
+    @property
+    def cancel_event(self):
+        return self._cancel_event
+
+    def run(self):
+        racks = {k: v[1] for k, v in self._cluster_status(exclude=()).items()}
+        batches = plan_batches(hosts=list(self._node_operations), racks=racks, batch_size=self._batch_size,
+                               replication_factor=self._replication_factor)
+        logger.info(msg=f"Rolling {self.description} runs in {len(batches)} batches: "
+                        f"{'; '.join([', '.join(x) for x in batches])}")
+        started = set()
+        try:
+            for number, batch in enumerate(batches):
+                if self._cancel_event.is_set():
+                    raise JobCancelled(f'Rolling {self.description} was cancelled')
+                # the nodes of the batch are taken down only when all the other nodes are up
+                self._wait_for_healthy_cluster(exclude=batch)
+                logger.info(msg=f"Rolling {self.description}: batch {number + 1} of {len(batches)} started on "
+                                f"{', '.join(batch)}")
+                started.update(batch)
+                with ROLLING_BATCH_SECONDS.time(operation=self._operation):
+                    failures = self._run_batch(batch=batch)
+                if failures:
+                    raise RollingOperationFailed(f"Rolling {self.description} stopped after batch {number + 1}, "
+                                                 f"it failed on {', '.join(failures)}")
+            self._wait_for_healthy_cluster(exclude=())
+        except Exception as e:
+            for host, node_operation in self._node_operations.items():
+                if host not in started:
+                    node_operation.abort(reason=str(e))
+            raise
+        logger.info(msg=f'Rolling {self.description} completed')
+
+    def _run_batch(self, batch):
+        failures = []
+        with ThreadPoolExecutor(max_workers=len(batch)) as executor:
+            futures = [(host, executor.submit(self._node_operations[host].install)) for host in batch]
+            for host, future in futures:
+                try:
+                    future.result()
+                except Exception as e:
+                    logger.error(msg=f'Rolling {self.description} failed on {host}: {e}')
+                    failures.append(host)
+        return failures
+
+    def _wait_for_healthy_cluster(self, exclude):
+        wait_until(probe=lambda: self._is_healthy(exclude=exclude), timeout=self._health_timeout,
+                   description=f'UN state of all nodes of cluster {self._cluster_name}',
+                   sleep_function=self._sleep_function)
+
+    def _sleep_unless_cancelled(self, delay):
+        # a cancelled operation stops waiting for the cluster instead of sleeping until the health timeout
+        if self._cancel_event.wait(timeout=delay):
+            raise JobCancelled(f'Rolling {self.description} was cancelled')
+
+    def _is_healthy(self, exclude):
+        nodes = self._cluster_status(exclude=exclude)
+        return bool(nodes) and all(state == 'UN' for state, rack in nodes.values())
+
+    def _cluster_status(self, exclude):
+        # the status is asked from a node which is not going down, the others are asked only when none answers
+        hosts = [x for x in self._node_operations if x not in exclude] + [x for x in self._node_operations
+                                                                          if x in exclude]
+        for host in hosts:
+            try:
+                nodes = self._node_operations[host].cluster_status()
+            except JobCancelled:
+                raise
+            except Exception as e:
+                logger.warning(msg=f'Status of cluster {self._cluster_name} could not be read on {host}: {e}')
+                continue
+            if nodes:
+                return nodes
+        return {}
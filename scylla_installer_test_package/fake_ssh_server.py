@@ -0,0 +1,177 @@
+import os
+import paramiko
+import socket
+import subprocess
+import threading
+from time import sleep
+
+_host_key = None
+_host_key_lock = threading.Lock()
+
+
+def get_host_key():
+    global _host_key
+    with _host_key_lock:
+        if _host_key is None:
+            _host_key = paramiko.RSAKey.generate(2048)
+    return _host_key
+
+
+def default_command_handler(command):
+    return b'Command executed successfully\n', b'', 0
+
+
+def shell_command_handler(working_dir):
+    def run_in_shell(command):
+        completed = subprocess.run(['bash', '-c', command], capture_output=True, cwd=working_dir)
+        return completed.stdout, completed.stderr, completed.returncode
+    return run_in_shell
+
+
+class LocalSFTPHandle(paramiko.SFTPHandle):
+    def stat(self):
+        try:
+            return paramiko.SFTPAttributes.from_stat(os.fstat(self.readfile.fileno()))
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+
+
+class LocalSFTPInterface(paramiko.SFTPServerInterface):
+    def __init__(self, server, *args, **kwargs):
+        super().__init__(server, *args, **kwargs)
+        self._home = server.home
+
+    def canonicalize(self, path):
+        return os.path.realpath(os.path.join(self._home, path))
+
+    def open(self, path, flags, attr):
+        try:
+            file_descriptor = os.open(self.canonicalize(path), flags | getattr(os, 'O_BINARY', 0), 0o600)
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+        handle = LocalSFTPHandle(flags)
+        handle.readfile = handle.writefile = os.fdopen(file_descriptor, 'r+b' if flags & os.O_RDWR else
+                                                       'wb' if flags & os.O_WRONLY else 'rb')
+        return handle
+
+    def stat(self, path):
+        try:
+            return paramiko.SFTPAttributes.from_stat(os.stat(self.canonicalize(path)))
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+
+    lstat = stat
+
+    def remove(self, path):
+        try:
+            os.remove(self.canonicalize(path))
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+        return paramiko.SFTP_OK
+
+
+class FakeServerInterface(paramiko.ServerInterface):
+    def __init__(self, server):
+        self._server = server
+
+    @property
+    def home(self):
+        return self._server.home
+
+    def check_auth_password(self, username, password):
+        if self._server.password is None or password == self._server.password:
+            return paramiko.AUTH_SUCCESSFUL
+        return paramiko.AUTH_FAILED
+
+    def get_allowed_auths(self, username):
+        return 'password'
+
+    def check_channel_request(self, kind, chanid):
+        if kind == 'session':
+            return paramiko.OPEN_SUCCEEDED
+        return paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+    def check_channel_exec_request(self, channel, command):
+        command = command.decode('utf-8')
+        self._server.record_command(command)
+        threading.Thread(target=self._server.run_command, args=(channel, command), daemon=True).start()
+        return True
+
+
+class FakeSSHServer:
+    def __init__(self, command_handler=default_command_handler, password='test_password', latency=0.0,
+                 host='127.0.0.1', home=None):
+        self._command_handler = command_handler
+        self.home = home
+        self.password = password
+        self.latency = latency
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._socket.bind((host, 0))
+        self._socket.listen(128)
+        self._transports = []
+        self._commands = []
+        self._lock = threading.Lock()
+        self._running = True
+        self._accept_thread = threading.Thread(target=self._accept_loop, daemon=True)
+        self._accept_thread.start()
+
+    @property
+    def host(self):
+        return self._socket.getsockname()[0]
+
+    @property
+    def port(self):
+        return self._socket.getsockname()[1]
+
+    @property
+    def connection_count(self):
+        with self._lock:
+            return len(self._transports)
+
+    @property
+    def commands(self):
+        with self._lock:
+            return list(self._commands)
+
+    def record_command(self, command):
+        with self._lock:
+            self._commands.append(command)
+
+    def run_command(self, channel, command):
+        try:
+            # paramiko acknowledges the exec request only after check_channel_exec_request returns
+            sleep(max(self.latency, 0.01))
+            stdout, stderr, exit_code = self._command_handler(command)
+            if stdout:
+                channel.sendall(stdout)
+            if stderr:
+                channel.sendall_stderr(stderr)
+            channel.send_exit_status(exit_code)
+        finally:
+            channel.close()
+
+    def drop_connections(self):
+        with self._lock:
+            transports = list(self._transports)
+        for transport in transports:
+            transport.close()
+
+    def stop(self):
+        self._running = False
+        self._socket.close()
+        self.drop_connections()
+
+    def _accept_loop(self):
+        while self._running:
+            try:
+                client_socket, address = self._socket.accept()
+            except OSError:
+                return
+            transport = paramiko.Transport(client_socket)
+            transport.add_server_key(get_host_key())
+            if self.home is not None:
+                transport.set_subsystem_handler('sftp', paramiko.SFTPServer, LocalSFTPInterface)
+            with self._lock:
+                self._transports.append(transport)
+            transport.start_server(server=FakeServerInterface(self))
@@ -0,0 +1,93 @@
+from artifact_cache import ArtifactCache, InvalidArtifactCacheConfig
+from urllib.error import HTTPError
+from urllib.request import urlopen
+import pytest
+import threading
+
+
+@pytest.fixture()
+def upstream_repository(tmp_path):
+    repository = tmp_path / 'upstream'
+    (repository / 'deb' / 'ubuntu').mkdir(parents=True)
+    (repository / 'deb' / 'ubuntu' / 'scylla-4.4-focal.list').write_text(
+        'deb [arch=amd64] http://downloads.scylladb.com/downloads/scylla/deb/ubuntu/scylladb-4.4 stable main\n')
+    (repository / 'downloads' / 'pool').mkdir(parents=True)
+    (repository / 'downloads' / 'pool' / 'scylla_4.4.0_amd64.deb').write_bytes(b'package' * 1000)
+    (repository / 'downloads' / 'Release').write_text('Version: 1')
+    return repository
+
+
+@pytest.fixture()
+def artifact_cache(tmp_path, upstream_repository):
+    cache = ArtifactCache(cache_dir=str(tmp_path / 'cache'), advertised_address='127.0.0.1',
+                          upstreams={'downloads.scylladb.com': upstream_repository.as_uri()},
+                          listen_host='127.0.0.1', listen_port=0).start()
+    yield cache
+    cache.stop()
+
+
+def fetch(cache, url):
+    with urlopen(cache.url_for(url), timeout=10) as response:
+        return response.read()
+
+
+def test_repository_urls_point_to_cache(artifact_cache):
+    url = artifact_cache.url_for('curl -L http://downloads.scylladb.com/deb/ubuntu/scylla-4.4-$(lsb_release -s -c).list')
+    assert url == f'curl -L http://{artifact_cache.address}/downloads.scylladb.com/deb/ubuntu/' \
+                  'scylla-4.4-$(lsb_release -s -c).list'
+    assert artifact_cache.url_for('http://example.com/file.deb') == 'http://example.com/file.deb'
+
+
+def test_repository_definition_is_rewritten(artifact_cache):
+    content = fetch(artifact_cache, 'http://downloads.scylladb.com/deb/ubuntu/scylla-4.4-focal.list').decode()
+    assert content == f'deb [arch=amd64] http://{artifact_cache.address}/downloads.scylladb.com/downloads/scylla/' \
+                      'deb/ubuntu/scylladb-4.4 stable main\n'
+
+
+def test_package_is_downloaded_once(artifact_cache):
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(
+        fetch(artifact_cache, 'http://downloads.scylladb.com/downloads/pool/scylla_4.4.0_amd64.deb')))
+        for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == [b'package' * 1000] * 8
+    assert artifact_cache.misses == 1
+    assert artifact_cache.hits == 7
+
+
+def test_metadata_is_refreshed(tmp_path, upstream_repository):
+    cache = ArtifactCache(cache_dir=str(tmp_path / 'cache'), advertised_address='127.0.0.1',
+                          upstreams={'downloads.scylladb.com': upstream_repository.as_uri()},
+                          listen_host='127.0.0.1', listen_port=0, metadata_ttl=0).start()
+    try:
+        assert fetch(cache, 'http://downloads.scylladb.com/downloads/Release') == b'Version: 1'
+        (upstream_repository / 'downloads' / 'Release').write_text('Version: 2')
+        assert fetch(cache, 'http://downloads.scylladb.com/downloads/Release') == b'Version: 2'
+    finally:
+        cache.stop()
+    # the same cache directory with an unreachable upstream keeps serving the last downloaded copy
+    cache = ArtifactCache(cache_dir=str(tmp_path / 'cache'), advertised_address='127.0.0.1',
+                          upstreams={'downloads.scylladb.com': 'http://127.0.0.1:1'},
+                          listen_host='127.0.0.1', listen_port=0, metadata_ttl=0).start()
+    try:
+        assert fetch(cache, 'http://downloads.scylladb.com/downloads/Release') == b'Version: 2'
+    finally:
+        cache.stop()
+
+
+def test_unknown_artifacts_are_not_found(artifact_cache):
+    for url in ('http://downloads.scylladb.com/downloads/missing.deb',
+                f'http://{artifact_cache.address}/example.com/file.deb',
+                f'http://{artifact_cache.address}/downloads.scylladb.com/../secret'):
+        with pytest.raises(expected_exception=HTTPError) as error:
+            fetch(artifact_cache, url)
+        assert error.value.code == 404
+
+
+def test_advertised_address_is_required(tmp_path):
+    for address in ('', ':8090'):
+        with pytest.raises(expected_exception=InvalidArtifactCacheConfig):
+            ArtifactCache(cache_dir=str(tmp_path / 'cache'), advertised_address=address)
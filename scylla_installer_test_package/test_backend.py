@@ -1,12 +1,24 @@
-from installer import ParallelObject, ScyllaInstaller, OSIdentificationError, CommandExecutionError
+from installer import ScyllaInstaller, AsyncScyllaInstaller, OSIdentificationError, \
+    CommandExecutionError, InstallationDispatcher, ScyllaNodeOperation, COMMAND_SECONDS, STEP_SECONDS
+from worker_pool import WorkerPool, JobCancelled
+from artifact_cache import ArtifactCache
+from checkpoints import InstallationStep, CheckpointStore
+from host_facts import HostFacts, FACT_COLUMNS, FACT_COMMANDS
+from datetime import datetime, timedelta
+from contextlib import nullcontext
 from ssh_interface.ssh import SSHConnection
+from ssh_interface.async_ssh import AsyncSSHConnection
+from ssh_interface.command_batch import CommandBatch, StepResult
+import asyncio
 import pytest
 from time import sleep
-import concurrent.futures
+import threading
 
 
-def long_running_thread():
-    sleep(3)
+UBUNTU_20 = {'ID': 'ubuntu', 'VERSION_ID': '20.04'}
+FACT_OUTPUT = dict(zip([x[1] for x in FACT_COMMANDS], [['NAME="Ubuntu"\n', 'ID=ubuntu\n', 'VERSION_ID="20.04"\n'],
+                                                       ['ens5\n'], ['8\n'], ['16318480\n'],
+                                                       ['nvme0n1 1000204886016\n'], []]))
 
 
 @pytest.fixture()
@@ -31,16 +43,80 @@ def installer_object(log_configuration):
     return installer_object
 
 
+class FakeDatabase:
+    def __init__(self, new_installations=None, finished_installations=None):
+        self.new_installations = new_installations or []
+        self.finished_installations = finished_installations or []
+        self.claimed = {}
+
+    def select_data(self, query, columns):
+        statement, params = query.build()
+        if columns == FACT_COLUMNS:
+            return [dict(zip(columns, HostFacts(host=x['host'], os_release=UBUNTU_20).to_row()))
+                    for worker_id, x in self.claimed.values()]
+        if 'installations.heartbeat_timestamp' in statement:
+            return []
+        if 'installations.worker_id = ' in statement:
+            return [{'installation_id': k} for k, (worker_id, row) in self.claimed.items()
+                    if k in params and worker_id == params[-1]]
+        if 'installations.global_status = ' in statement:
+            return [{'installation_id': x['installation_id'], 'cluster_name': x['cluster_name']}
+                    for x in self.new_installations]
+        if columns == ('installation_id', 'global_status', 'worker_id'):
+            finished_ids = [x['installation_id'] for x in self.finished_installations]
+            return [{'installation_id': k, 'global_status': 'failed' if k in finished_ids else 'in progress',
+                     'worker_id': worker_id} for k, (worker_id, row) in self.claimed.items() if k in params]
+        return [dict(row) for k, (worker_id, row) in self.claimed.items() if k in params]
+
+    def current_timestamp(self):
+        return datetime.now()
+
+    def update_data(self, table, condition, condition_params=(), **kwargs):
+        # a claim takes over only the installations which are still new
+        claimed = [x for x in self.new_installations if x['installation_id'] in condition_params[:-1]]
+        self.new_installations = [x for x in self.new_installations if x not in claimed]
+        self.claimed.update({x['installation_id']: (kwargs['worker_id'], x) for x in claimed})
+
+
+class RecordingDatabase:
+    def __init__(self):
+        self.updates = []
+        self.upserts = []
+
+    def update_data(self, table, condition, condition_params=(), **kwargs):
+        self.updates.append((table, condition_params, kwargs))
+
+    def update_rows(self, table, key_column, rows):
+        self.updates.extend([(table, (k,), v) for k, v in rows.items()])
+
+    def upsert_data(self, table, columns, values, update_columns=()):
+        self.upserts.append((table, values))
+
+    def transaction(self):
+        return nullcontext()
+
+    def current_timestamp(self):
+        return datetime.now()
+
+
+@pytest.fixture
+def new_installations():
+    node = {'port': 22, 'username': 'test_user', 'password': 'dGVzdF9wYXNzd29yZA==', 'db_version': '4.4',
+            'cluster_name': 'test_cluster', 'seed_node': 'test_seed_node', 'os_version': None, 'operation': 'install',
+            'batch_size': '1'}
+    return [dict(node, host='test_node', installation_id=1), dict(node, host='test_seed_node', installation_id=2)]
+
+
 @pytest.fixture
 def mocked_shell_command_supported_os(monkeypatch):
-    monkeypatch.setattr(ScyllaInstaller, "_execute_shell_command",
-                        lambda *args, **kwargs: [['ID=ubuntu', 'VERSION_ID="20.04"'], [], 0])
+    monkeypatch.setattr(ScyllaInstaller, "_current_facts",
+                        lambda self: HostFacts(host=self.host, os_release={'ID': 'ubuntu', 'VERSION_ID': '20.04'}))
 
 
 @pytest.fixture
 def mocked_shell_command_unsupported_os(monkeypatch):
-    monkeypatch.setattr(ScyllaInstaller, "_execute_shell_command",
-                        lambda *args, **kwargs: [['ID=ubuntu', 'VERSION_ID="10.04"'], [], 0])
+    monkeypatch.setattr(ScyllaInstaller, "_current_facts",
+                        lambda self: HostFacts(host=self.host, os_release={'ID': 'ubuntu', 'VERSION_ID': '10.04'}))
 
 
 @pytest.fixture
@@ -55,11 +131,20 @@ def mocked_shell_command_with_error(monkeypatch):
                         lambda *args, **kwargs: [[], ['Critical error!!!'], 1])
 
 
-def test_parallel_object_timeout_error():
-    function_list = [long_running_thread]
-    test_object = ParallelObject(timeout=2)
-    with pytest.raises(expected_exception=concurrent.futures._base.TimeoutError):
-        test_object.run(function_list)
+@pytest.fixture
+def mocked_batch_with_error(monkeypatch):
+    monkeypatch.setattr(SSHConnection, "execute_batch",
+                        lambda self, batch, **kwargs: [[StepResult(command=batch.commands[0], stdout=[], stderr=[],
+                                                         exit_code=0, duration=0.1),
+                                              StepResult(command=batch.commands[1], stdout=[],
+                                                         stderr=['Critical error!!!'], exit_code=1, duration=0.1)],
+                                             [], 0])
+
+
+@pytest.fixture
+def mocked_interrupted_batch(monkeypatch):
+    monkeypatch.setattr(SSHConnection, "execute_batch",
+                        lambda self, batch, **kwargs: [[], ['bash: command not found'], 127])
 
 
 def test_scylla_installer_constructor(installer_object):
@@ -86,3 +171,320 @@ def test_execute_shell_command_positive(installer_object, mocked_shell_command):
 def test_execute_shell_command_negative(installer_object, mocked_shell_command_with_error):
     with pytest.raises(expected_exception=CommandExecutionError):
         installer_object._execute_shell_command('rm -rf')
+
+
+def test_execute_shell_batch_negative(installer_object, mocked_batch_with_error):
+    batch = CommandBatch(name='test batch').add('apt-get update').add('apt-get install -y scylla')
+    with pytest.raises(expected_exception=CommandExecutionError, match='apt-get install -y scylla'):
+        installer_object._execute_shell_batch(batch=batch)
+
+
+def test_execute_shell_batch_interrupted(installer_object, mocked_interrupted_batch):
+    batch = CommandBatch(name='test batch').add('apt-get update')
+    with pytest.raises(expected_exception=CommandExecutionError):
+        installer_object._execute_shell_batch(batch=batch)
+
+
+def test_cancelled_installation_stops_before_next_command(installer_object, mocked_shell_command):
+    installer_object.cancel_event.set()
+    with pytest.raises(expected_exception=JobCancelled):
+        installer_object._execute_shell_command('apt-get update')
+
+
+def test_packages_are_installed_from_cache(log_configuration, monkeypatch):
+    batches = []
+    monkeypatch.setattr(ScyllaInstaller, '_execute_shell_batch', lambda self, batch: batches.append(batch))
+    installer = ScyllaInstaller(installer_db=None, log_config=log_configuration, host='my_test_host', port=3000,
+                                username='test_user', password='dGVzdF9wYXNzd29yZA==', db_version='4.4',
+                                cluster_name='test_cluster', seed_node='test_seed_node', os_version='CentOS 7',
+                                installation_id=5,
+                                artifact_cache=ArtifactCache(cache_dir='cache', advertised_address='10.0.0.100:8090'))
+    installer._install_on_node()
+    assert 'curl -o /etc/yum.repos.d/scylla.repo -L http://10.0.0.100:8090/repositories.scylladb.com/scylla/repo/' \
+           'a3df46bd-e48a-4a51-bef7-ccbdc819a9c5/centos/scylladb-4.4.repo' in batches[0].commands
+
+
+def test_dispatcher_queues_seed_first_and_once(log_configuration, new_installations, monkeypatch):
+    started = []
+    release = threading.Event()
+
+    def fake_install(self):
+        started.append(self.host)
+        release.wait(timeout=5)
+
+    monkeypatch.setattr(ScyllaInstaller, "install", fake_install)
+    pool = WorkerPool(max_workers=1).start()
+    dispatcher = InstallationDispatcher(database=FakeDatabase(new_installations=new_installations),
+                                        log_config=log_configuration, worker_pool=pool, bootstrap_scheduler=None)
+    assert dispatcher.poll() == 2
+    assert dispatcher.poll() == 0
+    release.set()
+    while pool.active_job_ids:
+        sleep(0.01)
+    pool.shutdown()
+    assert started == ['test_seed_node', 'test_node']
+
+
+def test_dispatcher_cancels_installations_closed_from_outside(log_configuration, new_installations, monkeypatch):
+    monkeypatch.setattr(ScyllaInstaller, "install", lambda self: self.cancel_event.wait(timeout=5))
+    pool = WorkerPool(max_workers=2).start()
+    database = FakeDatabase(new_installations=new_installations)
+    dispatcher = InstallationDispatcher(database=database, log_config=log_configuration, worker_pool=pool,
+                                        bootstrap_scheduler=None)
+    dispatcher.poll()
+    database.new_installations = []
+    database.finished_installations = [{'installation_id': 1}]
+    dispatcher.poll()
+    while 1 in pool.active_job_ids:
+        sleep(0.01)
+    assert pool.active_job_ids == [2]
+    pool.shutdown(cancel_running=True)
+
+
+def test_dispatcher_cancels_installations_taken_over_by_another_worker(log_configuration, new_installations,
+                                                                        monkeypatch):
+    cancel_reasons = {}
+    monkeypatch.setattr(ScyllaInstaller, "install", lambda self: self.cancel_event.wait(timeout=5))
+    monkeypatch.setattr(WorkerPool, "cancel", lambda self, job_id, reason: cancel_reasons.update({job_id: reason}))
+    pool = WorkerPool(max_workers=2).start()
+    database = FakeDatabase(new_installations=new_installations)
+    dispatcher = InstallationDispatcher(database=database, log_config=log_configuration, worker_pool=pool,
+                                        bootstrap_scheduler=None)
+    assert dispatcher.poll() == 2
+    database.claimed[2] = ('other:1234', database.claimed[2][1])
+    dispatcher.poll()
+    assert cancel_reasons == {2: 'lease expired'}
+    pool.shutdown(wait=False)
+
+
+def test_finished_installation_updates_statistics_facets(log_configuration):
+    database = RecordingDatabase()
+    installer = ScyllaInstaller(installer_db=database, log_config=log_configuration, host='my_test_host', port=22,
+                                username='test_user', password=None, db_version='4.4', cluster_name='test_cluster',
+                                seed_node='my_test_host', os_version=None, installation_id=7)
+    installer._set_global_status(global_status_value='in progress')
+    assert database.upserts == []
+    installer._set_global_status(global_status_value='failed')
+    assert database.upserts == [('statistics_facets', [('host', 'my_test_host'), ('cluster', 'test_cluster'),
+                                                       ('user', 'test_user'), ('db_version', '4.4'),
+                                                       ('os_version', 'None'), ('seed_node', 'my_test_host'),
+                                                       ('status', 'failed')])]
+
+
+class CheckpointDatabase:
+    def __init__(self, checkpoints=()):
+        self.checkpoints = list(checkpoints)
+        self.statuses = []
+
+    def select_data(self, query, columns):
+        return [dict(zip(columns, x)) for x in self.checkpoints]
+
+    def upsert_data(self, table, columns, values, update_columns=()):
+        host, step_name, fingerprint, installation_id, timestamp = values[0]
+        self.checkpoints = [x for x in self.checkpoints if x[0] != step_name]
+        self.checkpoints.append((step_name, fingerprint, installation_id, datetime.now()))
+
+    def insert_data(self, table, columns, values):
+        self.statuses.extend([x[0] for x in values])
+
+    def transaction(self):
+        return nullcontext()
+
+    def current_timestamp(self):
+        return datetime.now()
+
+
+def previous_run_checkpoints(step_names, fingerprint):
+    started = datetime(2021, 6, 1, 10, 0, 0)
+    return [(x, fingerprint, 3, started + timedelta(minutes=number)) for number, x in enumerate(step_names)]
+
+
+def test_completed_steps_stop_at_stale_checkpoint():
+    fingerprint = CheckpointStore.fingerprint('4.4', 'test_cluster', 'test_seed_node')
+    checkpoints = previous_run_checkpoints(['detect_os', 'install_packages', 'configure'], fingerprint)
+    database = CheckpointDatabase(checkpoints=checkpoints)
+    store = CheckpointStore(database=database)
+    assert [x['step_name'] for x in store.completed_steps(host='my_test_host', fingerprint=fingerprint,
+                                                          step_names=['detect_os', 'install_packages',
+                                                                      'configure'])] == \
+        ['detect_os', 'install_packages', 'configure']
+    assert store.completed_steps(host='my_test_host', fingerprint=CheckpointStore.fingerprint('4.3'),
+                                 step_names=['detect_os']) == []
+    # the packages were reinstalled by a later run which failed before the configuration
+    database.checkpoints[1] = ('install_packages', fingerprint, 4, datetime(2021, 6, 2))
+    assert [x['step_name'] for x in store.completed_steps(host='my_test_host', fingerprint=fingerprint,
+                                                          step_names=['detect_os', 'install_packages',
+                                                                      'configure'])] == \
+        ['detect_os', 'install_packages']
+
+
+def test_installation_resumes_from_first_incomplete_step(log_configuration):
+    executed = []
+    step_names = ['detect_os', 'install_packages', 'configure', 'start']
+    fingerprint = CheckpointStore.fingerprint('4.4', 'test_cluster', 'test_seed_node')
+    database = CheckpointDatabase(checkpoints=previous_run_checkpoints(step_names[:3], fingerprint))
+    installer = ScyllaInstaller(installer_db=database, log_config=log_configuration, host='my_test_host', port=22,
+                                username='test_user', password=None, db_version='4.4', cluster_name='test_cluster',
+                                seed_node='test_seed_node', os_version='Ubuntu 20.04', installation_id=5)
+    steps = [InstallationStep(name=x, run=lambda x=x: executed.append(x), probe=lambda x=x: x != 'configure',
+                              status=x) for x in step_names]
+    installer._run_steps(steps=steps)
+    assert executed == ['configure', 'start']
+    assert database.statuses == step_names
+    assert [x[2] for x in database.checkpoints] == [3, 3, 5, 5]
+
+
+class RecordingFactsStore:
+    def __init__(self):
+        self.saved = []
+
+    def get(self, host):
+        return HostFacts(host=host, os_release=UBUNTU_20)
+
+    def save(self, facts):
+        self.saved.extend(facts)
+
+
+def test_reimaged_host_is_identified_again(log_configuration):
+    facts_store = RecordingFactsStore()
+    installer = ScyllaInstaller(installer_db=CheckpointDatabase(), log_config=log_configuration, host='my_test_host',
+                                port=22, username='test_user', password=None, db_version='4.4',
+                                cluster_name='test_cluster', seed_node='test_seed_node', os_version='Ubuntu 20.04',
+                                installation_id=5, facts_store=facts_store)
+    os_release = ['ID=ubuntu\n', 'VERSION_ID="20.04"\n']
+    installer._execute_probe_command = lambda command: (os_release, [], 0)
+    assert installer._os_identified()
+    assert installer._current_facts().os_release == UBUNTU_20
+    os_release = ['ID="centos"\n', 'VERSION_ID="7"\n']
+    assert not installer._os_identified()
+    # the facts read before the node was re-imaged are not reused by the following steps
+    installer._execute_shell_batch = lambda batch: [StepResult(command=x, stdout=y, stderr=[], exit_code=0,
+                                                               duration=0.1)
+                                                    for x, y in zip(batch.commands, (os_release, ['eth0\n'], ['4\n'],
+                                                                                     ['8000000\n'], [], []))]
+    assert installer.get_os_version() == 'Centos 7'
+    assert [x.os_release for x in facts_store.saved] == [{'ID': 'centos', 'VERSION_ID': '7'}]
+
+
+class AsyncInstallationDatabase(CheckpointDatabase):
+    def __init__(self):
+        super().__init__()
+        self.updates = []
+
+    def select_data(self, query, columns):
+        if columns == FACT_COLUMNS:
+            return []
+        return super().select_data(query=query, columns=columns)
+
+    def update_data(self, table, condition, condition_params=(), **kwargs):
+        self.updates.append((table, kwargs))
+
+    def update_rows(self, table, key_column, rows):
+        self.updates.extend([(table, x) for x in rows.values()])
+
+    def upsert_data(self, table, columns, values, update_columns=()):
+        if table == 'installation_checkpoints':
+            super().upsert_data(table=table, columns=columns, values=values, update_columns=update_columns)
+
+
+def test_async_installer_runs_all_steps(log_configuration, monkeypatch):
+    executed = []
+
+    async def execute_command(self, command, on_line=None, tail_lines=None):
+        executed.append(command)
+        if command == 'nodetool status':
+            return ['UN  my_test_host   1.1 MB     256     ?     7c1e0ea6  rack1\n'], [], 0
+        return [], [], 0
+
+    async def execute_batch(self, batch, on_line=None, tail_lines=None):
+        executed.extend(batch.commands)
+        return [StepResult(command=x, stdout=FACT_OUTPUT.get(x, []), stderr=[], exit_code=0, duration=0.1)
+                for x in batch.commands], [], 0
+
+    async def upload(self, content, remote_path, mode='644'):
+        executed.append(f'upload {remote_path}')
+        return True
+
+    async def close(self):
+        pass
+
+    monkeypatch.setattr(AsyncSSHConnection, 'execute_command', execute_command)
+    monkeypatch.setattr(AsyncSSHConnection, 'execute_batch', execute_batch)
+    monkeypatch.setattr(AsyncSSHConnection, 'upload', upload)
+    monkeypatch.setattr(AsyncSSHConnection, 'close', close)
+    database = AsyncInstallationDatabase()
+    installer = AsyncScyllaInstaller(installer_db=database, log_config=log_configuration, host='my_test_host',
+                                     port=22, username='test_user', password=None, db_version='4.4',
+                                     cluster_name='test_cluster', seed_node='my_test_host', os_version=None,
+                                     installation_id=5)
+    asyncio.run(installer.install())
+    assert 'apt-get install -y scylla' in executed
+    assert 'upload /etc/scylla/scylla.yaml' in executed
+    assert 'systemctl start scylla-server.service' in executed
+    assert 'scylla_setup --no-raid-setup --nic ens5 --io-setup 1 --no-rsyslog-setup' in executed
+    assert [x[0] for x in database.checkpoints] == ['detect_os', 'install_packages', 'write_scylla_yaml',
+                                                    'configure', 'start', 'stress']
+    assert database.updates[0] == ('installations', {'global_status': 'in progress'})
+    assert database.updates[-1][1]['global_status'] == 'succeeded'
+
+
+def test_command_output_updates_progress_at_most_once_per_interval(log_configuration):
+    database = RecordingDatabase()
+    installer = ScyllaInstaller(installer_db=database, log_config=log_configuration, host='my_test_host', port=22,
+                                username='test_user', password=None, db_version='4.4', cluster_name='test_cluster',
+                                seed_node='test_seed_node', os_version='Ubuntu 20.04', installation_id=5)
+    for line in ['Reading package lists...', '', 'Unpacking scylla-server', 'Setting up scylla-server']:
+        installer._log_command_output(stream_name='output', line=line)
+    assert database.updates == [('installations', (5,), {'progress': 'Reading package lists...'})]
+
+
+def test_commands_are_timed_per_stage(log_configuration, mocked_shell_command):
+    installer = ScyllaInstaller(installer_db=CheckpointDatabase(), log_config=log_configuration, host='timed_host',
+                                port=22, username='test_user', password=None, db_version='4.4',
+                                cluster_name='test_cluster', seed_node='test_seed_node', os_version='Ubuntu 20.04',
+                                installation_id=5)
+    installer._run_steps(steps=[InstallationStep(name='configure', run=lambda: installer._execute_shell_command(
+        command_to_execute='/usr/lib/scylla/scylla_setup --no-raid-setup'))])
+    samples = [x for x in COMMAND_SECONDS.family()['samples'] if x[1].get('host') == 'timed_host']
+    assert ['installer_command_seconds_count', {'host': 'timed_host', 'stage': 'configure',
+                                                'command': 'scylla_setup'}, 1] in samples
+    assert [x for x in STEP_SECONDS.family()['samples'] if x[0] == 'installer_step_seconds_count' and
+            x[1] == {'host': 'timed_host', 'stage': 'configure'}][0][2] == 1
+
+
+def node_operation(operation, log_configuration, os_version='Ubuntu 20.04'):
+    return ScyllaNodeOperation(operation=operation, installer_db=AsyncInstallationDatabase(),
+                               log_config=log_configuration, host='my_test_host', port=22, username='root',
+                               password=None, db_version='4.4', cluster_name='test_cluster',
+                               seed_node='test_seed_node', os_version=os_version, installation_id=5)
+
+
+def test_config_push_restarts_only_changed_nodes(log_configuration, monkeypatch):
+    executed = []
+    monkeypatch.setattr(SSHConnection, 'upload', lambda self, content, remote_path, mode='644': False)
+    monkeypatch.setattr(SSHConnection, 'execute_command',
+                        lambda self, command, **kwargs: executed.append(command) or [[], [], 0])
+    operation = node_operation(operation='config', log_configuration=log_configuration)
+    operation.install()
+    assert executed == []
+    assert operation._installer_db.statuses == ['scylla.yaml updated', 'Scylla restarted']
+    monkeypatch.setattr(SSHConnection, 'upload', lambda self, content, remote_path, mode='644': True)
+    operation = node_operation(operation='config', log_configuration=log_configuration)
+    monkeypatch.setattr(operation._readiness, 'wait_for_up_normal', lambda: None)
+    operation.install()
+    assert executed == ['nodetool drain', 'systemctl restart scylla-server.service']
+
+
+def test_upgrade_updates_packages_and_checks_version(log_configuration, monkeypatch):
+    batches = []
+    executed = []
+    monkeypatch.setattr(ScyllaNodeOperation, '_execute_shell_batch', lambda self, batch: batches.append(batch))
+    monkeypatch.setattr(SSHConnection, 'execute_command',
+                        lambda self, command, **kwargs: executed.append(command) or [['4.3.6-0.20210610\n'], [], 0])
+    operation = node_operation(operation='upgrade', log_configuration=log_configuration, os_version='CentOS 7')
+    with pytest.raises(expected_exception=CommandExecutionError, match='found 4.3.6'):
+        operation._upgrade_on_node()
+    assert "yum update -y 'scylla*'" in batches[0].commands
+    assert 'yum install -y scylla' not in batches[0].commands
+    assert [x.name for x in operation._installation_steps()] == ['detect_os', 'stop', 'upgrade_packages',
+                                                                 'start_upgraded']
@@ -0,0 +1,63 @@
+from ssh_interface.command_batch import CommandBatch, STEP_OUTPUT_LIMIT
+from ssh_interface.command_output import OutputTail
+import subprocess
+
+
+def run_locally(command):
+    process = subprocess.run(command, shell=True, capture_output=True, text=True)
+    return process.stdout.splitlines(keepends=True), process.stderr.splitlines(keepends=True), process.returncode
+
+
+def test_batch_reports_every_step():
+    batch = CommandBatch(name='test batch')
+    batch.add('echo "first step"').add('echo "second step" >&2').add('echo $(echo nested)')
+    stdout, stderr, exit_code = run_locally(batch.render_command())
+    results = batch.parse_results(stdout=stdout)
+    assert exit_code == 0
+    assert [x.command for x in results] == batch.commands
+    assert results[0].stdout == ['first step\n']
+    assert results[1].stderr == ['second step\n']
+    assert results[2].stdout == ['nested\n']
+    assert all(x.exit_code == 0 and x.duration >= 0 for x in results)
+
+
+def test_batch_stops_on_first_failure():
+    batch = CommandBatch(name='test batch')
+    batch.add('echo "Critical error!!!" >&2; exit 3').add('echo "never executed"')
+    stdout, stderr, exit_code = run_locally(batch.render_command())
+    results = batch.parse_results(stdout=stdout)
+    assert len(results) == 1
+    assert results[0].exit_code == 3
+    assert results[0].stderr == ['Critical error!!!\n']
+
+
+def test_parse_ignores_foreign_output():
+    batch = CommandBatch(name='test batch')
+    batch.add('true')
+    assert batch.parse_results(stdout=['motd banner\n']) == []
+
+
+def test_batch_copies_step_output_to_stderr():
+    batch = CommandBatch(name='test batch')
+    batch.add('echo "first step"; exit 2')
+    stdout, stderr, exit_code = run_locally(batch.render_command())
+    results = batch.parse_results(stdout=stdout)
+    assert stderr == ['first step\n']
+    assert results[0].stdout == ['first step\n']
+    assert results[0].exit_code == 2
+
+
+def test_large_step_output_survives_chunked_reads():
+    batch = CommandBatch(name='test batch')
+    batch.add('head -c 120000 /dev/zero | tr "\\0" "x"; echo').add('echo "second step"')
+    process = subprocess.run(batch.render_command(), shell=True, capture_output=True)
+    stdout = OutputTail('stdout')
+    for position in range(0, len(process.stdout), 4096):
+        stdout.feed(process.stdout[position:position + 4096])
+    stdout.close()
+    results = batch.parse_results(stdout=stdout.lines)
+    # the step reports the tail of its output, the full output was streamed on stderr
+    assert results[0].stdout == ['x' * (STEP_OUTPUT_LIMIT - 1) + '\n']
+    assert process.stderr.startswith(b'x' * 120000 + b'\n')
+    assert results[0].stderr == []
+    assert results[1].stdout == ['second step\n']
@@ -0,0 +1,337 @@
+import cherrypy
+import datetime
+import io
+from change_feed import ChangeFeed, FeedOverrun
+from contextlib import contextmanager
+from controller import Controller, StatusFeedPublisher
+from db_interface.migrations import create_tables
+from db_interface.sql_database_interface import SQLiteDatabase
+from jinja2 import FileSystemLoader, Environment
+import json
+import pytest
+import threading
+
+
+class FakeStatusDatabase:
+    def __init__(self):
+        self.installations = {}
+        self.statuses = []
+        self.queries = 0
+
+    def select_data(self, query, columns):
+        self.queries += 1
+        table = query.shape[0]
+        if table == 'nodes':
+            return [{'host': v['host'], 'installation_id': k, 'global_status': v['global_status']}
+                    for k, v in self.installations.items() if v['global_status'] in ('new', 'in progress')]
+        if table == 'installations':
+            return [{'installation_id': x, 'global_status': self.installations[x]['global_status'],
+                     'progress': self.installations[x].get('progress'),
+                     'operation': self.installations[x].get('operation', 'install')}
+                    for x in query.params if x in self.installations]
+        return [{'installation_id': x, 'status_name': y} for x, y in self.statuses if x in query.params]
+
+
+@pytest.fixture()
+def status_database():
+    database = FakeStatusDatabase()
+    database.installations[1] = {'host': '10.0.0.1', 'global_status': 'in progress'}
+    return database
+
+
+def test_feed_read_returns_newer_events():
+    feed = ChangeFeed()
+    feed.publish(event={'number': 1})
+    feed.publish(event={'number': 2})
+    assert feed.read(after=1, timeout=0) == [(2, {'number': 2})]
+
+
+def test_feed_read_waits_for_publisher():
+    feed = ChangeFeed()
+    threading.Timer(0.05, feed.publish, kwargs={'event': {'number': 1}}).start()
+    assert feed.read(after=0, timeout=5) == [(1, {'number': 1})]
+    assert feed.read(after=1, timeout=0.01) == []
+
+
+def test_publisher_skips_database_without_subscribers(status_database):
+    publisher = StatusFeedPublisher(database=status_database, change_feed=ChangeFeed())
+    publisher.poll()
+    assert status_database.queries == 0
+
+
+def test_publisher_reports_transitions(status_database):
+    feed = ChangeFeed()
+    publisher = StatusFeedPublisher(database=status_database, change_feed=feed)
+    feed.subscribe()
+    sequence, snapshot = publisher.snapshot()
+    assert snapshot == [{'host': '10.0.0.1', 'installation_id': 1, 'global_status': 'in progress', 'progress': None,
+                         'operation': 'install', 'statuses': []}]
+    status_database.statuses.append((1, 'OS identified'))
+    publisher.poll()
+    publisher.poll()
+    status_database.installations[1]['global_status'] = 'failed'
+    publisher.poll()
+    events = [x for _, x in feed.read(after=sequence, timeout=0)]
+    assert [(x['global_status'], x['statuses']) for x in events] == [('in progress', ['OS identified']),
+                                                                      ('failed', ['OS identified'])]
+    assert publisher.snapshot()[1] == []
+
+
+def test_progress_stream_sends_snapshot_and_events(status_database):
+    controller = Controller(database=status_database)
+    stream = controller._stream_progress(keepalive_interval=0.01)
+    snapshot = next(stream)
+    assert snapshot.startswith('event: snapshot\n')
+    assert json.loads(snapshot.split('data: ')[1])[0]['host'] == '10.0.0.1'
+    assert next(stream) == ': keepalive\n\n'
+    status_database.statuses.append((1, 'OS identified'))
+    controller.status_publisher.poll()
+    event = next(stream)
+    assert json.loads(event.split('data: ')[1])['statuses'] == ['OS identified']
+    stream.close()
+
+
+def test_slow_reader_is_resynchronized(status_database):
+    feed = ChangeFeed(history_size=2)
+    for number in range(3):
+        feed.publish(event={'number': number})
+    assert [x['number'] for _, x in feed.read(after=1, timeout=0)] == [1, 2]
+    with pytest.raises(expected_exception=FeedOverrun):
+        feed.read(after=0, timeout=0)
+    controller = Controller(database=status_database, status_feed=ChangeFeed(history_size=1))
+    stream = controller._stream_progress(keepalive_interval=0.01)
+    assert next(stream).startswith('event: snapshot\n')
+    for status in ('OS identified', 'Scylla installed'):
+        status_database.statuses.append((1, status))
+        controller.status_publisher.poll()
+    resync = next(stream)
+    assert resync.startswith('event: snapshot\n')
+    assert json.loads(resync.split('data: ')[1])[0]['statuses'] == ['OS identified', 'Scylla installed']
+    assert next(stream) == ': keepalive\n\n'
+    stream.close()
+
+
+def test_statistics_page_reads_facets_once():
+    class FacetDatabase:
+        queries = []
+
+        def select_data(self, query, columns):
+            self.queries.append(query.shape[0])
+            return [{'facet_name': 'cluster', 'facet_value': 'test_cluster'},
+                    {'facet_name': 'os_version', 'facet_value': 'None'}]
+
+    database = FacetDatabase()
+    page = Controller(database=database).statistics()
+    assert database.queries == ['statistics_facets']
+    assert '<option value="test_cluster">test_cluster</option>' in page
+
+
+class StatisticsDatabase:
+    def __init__(self, records):
+        self.records = records
+        self.queries = []
+
+    def select_data(self, query, columns):
+        self.queries.append(query.build())
+        return [dict(zip(columns, x)) for x in self.records[:query.params[-1]]]
+
+    def iterate_data(self, query, columns, batch_size=500):
+        self.queries.append(query.build())
+        for record in self.records:
+            yield dict(zip(columns, record))
+
+    @staticmethod
+    def as_stored(column):
+        return column
+
+
+def statistics_records(count):
+    start = datetime.datetime(2021, 6, 1, 10, 0, 0)
+    return [('test_cluster', f'10.0.0.{x}', 'root', '4.4', None, '10.0.0.1', start, start, 'succeeded', start, x)
+            for x in range(count, 0, -1)]
+
+
+def statistics_request(**kwargs):
+    data = {'start_date_from': '2021-01-01', 'start_time_from': '00:00', 'start_date_to': '2021-12-31',
+            'start_time_to': '23:59', 'cluster': 'all', 'host': 'all', 'user': 'all', 'db_version': 'all',
+            'os_version': 'all', 'seed_node': 'all', 'status': 'all'}
+    data.update(kwargs)
+    cherrypy.request.json = data
+
+
+def test_statistics_are_paginated():
+    database = StatisticsDatabase(records=statistics_records(count=3))
+    statistics_request(page_size=2)
+    response = Controller(database=database).get_stat()
+    assert response['message'][0] == ['test_cluster', '10.0.0.3', 'root', '4.4', '', '10.0.0.1',
+                                      '01.06.2021 10:00:00.000000', '01.06.2021 10:00:00.000000', 'succeeded']
+    assert len(response['message']) == 2
+    assert response['next'] == ['2021-06-01 10:00:00', 2]
+    statement, params = database.queries[-1]
+    assert statement.endswith('order by installations.start_timestamp desc, installations.id desc limit %s')
+    assert params[-1] == 3
+    statistics_request(page_size=2, after=['10.0.0.2', 2], sort_by='host', sort_order='asc')
+    response = Controller(database=database).get_stat()
+    statement, params = database.queries[-1]
+    assert '(nodes.host > %s or (nodes.host = %s and installations.id > %s))' in statement
+    assert params[-4:] == ['10.0.0.2', '10.0.0.2', 2, 3]
+
+
+def test_statistics_last_page_has_no_cursor():
+    statistics_request()
+    response = Controller(database=StatisticsDatabase(records=statistics_records(count=3))).get_stat()
+    assert len(response['message']) == 3
+    assert response['next'] is None
+
+
+def test_statistics_unknown_sort_is_rejected():
+    statistics_request(sort_by='os_version')
+    with pytest.raises(expected_exception=cherrypy.HTTPError):
+        Controller(database=StatisticsDatabase(records=[])).get_stat()
+
+
+def test_statistics_invalid_page_size_is_rejected():
+    for page_size in ('ten', 0, '-5', 2.5, True):
+        statistics_request(page_size=page_size)
+        with pytest.raises(expected_exception=cherrypy.HTTPError) as error:
+            Controller(database=StatisticsDatabase(records=[])).get_stat()
+        assert error.value.status == 400
+
+
+def test_statistics_invalid_cursor_is_rejected():
+    for cursor in ('10.0.0.2', ['10.0.0.2'], ['10.0.0.2', 2, 3], ['10.0.0.2', 'two'], {'host': '10.0.0.2'}):
+        statistics_request(after=cursor)
+        with pytest.raises(expected_exception=cherrypy.HTTPError) as error:
+            Controller(database=StatisticsDatabase(records=[])).get_stat()
+        assert error.value.status == 400
+
+
+def test_statistics_pages_of_sqlite_database_follow_each_other(tmp_path):
+    database = SQLiteDatabase(database=str(tmp_path / 'installer.sqlite'))
+    create_tables(database=database, template_environment=Environment(loader=FileSystemLoader('templates')),
+                  db_type='sqlite', schema=database.schema)
+    hosts = [f'10.0.0.{x}' for x in range(1, 8)]
+    database.insert_data(table='nodes', columns=('host', 'port', 'username', 'password', 'db_version',
+                                                 'cluster_name', 'seed_node'),
+                         values=[(x, '22', 'root', 'null', '4.4', 'test_cluster', hosts[0]) for x in hosts])
+    # the installations of one submission share the start timestamp of the database default
+    database.insert_data(table='installations', columns=('host', 'global_status'),
+                         values=[(x, 'succeeded') for x in hosts])
+    for sort_by in ('installation_start', 'host'):
+        for sort_order in ('asc', 'desc'):
+            received, cursor = [], None
+            while True:
+                statistics_request(page_size=2, after=cursor, sort_by=sort_by, sort_order=sort_order,
+                                   start_date_from='2000-01-01', start_date_to='2999-12-31')
+                response = Controller(database=database).get_stat()
+                received += [x[1] for x in response['message']]
+                cursor = response['next']
+                if cursor is None:
+                    break
+            assert sorted(received) == hosts and len(received) == len(hosts)
+    database.close()
+
+
+def test_statistics_stream_yields_json_lines():
+    database = StatisticsDatabase(records=[x[:9] for x in statistics_records(count=2)])
+    lines = list(Controller(database=database)._stream_statistics(query=Controller._statistics_query(
+        data={'cluster': 'all', 'host': 'all', 'user': 'all', 'db_version': 'all', 'os_version': 'all',
+              'seed_node': 'all', 'status': 'all'})))
+    assert [json.loads(x)[1] for x in lines] == ['10.0.0.2', '10.0.0.1']
+    assert all(x.endswith('\n') for x in lines)
+
+
+class InstallDatabase:
+    def __init__(self, active_hosts=()):
+        self.active_hosts = list(active_hosts)
+        self.statements = []
+        self.transactions = 0
+
+    @contextmanager
+    def transaction(self):
+        self.transactions += 1
+        yield
+
+    def select_data(self, query, columns):
+        self.statements.append(('select', query.shape[0], query.params))
+        return [dict(zip(columns, (x, 'old_cluster', 'root', '4.3', None, x))) for x in self.active_hosts
+                if x in query.params]
+
+    def update_data(self, table, condition, condition_params=(), **kwargs):
+        self.statements.append(('update', table, condition, list(condition_params)))
+
+    def upsert_data(self, table, columns, values, update_columns=()):
+        self.statements.append(('upsert', table, columns, values))
+
+    def insert_data(self, table, columns, values):
+        self.statements.append(('insert', table, columns, values))
+
+
+def submitted_node(host, **kwargs):
+    return dict({'host': host, 'port': '22', 'username': 'root', 'password': 'null', 'db_version': '4.4',
+                 'cluster_name': 'test_cluster', 'seed_node': '10.0.0.1'}, **kwargs)
+
+
+def test_rolling_operation_is_stored_with_installations():
+    database = InstallDatabase()
+    node = submitted_node(host='10.0.0.1')
+    cherrypy.request.json = {'nodes': [node], 'operation': 'upgrade', 'batch_size': 'rack'}
+    Controller(database=database).install()
+    assert database.statements[-1] == ('insert', 'installations', ('global_status', 'host', 'operation', 'batch_size'),
+                                       [('new', '10.0.0.1', 'upgrade', 'rack')])
+    for data in ({'operation': 'reboot'}, {'operation': 'restart', 'batch_size': 0}):
+        cherrypy.request.json = dict(data, nodes=[node])
+        with pytest.raises(expected_exception=cherrypy.HTTPError):
+            Controller(database=database).install()
+
+
+def test_bulk_submission_runs_set_based_statements_in_one_transaction():
+    database = InstallDatabase(active_hosts=['10.0.0.2', '10.0.0.3'])
+    nodes = [submitted_node(host=f'10.0.{x // 250}.{x % 250 + 1}') for x in range(300)]
+    nodes[2]['force_install'] = 'on'
+    cherrypy.request.json = {'nodes': nodes + [submitted_node(host='10.0.0.1', port='2222')]}
+    Controller(database=database).install()
+    assert database.transactions == 1
+    assert [x[:2] for x in database.statements] == [('select', 'nodes'), ('update', 'installations'),
+                                                     ('upsert', 'statistics_facets'), ('upsert', 'nodes'),
+                                                     ('insert', 'installations')]
+    assert database.statements[1][3] == ['10.0.0.3', 'new', 'in progress']
+    # the forced installation is failed with the parameters it was submitted with before
+    assert database.statements[2][3] == [('cluster', 'old_cluster'), ('db_version', '4.3'), ('host', '10.0.0.3'),
+                                         ('os_version', 'None'), ('seed_node', '10.0.0.3'), ('status', 'failed'),
+                                         ('user', 'root')]
+    upserted = database.statements[3][3]
+    assert len(upserted) == 299 and '10.0.0.2' not in [x[0] for x in upserted]
+    assert upserted[0] == ('10.0.0.1', '2222', 'root', 'null', '4.4', 'test_cluster', '10.0.0.1')
+    cherrypy.request.json = {'nodes': [submitted_node(host='10.0.0.4', cluster_name='')]}
+    with pytest.raises(expected_exception=cherrypy.HTTPError, match='cluster_name'):
+        Controller(database=database).install()
+
+
+def test_manifest_is_submitted_to_sqlite_database(tmp_path):
+    database = SQLiteDatabase(database=str(tmp_path / 'installer.sqlite'))
+    create_tables(database=database, template_environment=Environment(loader=FileSystemLoader('templates')),
+                  db_type='sqlite', schema=database.schema)
+    controller = Controller(database=database)
+    manifest = 'host,port,username,password,db_version,cluster_name,seed_node\n' + \
+               '\n'.join([f'10.0.0.{x},22,root,secret,4.4,test_cluster,10.0.0.1' for x in range(1, 101)])
+    response = controller.install_manifest(manifest=FakeUpload(content=manifest, filename='fleet.csv'),
+                                           operation='install', batch_size='1')
+    assert len(response['submitted']) == 100 and response['skipped'] == []
+    manifest = json.dumps({'cluster_name': 'test_cluster', 'seed_node': '10.0.0.1', 'db_version': '4.4',
+                           'username': 'admin', 'nodes': [{'host': '10.0.0.1', 'force_install': True},
+                                                          {'host': '10.0.0.2'}]})
+    response = controller.install_manifest(manifest=FakeUpload(content=manifest, filename='fleet.json'),
+                                           operation='restart', batch_size='rack')
+    assert response == {'submitted': ['10.0.0.1'], 'skipped': ['10.0.0.2']}
+    assert database.execute(query='select global_status, operation from installations where host = %s order by id',
+                            params=('10.0.0.1',)) == [('failed', 'install'), ('new', 'restart')]
+    assert database.execute(query='select username, password from nodes where host in (%s, %s) order by host',
+                            params=('10.0.0.1', '10.0.0.2')) == [('admin', None), ('root', 'c2VjcmV0')]
+    database.close()
+
+
+class FakeUpload:
+    def __init__(self, content, filename):
+        self.file = io.BytesIO(content.encode('utf-8'))
+        self.filename = filename
@@ -0,0 +1,272 @@
+from db_interface.connection_pool import ConnectionPool, ConnectionPoolExhausted
+from db_interface.sql_database_interface import MySQLDatabase, SQLiteDatabase
+from db_interface.migrations import apply_migrations, list_migrations, create_tables
+from db_interface.query_builder import SelectQuery, Join, Operator
+from controller import ControllerDataBase
+from datetime import datetime
+from jinja2 import FileSystemLoader, Environment
+from os import path
+import pytest
+import sqlite3
+import threading
+
+
+class FakeConnection:
+    def __init__(self):
+        self.closed = False
+        self.healthy = True
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture()
+def mysql_database(monkeypatch):
+    database = MySQLDatabase(user='test_user', password='dGVzdF9wYXNzd29yZA==', database='test_db',
+                             host='localhost', port=3306, db_type='mysql')
+    executed = []
+    monkeypatch.setattr(database, 'execute', lambda query, params=None, prepared=False:
+                        executed.append((query, params, prepared)))
+    return database, executed
+
+
+def test_connections_are_reused():
+    created = []
+    pool = ConnectionPool(connection_factory=lambda: created.append(FakeConnection()) or created[-1])
+    for _ in range(5):
+        with pool.connection() as pooled_connection:
+            assert pooled_connection.connection is created[0]
+    assert len(created) == 1
+    assert pool.idle == 1
+
+
+def test_pool_size_is_limited():
+    pool = ConnectionPool(connection_factory=FakeConnection, pool_size=1, acquire_timeout=0.1)
+    with pool.connection():
+        with pytest.raises(expected_exception=ConnectionPoolExhausted):
+            with pool.connection():
+                pass
+
+
+def test_waiting_thread_gets_released_connection():
+    pool = ConnectionPool(connection_factory=FakeConnection, pool_size=1, acquire_timeout=5)
+    acquired = threading.Event()
+    release = threading.Event()
+
+    def hold():
+        with pool.connection():
+            acquired.set()
+            release.wait()
+
+    thread = threading.Thread(target=hold)
+    thread.start()
+    acquired.wait()
+    release.set()
+    with pool.connection():
+        pass
+    thread.join()
+    assert pool.opened == 1
+
+
+def test_old_connections_are_recycled():
+    pool = ConnectionPool(connection_factory=FakeConnection, recycle=0)
+    with pool.connection() as first:
+        pass
+    with pool.connection() as second:
+        pass
+    assert first.connection.closed
+    assert second.connection is not first.connection
+
+
+def test_unhealthy_connections_are_replaced():
+    pool = ConnectionPool(connection_factory=FakeConnection, health_check=lambda x: x.healthy,
+                          health_check_interval=0)
+    with pool.connection() as first:
+        first.connection.healthy = False
+    with pool.connection() as second:
+        pass
+    assert second.connection is not first.connection
+
+
+def test_failed_connection_is_discarded():
+    pool = ConnectionPool(connection_factory=FakeConnection)
+    with pytest.raises(expected_exception=RuntimeError):
+        with pool.connection() as pooled_connection:
+            raise RuntimeError('Lost connection to MySQL server during query')
+    assert pooled_connection.connection.closed
+    assert pool.opened == 0
+
+
+def test_closed_stream_discards_connection():
+    pool = ConnectionPool(connection_factory=FakeConnection)
+
+    def stream():
+        with pool.connection() as pooled_connection:
+            while True:
+                yield pooled_connection
+
+    rows = stream()
+    pooled_connection = next(rows)
+    rows.close()
+    assert pooled_connection.connection.closed
+    assert pool.opened == 0
+
+
+def test_insert_is_parameterised(mysql_database):
+    database, executed = mysql_database
+    database.insert_data(table='statuses', columns=('status_name', 'installation_id'),
+                         values=[("Scylla installed'; drop table nodes; --", 5)])
+    assert executed == [('insert into statuses (status_name, installation_id) values (%s, %s)',
+                         ["Scylla installed'; drop table nodes; --", 5], True)]
+
+
+def test_update_binds_special_values(mysql_database):
+    database, executed = mysql_database
+    database.update_data(table='installations', condition='id = %s', condition_params=(5,),
+                         global_status='failed', finish_timestamp='get_system_timestamp', os_version='null')
+    assert executed == [('update installations set global_status = %s, finish_timestamp = current_timestamp(6), '
+                         'os_version = %s where id = %s', ['failed', None, 5], True)]
+
+
+def test_update_rows_sets_values_per_key(mysql_database):
+    database, executed = mysql_database
+    database.update_rows(table='installations', key_column='id',
+                         rows={5: {'progress': '10%'},
+                               6: {'progress': '20%', 'finish_timestamp': 'get_system_timestamp'}})
+    assert executed == [('update installations set '
+                         'progress = case id when %s then %s when %s then %s else progress end, '
+                         'finish_timestamp = case id when %s then current_timestamp(6) else finish_timestamp end '
+                         'where id in (%s, %s)', [5, '10%', 6, '20%', 6, 5, 6], False)]
+
+
+class FakeMigrationDatabase:
+    def __init__(self, applied=()):
+        self.applied = set(applied)
+        self.statements = []
+
+    def execute(self, query, params=None, prepared=False):
+        self.statements.append(query)
+        if query.startswith('select version'):
+            return [(x,) for x in self.applied]
+        return []
+
+    def insert_data(self, table, columns, values):
+        self.applied.update(x[0] for x in values)
+
+
+def test_migrations_are_applied_once():
+    template_environment = Environment(loader=FileSystemLoader('templates'))
+    database = FakeMigrationDatabase()
+    applied = apply_migrations(database=database, template_environment=template_environment, db_type='mysql',
+                               schema='test_db')
+    assert applied == [path.splitext(path.basename(x))[0]
+                       for x in list_migrations(template_environment=template_environment, db_type='mysql')]
+    assert any(x.startswith('create index installations_status_start_idx on test_db.installations')
+               for x in database.statements)
+    assert apply_migrations(database=database, template_environment=template_environment, db_type='mysql',
+                            schema='test_db') == []
+
+
+def test_upsert_without_update_columns_ignores_duplicates(mysql_database):
+    database, executed = mysql_database
+    database.upsert_data(table='statistics_facets', columns=('facet_name', 'facet_value'),
+                         values=[('host', '10.0.0.1'), ('status', 'failed')])
+    assert executed == [('insert ignore into statistics_facets (facet_name, facet_value) values (%s, %s), (%s, %s)',
+                         ['host', '10.0.0.1', 'status', 'failed'], False)]
+
+
+def test_upsert_updates_given_columns(mysql_database):
+    database, executed = mysql_database
+    database.upsert_data(table='nodes', columns=('host', 'port'), values=[('10.0.0.1', '22')],
+                         update_columns=('port',))
+    assert executed[0][0] == 'insert into nodes (host, port) values (%s, %s) on duplicate key update port = values(port)'
+
+
+@pytest.fixture()
+def sqlite_database(tmp_path):
+    database = SQLiteDatabase(database=str(tmp_path / 'installer.sqlite'))
+    create_tables(database=database, template_environment=Environment(loader=FileSystemLoader('templates')),
+                  db_type='sqlite', schema=database.schema)
+    yield database
+    database.close()
+
+
+def test_sqlite_schema_has_the_mysql_migrations(sqlite_database):
+    template_environment = Environment(loader=FileSystemLoader('templates'))
+    assert [path.basename(x) for x in list_migrations(template_environment=template_environment, db_type='sqlite')] \
+        == [path.basename(x) for x in list_migrations(template_environment=template_environment, db_type='mysql')]
+    assert sqlite_database.execute(query='pragma journal_mode') == [('wal',)]
+    assert len(sqlite_database.execute(query='select version from main.schema_migrations')) == \
+        len(list_migrations(template_environment=template_environment, db_type='sqlite'))
+
+
+def test_sqlite_database_reads_and_writes_like_mysql(sqlite_database):
+    sqlite_database.insert_data(table='nodes', columns=('host', 'port', 'username', 'db_version', 'cluster_name',
+                                                        'seed_node'),
+                                values=[(f'10.0.0.{x}', '22', 'root', '4.4', 'cluster', '10.0.0.1') for x in (1, 2)])
+    sqlite_database.insert_data(table='installations', columns=('global_status', 'host'),
+                                values=[('new', '10.0.0.1'), ('new', '10.0.0.2')])
+    sqlite_database.update_data(table='installations', condition='host = %s', condition_params=('10.0.0.2',),
+                                global_status='failed', finish_timestamp='get_system_timestamp')
+    sqlite_database.upsert_data(table='statistics_facets', columns=('facet_name', 'facet_value'),
+                                values=[('status', 'failed'), ('status', 'failed')])
+    sqlite_database.upsert_data(table='nodes', columns=('host', 'port', 'username', 'db_version', 'cluster_name',
+                                                        'seed_node'),
+                                values=[('10.0.0.2', '2222', 'root', '4.4', 'cluster', '10.0.0.1')],
+                                update_columns=('port',))
+    query = SelectQuery(columns=('nodes.host', 'nodes.port', 'installations.global_status',
+                                 'installations.start_timestamp', 'installations.finish_timestamp'),
+                        joins=(Join.INSTALLATIONS,))
+    query.where('installations.global_status', Operator.IN, ('new', 'failed')).order_by('nodes.host').limit(10)
+    records = sqlite_database.select_data(query=query, columns=('host', 'port', 'status', 'start', 'finish'))
+    assert [(x['host'], x['port'], x['status']) for x in records] == [('10.0.0.1', '22', 'new'),
+                                                                       ('10.0.0.2', '2222', 'failed')]
+    assert isinstance(records[0]['start'], datetime) and records[0]['finish'] is None
+    assert records[1]['finish'] >= records[1]['start']
+    assert list(sqlite_database.iterate_data(query=query, columns=('host', 'port', 'status', 'start', 'finish'),
+                                             batch_size=1)) == records
+    assert sqlite_database.execute(query='select facet_value from statistics_facets') == [('failed',)]
+    with pytest.raises(expected_exception=sqlite3.IntegrityError):
+        # a batch is written by one transaction, so no row of a failed batch is stored
+        sqlite_database.insert_data(table='installations', columns=('global_status', 'host'),
+                                    values=[('new', '10.0.0.1'), ('new', 'unknown_host')])
+    assert len(sqlite_database.execute(query='select id from installations')) == 2
+
+
+def test_sqlite_connections_are_per_thread_and_shared_between_processes(sqlite_database, tmp_path):
+    sqlite_database.insert_data(table='nodes', columns=('host', 'port', 'username', 'db_version', 'cluster_name',
+                                                        'seed_node'),
+                                values=[('10.0.0.1', '22', 'root', '4.4', 'cluster', '10.0.0.1')])
+    sqlite_database.insert_data(table='installations', columns=('global_status', 'host'), values=[('new', '10.0.0.1')])
+    # the second instance stands for the other process, e.g. the controller next to the installer
+    other_process = SQLiteDatabase(database=str(tmp_path / 'installer.sqlite'), busy_timeout=10)
+
+    def write_statuses(database, number):
+        for x in range(20):
+            database.insert_data(table='statuses', columns=('status_name', 'installation_id'),
+                                 values=[(f'status {number} {x}', 1), (f'status {number} {x} again', 1)])
+
+    threads = [threading.Thread(target=write_statuses, args=(x % 2 and other_process or sqlite_database, x))
+               for x in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(other_process.execute(query='select status_name from statuses')) == 8 * 20 * 2
+    # connections of finished threads are closed once another thread connects
+    for _ in range(2):
+        thread = threading.Thread(target=sqlite_database.execute, kwargs={'query': 'select 1'})
+        thread.start()
+        thread.join()
+        assert sqlite_database.opened == 2
+    other_process.close()
+    assert other_process.opened == 0
+
+
+def test_controller_database_is_selected_by_config(tmp_path):
+    config_path = tmp_path / 'installer.conf'
+    config_path.write_text(f'[db]\ntype: "sqlite"\ndatabase: "{tmp_path / "installer.sqlite"}"\nbusy_timeout: "5"\n'
+                           f'[log]\nlog_root_dir: ""\nlog_level: "INFO"\n')
+    database = ControllerDataBase(config_path=str(config_path)).instance
+    assert isinstance(database, SQLiteDatabase)
+    assert database.schema == 'main'
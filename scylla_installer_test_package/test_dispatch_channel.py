@@ -0,0 +1,88 @@
+from dispatch_channel import DispatchNotifier, DispatchListener
+from controller import Controller
+from installer import ScyllaInstaller, InstallationDispatcher
+from db_interface.sql_database_interface import SQLiteDatabase
+from db_interface.migrations import create_tables
+from worker_pool import WorkerPool
+from worker_lease import WorkerLease
+from jinja2 import FileSystemLoader, Environment
+from time import monotonic, sleep
+import cherrypy
+import socket
+import threading
+
+
+class NoFactsGatherer:
+    store = None
+
+    def gather(self, nodes):
+        return {}
+
+
+def test_listener_is_woken_up_by_notification(tmp_path):
+    listener = DispatchListener(socket_dir=str(tmp_path / 'dispatch'), name='installer-1').start()
+    notifier = DispatchNotifier(socket_dir=str(tmp_path / 'dispatch'))
+    assert not listener.wait(timeout=0.01)
+    assert notifier.notify() == 1 and notifier.notify() == 1
+    started = monotonic()
+    assert listener.wait(timeout=5)
+    assert monotonic() - started < 1
+    # notifications which came while the installer was busy wake it up once
+    assert not listener.wait(timeout=0.01)
+    listener.close()
+    assert notifier.notify() == 0
+
+
+def test_stale_socket_is_removed(tmp_path):
+    stale = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+    stale.bind(str(tmp_path / 'installer-2.sock'))
+    stale.close()
+    listener = DispatchListener(socket_dir=str(tmp_path), name='installer-1').start()
+    assert DispatchNotifier(socket_dir=str(tmp_path)).notify() == 1
+    assert [x.name for x in tmp_path.iterdir()] == ['installer-1.sock']
+    listener.close()
+
+
+def test_submission_is_shared_by_two_installers_without_duplicates(tmp_path, monkeypatch):
+    database = SQLiteDatabase(database=str(tmp_path / 'installer.sqlite'))
+    create_tables(database=database, template_environment=Environment(loader=FileSystemLoader('templates')),
+                  db_type='sqlite', schema=database.schema)
+    installed = []
+    monkeypatch.setattr(ScyllaInstaller, 'install',
+                        lambda self: installed.append(self.installation_id) or sleep(0.01))
+    listeners = [DispatchListener(socket_dir=str(tmp_path), name=f'installer-{x}').start() for x in (1, 2)]
+    pools = [WorkerPool(max_workers=4).start() for _ in listeners]
+    dispatchers = [InstallationDispatcher(database=database, log_config={'log_level': 'INFO',
+                                                                         'log_root_dir': str(tmp_path)},
+                                          worker_pool=pool, bootstrap_scheduler=None,
+                                          facts_gatherer=NoFactsGatherer(),
+                                          worker_lease=WorkerLease(database=database,
+                                                                   worker_id=f'worker {number}'))
+                   for number, pool in enumerate(pools)]
+    cherrypy.request.json = {'nodes': [{'host': f'10.0.0.{x}', 'port': '22', 'username': 'root', 'password': 'null',
+                                        'db_version': '4.4', 'cluster_name': f'cluster_{x % 8}',
+                                        'seed_node': '10.0.0.1'} for x in range(1, 41)]}
+    Controller(database=database, dispatch_notifier=DispatchNotifier(socket_dir=str(tmp_path))).install()
+    assert all(x.wait(timeout=5) for x in listeners)
+    claimed = {}
+
+    def run_worker(dispatcher, listener):
+        # a worker takes over one cluster of 5 nodes per poll and polls again when its jobs are done
+        while database.execute(query='select id from installations where global_status = %s', params=('new',)):
+            claimed[dispatcher.worker_id] = claimed.get(dispatcher.worker_id, 0) + dispatcher.poll()
+            listener.wait(timeout=0.05)
+
+    threads = [threading.Thread(target=run_worker, args=x) for x in zip(dispatchers, listeners)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    for pool in pools:
+        pool.shutdown()
+    assert sum(claimed.values()) == 40 and sorted(installed) == list(range(1, 41))
+    workers = database.execute(query='select worker_id, count(*) from installations where global_status = %s '
+                                     'group by worker_id', params=('in progress',))
+    assert sum(x[1] for x in workers) == 40 and {x[0] for x in workers} <= {'worker 0', 'worker 1'}
+    for listener in listeners:
+        listener.close()
+    database.close()
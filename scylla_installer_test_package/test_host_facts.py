@@ -0,0 +1,118 @@
+from host_facts import HostFacts, HostFactsStore, HostFactsGatherer, HostFactsError, FACT_COMMANDS
+from ssh_interface.command_batch import StepResult
+from ssh_interface.ssh import SSHConnection, SSHSessionPool
+from scylla_installer_test_package.fake_ssh_server import FakeSSHServer, shell_command_handler
+from datetime import datetime, timedelta
+from time import monotonic, sleep
+import os
+import pytest
+
+FACT_OUTPUT = [['NAME="Ubuntu"\n', 'ID=ubuntu\n', 'VERSION_ID="20.04"\n', '\n'], ['ens5\n', 'enp0s3\n'], ['8\n'],
+               ['16318480\n'], ['nvme0n1 1000204886016\n', 'nvme1n1 500107862016\n'], ['4.4.3-0.20210609\n']]
+
+
+class FactsDatabase:
+    def __init__(self, records=()):
+        self.records = list(records)
+        self.queries = []
+        self.upserts = []
+
+    def select_data(self, query, columns):
+        self.queries.append(query.build())
+        hosts = query.params[:-1]
+        cutoff = query.params[-1]
+        return [dict(zip(columns, x)) for x in self.records if x[0] in hosts and x[-1] >= cutoff]
+
+    def upsert_data(self, table, columns, values, update_columns=()):
+        self.upserts.append((table, values))
+        self.records = [x for x in self.records if x[0] not in [y[0] for y in values]] + list(values)
+
+
+def batch_results(batch, outputs, exit_code=0):
+    return [StepResult(command=command, stdout=output, stderr=[] if exit_code == 0 else ['No such file\n'],
+                       exit_code=exit_code, duration=0.01) for command, output in zip(batch.commands, outputs)]
+
+
+def test_facts_are_parsed_from_one_batch():
+    batch = HostFacts.batch()
+    assert batch.commands == [x[1] for x in FACT_COMMANDS]
+    facts = HostFacts.from_results(host='node_1', batch=batch, results=batch_results(batch, FACT_OUTPUT))
+    assert facts.os_release == {'NAME': 'Ubuntu', 'ID': 'ubuntu', 'VERSION_ID': '20.04'}
+    assert facts.nic_names == ['ens5', 'enp0s3']
+    assert (facts.cpu_count, facts.memory_mb) == (8, 15936)
+    assert facts.disks == [{'name': 'nvme0n1', 'size_bytes': 1000204886016},
+                           {'name': 'nvme1n1', 'size_bytes': 500107862016}]
+    assert facts.scylla_version == '4.4.3-0.20210609'
+    with pytest.raises(expected_exception=HostFactsError, match='No such file'):
+        HostFacts.from_results(host='node_1', batch=batch, results=batch_results(batch, FACT_OUTPUT[:1], exit_code=1))
+
+
+def test_store_returns_only_fresh_facts():
+    batch = HostFacts.batch()
+    fresh = HostFacts.from_results(host='node_1', batch=batch, results=batch_results(batch, FACT_OUTPUT))
+    stale = HostFacts(host='node_2', os_release={'ID': 'centos', 'VERSION_ID': '7'},
+                      gathered_timestamp=datetime.now() - timedelta(hours=2))
+    database = FactsDatabase()
+    store = HostFactsStore(database=database, ttl=3600)
+    store.save(facts=[fresh, stale])
+    assert database.upserts[0][0] == 'host_facts'
+    facts = store.fresh_facts(hosts=['node_1', 'node_2', 'node_3'])
+    assert list(facts) == ['node_1']
+    assert facts['node_1'].os_release == {'ID': 'ubuntu', 'VERSION_ID': '20.04'}
+    assert facts['node_1'].disks == fresh.disks
+    assert store.get(host='node_2') is None
+    assert store.fresh_facts(hosts=[]) == {}
+    assert len(database.queries) == 2
+
+
+def test_gatherer_reads_missing_hosts_with_one_call_each(tmp_path):
+    server = FakeSSHServer(command_handler=shell_command_handler(working_dir=str(tmp_path)), home=str(tmp_path))
+    session_pool = SSHSessionPool()
+    cached = HostFacts(host='cached_node', os_release={'ID': 'ubuntu', 'VERSION_ID': '20.04'})
+    database = FactsDatabase(records=[cached.to_row()])
+    host = server.host
+    try:
+        gatherer = HostFactsGatherer(store=HostFactsStore(database=database), max_workers=4,
+                                     connection_class=lambda **kwargs: SSHConnection(session_pool=session_pool,
+                                                                                     **kwargs))
+        nodes = [{'host': x, 'port': server.port, 'username': 'root', 'password': 'dGVzdF9wYXNzd29yZA=='}
+                 for x in ('cached_node', host)]
+        facts = gatherer.gather(nodes=nodes)
+    finally:
+        session_pool.close_all()
+        server.stop()
+    assert sorted(facts) == sorted(['cached_node', host])
+    assert len(server.commands) == 1
+    assert facts[host].cpu_count == len(os.sched_getaffinity(0))
+    assert facts[host].os_release['ID']
+    assert [x[0] for x in database.records] == ['cached_node', host]
+
+
+class SlowConnection:
+    def __init__(self, host, delay, **kwargs):
+        self._host = host
+        self._delay = delay
+
+    def execute_batch(self, batch):
+        sleep(self._delay.get(self._host, 0))
+        return batch_results(batch, FACT_OUTPUT), [], 0
+
+    def close(self):
+        pass
+
+
+def test_gatherer_does_not_wait_for_unreachable_host():
+    database = FactsDatabase()
+    delay = {'slow_node': 0.5}
+    gatherer = HostFactsGatherer(store=HostFactsStore(database=database), timeout=0.05,
+                                 connection_class=lambda **kwargs: SlowConnection(delay=delay, **kwargs))
+    nodes = [{'host': x, 'port': 22, 'username': 'root', 'password': 'null'} for x in ('slow_node', 'node_1')]
+    started = monotonic()
+    facts = gatherer.gather(nodes=nodes)
+    assert monotonic() - started < 0.4
+    assert list(facts) == ['node_1']
+    # the late facts are still saved for the installation of the slow host
+    deadline = monotonic() + 5
+    while len(database.records) < 2 and monotonic() < deadline:
+        sleep(0.01)
+    assert sorted(x[0] for x in database.records) == ['node_1', 'slow_node']
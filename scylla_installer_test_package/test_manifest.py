@@ -0,0 +1,30 @@
+from manifest import parse_manifest, InvalidManifest
+import pytest
+
+
+def test_csv_and_json_manifests_give_the_same_nodes():
+    csv_manifest = b'\xef\xbb\xbfhost,port,username,password,db_version,cluster_name,seed_node,force_install\r\n' \
+                   b'10.0.0.1,22,root,,4.4,test_cluster,10.0.0.1,false\r\n' \
+                   b' 10.0.0.2 ,,root,secret,4.4,test_cluster,10.0.0.1,yes\r\n'
+    json_manifest = '{"db_version": "4.4", "cluster_name": "test_cluster", "seed_node": "10.0.0.1", "nodes": [' \
+                    '{"host": "10.0.0.1", "port": 22, "username": "root"}, ' \
+                    '{"host": "10.0.0.2", "username": "root", "password": "secret", "force_install": true}]}'
+    nodes = parse_manifest(content=csv_manifest, filename='fleet.csv')
+    assert nodes == parse_manifest(content=json_manifest, filename='fleet.json')
+    assert nodes[0] == {'host': '10.0.0.1', 'port': '22', 'username': 'root', 'password': 'null', 'db_version': '4.4',
+                        'cluster_name': 'test_cluster', 'seed_node': '10.0.0.1', 'force_install': False}
+    assert (nodes[1]['host'], nodes[1]['port'], nodes[1]['force_install']) == ('10.0.0.2', '22', True)
+
+
+@pytest.mark.parametrize('content, error', [
+    ('', 'header'),
+    ('host,username\n', 'no nodes'),
+    ('host,username,db_version,cluster_name,seed_node\n10.0.0.1,root,4.4,,10.0.0.1\n', 'no cluster_name'),
+    ('[{"host": "10.0.0.1", "port": "ssh", "username": "root", "db_version": "4.4", "cluster_name": "c", '
+     '"seed_node": "10.0.0.1"}]', 'invalid SSH port'),
+    ('{"nodes": "10.0.0.1"}', 'list of nodes'),
+    ('[{"host": ', 'not valid JSON'),
+])
+def test_invalid_manifests_are_rejected(content, error):
+    with pytest.raises(expected_exception=InvalidManifest, match=error):
+        parse_manifest(content=content)
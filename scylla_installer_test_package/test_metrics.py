@@ -0,0 +1,70 @@
+from metrics import MetricsRegistry, MetricTypeMismatch, read_snapshot, render, command_name, worker_snapshot_path
+from controller import Controller
+import os
+import pytest
+
+
+def test_histogram_renders_cumulative_buckets():
+    registry = MetricsRegistry()
+    histogram = registry.histogram('installer_command_seconds', 'Duration of commands', ('host',), buckets=(1, 10))
+    histogram.observe(0.5, host='10.0.0.1')
+    histogram.observe(5, host='10.0.0.1')
+    histogram.observe(50, host='10.0.0.1')
+    assert render(process_families=[('installer', registry.families())]).splitlines() == [
+        '# HELP installer_command_seconds Duration of commands',
+        '# TYPE installer_command_seconds histogram',
+        'installer_command_seconds_bucket{host="10.0.0.1",le="1",process="installer"} 1',
+        'installer_command_seconds_bucket{host="10.0.0.1",le="10",process="installer"} 2',
+        'installer_command_seconds_bucket{host="10.0.0.1",le="+Inf",process="installer"} 3',
+        'installer_command_seconds_sum{host="10.0.0.1",process="installer"} 55.5',
+        'installer_command_seconds_count{host="10.0.0.1",process="installer"} 3']
+
+
+def test_families_of_processes_are_merged():
+    controller_registry = MetricsRegistry()
+    installer_registry = MetricsRegistry()
+    for registry, count in ((controller_registry, 2), (installer_registry, 5)):
+        registry.counter('installer_database_query_errors_total', 'Failed queries', ('operation',)).inc(
+            count, operation='select')
+    lines = render(process_families=[('controller', controller_registry.families()),
+                                     ('installer', installer_registry.families())]).splitlines()
+    assert lines.count('# TYPE installer_database_query_errors_total counter') == 1
+    assert lines[-2:] == ['installer_database_query_errors_total{operation="select",process="controller"} 2',
+                          'installer_database_query_errors_total{operation="select",process="installer"} 5']
+
+
+def test_metric_name_keeps_its_type():
+    registry = MetricsRegistry()
+    assert registry.counter('installer_steps_total', 'Steps') is registry.counter('installer_steps_total', 'Steps')
+    with pytest.raises(expected_exception=MetricTypeMismatch):
+        registry.histogram('installer_steps_total', 'Steps')
+
+
+def test_snapshot_is_served_until_it_is_stale(tmp_path):
+    registry = MetricsRegistry()
+    registry.gauge('installer_queue_depth', 'Queued installations', function=lambda: 7)
+    snapshot_path = str(tmp_path / 'installer_metrics.json')
+    registry.write_snapshot(snapshot_path=snapshot_path)
+    assert read_snapshot(snapshot_path=snapshot_path, max_age=60) == registry.families()
+    os.utime(snapshot_path, (0, 0))
+    assert read_snapshot(snapshot_path=snapshot_path, max_age=60) == []
+    assert read_snapshot(snapshot_path=str(tmp_path / 'missing.json'), max_age=60) == []
+
+
+def test_controller_serves_installer_metrics(tmp_path):
+    registry = MetricsRegistry()
+    registry.gauge('installer_active_workers', 'Running installations', function=lambda: 3)
+    snapshot_path = str(tmp_path / 'installer_metrics.json')
+    registry.write_snapshot(snapshot_path=snapshot_path)
+    response = Controller(database=object(), installer_metrics_file=snapshot_path).metrics()
+    assert 'installer_active_workers{process="installer"} 3\n' in response
+    # several installer workers write a snapshot each
+    registry.write_snapshot(snapshot_path=worker_snapshot_path(snapshot_path=snapshot_path, worker=2))
+    response = Controller(database=object(), installer_metrics_file=snapshot_path).metrics()
+    assert 'installer_active_workers{process="installer-2"} 3\n' in response
+
+
+def test_command_label_is_the_program_only():
+    assert command_name('/usr/bin/nodetool status') == 'nodetool'
+    assert command_name('curl -o /etc/yum.repos.d/scylla.repo -L "http://host/a b"') == 'curl'
+    assert command_name('echo "unbalanced') == 'echo'
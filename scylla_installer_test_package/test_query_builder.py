@@ -0,0 +1,57 @@
+from db_interface.query_builder import SelectQuery, Join, Operator, InvalidQuery, render_select
+import pytest
+
+
+def test_select_with_joins_and_filters():
+    query = SelectQuery(columns=('nodes.host', 'statuses.status_name'), joins=(Join.INSTALLATIONS, Join.STATUSES))
+    query.where('nodes.host', Operator.EQ, "10.0.0.1' or '1' = '1")
+    statement, params = query.build()
+    assert statement == ('select nodes.host, statuses.status_name from nodes '
+                         'join installations on nodes.host = installations.host '
+                         'join statuses on installations.id = statuses.installation_id where nodes.host = %s')
+    assert params == ["10.0.0.1' or '1' = '1"]
+
+
+def test_all_operators():
+    query = SelectQuery(columns=('nodes.host',), joins=(Join.INSTALLATIONS,), distinct=True)
+    query.where('installations.start_timestamp', Operator.BETWEEN, ('2021-01-01 00:00', '2021-12-31 23:59'))
+    query.where('installations.global_status', Operator.IN, ('failed', 'succeeded'))
+    query.where('nodes.os_version', Operator.IS_NULL)
+    query.where('installations.id', Operator.GT, 10)
+    query.order_by(('installations.id', 'desc')).limit(50)
+    statement, params = query.build()
+    assert statement == ('select distinct nodes.host from nodes join installations on nodes.host = installations.host '
+                         'where installations.start_timestamp between %s and %s and installations.global_status '
+                         'in (%s, %s) and nodes.os_version is null and installations.id > %s '
+                         'order by installations.id desc limit %s')
+    assert params == ['2021-01-01 00:00', '2021-12-31 23:59', 'failed', 'succeeded', 10, 50]
+
+
+def test_statements_are_cached_by_shape():
+    render_select.cache_clear()
+    for host in ('10.0.0.1', '10.0.0.2', '10.0.0.3'):
+        SelectQuery(columns=('nodes.host',)).where('nodes.host', Operator.EQ, host).build()
+    assert render_select.cache_info().hits == 2
+    assert render_select.cache_info().misses == 1
+
+
+def test_invalid_queries_are_rejected():
+    with pytest.raises(expected_exception=InvalidQuery):
+        SelectQuery(columns=('nodes.host',)).where('nodes.host', Operator.IN, [])
+    with pytest.raises(expected_exception=InvalidQuery):
+        SelectQuery(columns=('nodes.host',)).order_by(('nodes.host', 'sideways'))
+
+
+def test_keyset_filter():
+    query = SelectQuery(columns=('nodes.host',), joins=(Join.INSTALLATIONS,))
+    query.where(('installations.start_timestamp', 'installations.id'), Operator.BEFORE,
+                ('2021-06-01 10:00:00', 42))
+    query.order_by(('installations.start_timestamp', 'desc'), ('installations.id', 'desc')).limit(201)
+    statement, params = query.build()
+    assert statement == ('select nodes.host from nodes join installations on nodes.host = installations.host '
+                         'where (installations.start_timestamp < %s or (installations.start_timestamp = %s and '
+                         'installations.id < %s)) order by installations.start_timestamp desc, '
+                         'installations.id desc limit %s')
+    assert params == ['2021-06-01 10:00:00', '2021-06-01 10:00:00', 42, 201]
+    with pytest.raises(expected_exception=InvalidQuery):
+        SelectQuery(columns=('nodes.host',)).where(('nodes.host',), Operator.AFTER, ('10.0.0.1',))
@@ -0,0 +1,180 @@
+from readiness import NodeReadiness, ReadinessTimeout, ExponentialBackoff, wait_until, async_wait_until
+from bootstrap import ClusterBootstrapScheduler, AsyncClusterBootstrapScheduler, SeedNodeFailed
+import asyncio
+import pytest
+import threading
+from time import sleep
+
+NODETOOL_STATUS = ['Datacenter: datacenter1\n',
+                   '--  Address    Load       Tokens  Owns  Host ID                               Rack\n',
+                   'UN  10.0.0.1   1.1 MB     256     ?     7c1e0ea6-1111-4e0b-a1a5-0b5c1f1e2d11  rack1\n',
+                   'UJ  10.0.0.2   512 KB     256     ?     8d2f1fb7-2222-4e0b-a1a5-0b5c1f1e2d22  rack1\n']
+
+GOSSIP_INFO = ['/10.0.0.2\n', '  generation:1620000000\n', '  STATUS:14:BOOT,-123\n',
+               '/10.0.0.1\n', '  generation:1620000000\n', '  STATUS:20:NORMAL,-456\n']
+
+
+def fake_executor(stdout, exit_code=0):
+    return lambda command: (stdout, [], exit_code)
+
+
+def test_backoff_delays_are_capped():
+    delays = ExponentialBackoff(initial_delay=1, max_delay=5, factor=2).delays()
+    assert [next(delays) for _ in range(5)] == [1, 2, 4, 5, 5]
+
+
+def test_wait_until_polls_until_probe_passes():
+    answers = iter([False, False, True])
+    pauses = []
+    wait_until(probe=lambda: next(answers), timeout=60, description='test state', sleep_function=pauses.append)
+    assert pauses == [1.0, 2.0]
+
+
+def test_wait_until_deadline():
+    with pytest.raises(expected_exception=ReadinessTimeout):
+        wait_until(probe=lambda: False, timeout=0.05, description='test state',
+                   backoff=ExponentialBackoff(initial_delay=0.01))
+
+
+def test_up_normal_state():
+    readiness = NodeReadiness(execute_command=fake_executor(NODETOOL_STATUS), host='10.0.0.1')
+    assert readiness.up_normal()
+    assert not readiness.up_normal(address='10.0.0.2')
+
+
+def test_cluster_status_lists_nodes_with_racks():
+    readiness = NodeReadiness(execute_command=fake_executor(NODETOOL_STATUS), host='10.0.0.1')
+    assert readiness.cluster_status() == {'10.0.0.1': ('UN', 'rack1'), '10.0.0.2': ('UJ', 'rack1')}
+    assert NodeReadiness(execute_command=fake_executor([], exit_code=1), host='10.0.0.1').cluster_status() == {}
+
+
+def test_gossip_membership():
+    readiness = NodeReadiness(execute_command=fake_executor(GOSSIP_INFO), host='10.0.0.2')
+    assert readiness.knows_gossip_peer(address='10.0.0.1')
+    assert not readiness.knows_gossip_peer(address='10.0.0.2')
+
+
+def test_non_seed_starts_once_seed_is_ready():
+    scheduler = ClusterBootstrapScheduler(readiness_timeout=5)
+    scheduler.register_seed(cluster_name='test_cluster')
+    joined = threading.Event()
+
+    def join():
+        with scheduler.join_slot(cluster_name='test_cluster', wait_for_seed=lambda: None):
+            joined.set()
+
+    thread = threading.Thread(target=join)
+    thread.start()
+    sleep(0.1)
+    assert not joined.is_set()
+    scheduler.seed_ready(cluster_name='test_cluster')
+    thread.join(timeout=5)
+    assert joined.is_set()
+
+
+def test_non_seed_fails_with_seed():
+    scheduler = ClusterBootstrapScheduler(readiness_timeout=5)
+    scheduler.register_seed(cluster_name='test_cluster')
+    errors = []
+    probes = []
+
+    def join():
+        with scheduler.installation(cluster_name='test_cluster', is_seed=False):
+            try:
+                with scheduler.join_slot(cluster_name='test_cluster', wait_for_seed=lambda: probes.append(1)):
+                    pass
+            except SeedNodeFailed as ex:
+                errors.append(ex)
+
+    thread = threading.Thread(target=join)
+    thread.start()
+    sleep(0.1)
+    with pytest.raises(expected_exception=OSError):
+        with scheduler.installation(cluster_name='test_cluster', is_seed=True):
+            raise OSError('Installation of the seed failed')
+    thread.join(timeout=5)
+    assert len(errors) == 1 and probes == []
+    # the seed may be fixed by hand, so a later node probes it instead of failing at once
+    with scheduler.installation(cluster_name='test_cluster', is_seed=False):
+        with scheduler.join_slot(cluster_name='test_cluster', wait_for_seed=lambda: probes.append(1)):
+            pass
+    assert probes == [1]
+    assert len(scheduler) == 0
+
+
+def test_seed_failing_after_it_was_ready_does_not_fail_the_others():
+    scheduler = ClusterBootstrapScheduler(readiness_timeout=5)
+    scheduler.register_seed(cluster_name='test_cluster')
+    with scheduler.installation(cluster_name='test_cluster', is_seed=False):
+        with pytest.raises(expected_exception=OSError):
+            with scheduler.installation(cluster_name='test_cluster', is_seed=True):
+                scheduler.seed_ready(cluster_name='test_cluster')
+                raise OSError('Stress test failed')
+        with scheduler.join_slot(cluster_name='test_cluster', wait_for_seed=lambda: None):
+            pass
+    assert len(scheduler) == 0
+
+
+def test_concurrent_joins_are_limited():
+    scheduler = ClusterBootstrapScheduler(concurrent_joins=2, readiness_timeout=5)
+    scheduler.seed_ready(cluster_name='test_cluster')
+    active = []
+    peak = []
+    lock = threading.Lock()
+
+    def join():
+        with scheduler.join_slot(cluster_name='test_cluster', wait_for_seed=lambda: None):
+            with lock:
+                active.append(1)
+                peak.append(len(active))
+            sleep(0.05)
+            with lock:
+                active.pop()
+
+    threads = [threading.Thread(target=join) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert max(peak) == 2
+
+
+def test_async_wait_until_polls_until_probe_passes():
+    answers = iter([False, False, True])
+
+    async def probe():
+        return next(answers)
+
+    asyncio.run(async_wait_until(probe=probe, timeout=5, description='test state',
+                                 backoff=ExponentialBackoff(initial_delay=0.01)))
+    with pytest.raises(expected_exception=ReadinessTimeout):
+        asyncio.run(async_wait_until(probe=probe, timeout=0.05, description='test state',
+                                     backoff=ExponentialBackoff(initial_delay=0.01)))
+
+
+def test_async_non_seed_waits_for_seed_and_join_slot():
+    scheduler = AsyncClusterBootstrapScheduler(concurrent_joins=2, readiness_timeout=5)
+    scheduler.register_seed(cluster_name='test_cluster')
+    active = []
+    peak = []
+
+    async def wait_for_seed():
+        raise AssertionError('the seed is installed by this process')
+
+    async def join():
+        async with scheduler.join_slot(cluster_name='test_cluster', wait_for_seed=wait_for_seed):
+            active.append(1)
+            peak.append(len(active))
+            await asyncio.sleep(0.01)
+            active.pop()
+
+    async def install_cluster():
+        joins = [asyncio.ensure_future(join()) for _ in range(6)]
+        await asyncio.sleep(0.05)
+        assert peak == []
+        scheduler.seed_ready(cluster_name='test_cluster')
+        await asyncio.gather(*joins)
+
+    asyncio.run(install_cluster())
+    assert max(peak) == 2
+    assert len(peak) == 6
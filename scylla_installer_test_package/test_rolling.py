@@ -0,0 +1,112 @@
+from rolling import RollingOperation, RollingOperationFailed, plan_batches, is_valid_batch_size
+from readiness import ReadinessTimeout
+from worker_pool import JobCancelled
+import threading
+import pytest
+
+
+class FakeCluster:
+    def __init__(self, racks):
+        self.racks = racks
+        self.down = set()
+        self.events = []
+        self.lock = threading.Lock()
+
+
+class FakeNodeOperation:
+    def __init__(self, cluster, host, fails=False):
+        self._cluster = cluster
+        self.host = host
+        self.fails = fails
+        self.aborted = None
+
+    def install(self):
+        with self._cluster.lock:
+            self._cluster.events.append(('down', self.host, frozenset(self._cluster.down)))
+            self._cluster.down.add(self.host)
+        if self.fails:
+            raise RuntimeError('apt-get failed')
+        with self._cluster.lock:
+            self._cluster.down.discard(self.host)
+
+    def cluster_status(self):
+        if self.host in self._cluster.down:
+            raise ConnectionError('nodetool is not available')
+        self._cluster.events.append(('status', self.host, frozenset(self._cluster.down)))
+        return {host: ('DN' if host in self._cluster.down else 'UN', rack)
+                for host, rack in self._cluster.racks.items()}
+
+    def abort(self, reason):
+        self.aborted = reason
+
+
+def test_batches_never_span_racks():
+    racks = {'10.0.0.1': 'rack1', '10.0.0.2': 'rack2', '10.0.0.3': 'rack1', '10.0.0.4': 'rack1', '10.0.0.5': 'rack3'}
+    hosts = ['10.0.0.1', '10.0.0.2', '10.0.0.3', '10.0.0.4', '10.0.0.5']
+    assert plan_batches(hosts=hosts, racks=racks, batch_size='2') == [['10.0.0.1', '10.0.0.3'], ['10.0.0.4'],
+                                                                        ['10.0.0.2'], ['10.0.0.5']]
+    assert plan_batches(hosts=hosts, racks=racks, batch_size='rack') == [['10.0.0.1', '10.0.0.3', '10.0.0.4'],
+                                                                           ['10.0.0.2'], ['10.0.0.5']]
+    assert [is_valid_batch_size(x) for x in ('1', '12', 'rack', '0', '-1', 'all')] == [True, True, True, False,
+                                                                                        False, False]
+
+
+def test_nodes_are_taken_down_one_by_one_when_racks_do_not_keep_quorum():
+    hosts = ['10.0.0.1', '10.0.0.2', '10.0.0.3']
+    one_by_one = [['10.0.0.1'], ['10.0.0.2'], ['10.0.0.3']]
+    # a single rack holds all replicas of every range
+    single_rack = dict.fromkeys(hosts, 'rack1')
+    assert plan_batches(hosts=hosts, racks=single_rack, batch_size='rack') == one_by_one
+    assert plan_batches(hosts=hosts, racks=single_rack, batch_size='3') == one_by_one
+    # fewer racks than replicas, or too few replicas for any node to go down with another one
+    two_racks = {'10.0.0.1': 'rack1', '10.0.0.2': 'rack1', '10.0.0.3': 'rack2'}
+    assert plan_batches(hosts=hosts, racks=two_racks, batch_size='rack') == one_by_one
+    three_racks = {'10.0.0.1': 'rack1', '10.0.0.2': 'rack1', '10.0.0.3': 'rack2', '10.0.0.4': 'rack3'}
+    assert plan_batches(hosts=hosts, racks=three_racks, batch_size='rack', replication_factor=2) == one_by_one
+    assert plan_batches(hosts=hosts, racks=three_racks, batch_size='rack') == [['10.0.0.1', '10.0.0.2'],
+                                                                                 ['10.0.0.3']]
+    # hosts submitted by name are not found in nodetool status, their racks are unknown
+    assert plan_batches(hosts=['node1', 'node2', 'node3'], racks=three_racks, batch_size='rack') == \
+        [['node1'], ['node2'], ['node3']]
+
+
+def test_rolling_operation_gates_batches_on_cluster_health():
+    cluster = FakeCluster(racks={'10.0.0.1': 'rack1', '10.0.0.2': 'rack1', '10.0.0.3': 'rack2', '10.0.0.4': 'rack3'})
+    # the third rack of the cluster is not part of the operation
+    operations = [FakeNodeOperation(cluster=cluster, host=x) for x in ('10.0.0.1', '10.0.0.2', '10.0.0.3')]
+    RollingOperation(cluster_name='test_cluster', operation='restart', node_operations=operations,
+                     batch_size='rack', sleep_function=lambda delay: None).run()
+    downs = [x for x in cluster.events if x[0] == 'down']
+    # a rack goes down as a whole while the other rack is up
+    assert [x[1] for x in downs] == ['10.0.0.1', '10.0.0.2', '10.0.0.3']
+    assert all(not x[2] for x in cluster.events if x[0] == 'status')
+    assert [x[1] for x in cluster.events if x[0] == 'status'][:3] == ['10.0.0.1', '10.0.0.3', '10.0.0.1']
+
+
+def test_failed_batch_stops_rolling_operation():
+    cluster = FakeCluster(racks={'10.0.0.1': 'rack1', '10.0.0.2': 'rack1', '10.0.0.3': 'rack1'})
+    operations = [FakeNodeOperation(cluster=cluster, host=x, fails=x == '10.0.0.1') for x in cluster.racks]
+    rolling_operation = RollingOperation(cluster_name='test_cluster', operation='upgrade', node_operations=operations,
+                                         sleep_function=lambda delay: None)
+    with pytest.raises(expected_exception=RollingOperationFailed, match='10.0.0.1'):
+        rolling_operation.run()
+    assert [x[1] for x in cluster.events if x[0] == 'down'] == ['10.0.0.1']
+    assert [x.aborted is not None for x in operations] == [False, True, True]
+
+
+def test_rolling_operation_waits_for_down_node_and_can_be_cancelled():
+    cluster = FakeCluster(racks={'10.0.0.1': 'rack1', '10.0.0.2': 'rack1'})
+    cluster.down.add('10.0.0.9')
+    cluster.racks['10.0.0.9'] = 'rack1'
+    operations = [FakeNodeOperation(cluster=cluster, host=x) for x in ('10.0.0.1', '10.0.0.2')]
+    rolling_operation = RollingOperation(cluster_name='test_cluster', operation='restart', node_operations=operations,
+                                         health_timeout=0.05, sleep_function=lambda delay: None)
+    with pytest.raises(expected_exception=ReadinessTimeout):
+        rolling_operation.run()
+    assert not [x for x in cluster.events if x[0] == 'down']
+    cancel_event = threading.Event()
+    rolling_operation = RollingOperation(cluster_name='test_cluster', operation='restart', node_operations=operations,
+                                         health_timeout=60, cancel_event=cancel_event)
+    threading.Timer(0.05, cancel_event.set).start()
+    with pytest.raises(expected_exception=JobCancelled):
+        rolling_operation.run()
@@ -0,0 +1,178 @@
+from ssh_interface.ssh import SSHConnection, SSHSessionPool, FileTransferError, upload_to_hosts
+from ssh_interface.command_output import OutputTail, CommandInterrupted, MAX_LINE_LENGTH
+from scylla_installer_test_package.fake_ssh_server import FakeSSHServer, shell_command_handler
+from worker_pool import WorkerPool, Job, JobState
+import pytest
+import threading
+from time import sleep, monotonic
+
+
+@pytest.fixture()
+def ssh_server():
+    server = FakeSSHServer()
+    yield server
+    server.stop()
+
+
+@pytest.fixture()
+def session_pool():
+    pool = SSHSessionPool(max_connections=2, idle_timeout=60)
+    yield pool
+    pool.close_all()
+
+
+def make_connection(server, pool, user='test_user'):
+    return SSHConnection(host=server.host, port=server.port, user=user, password='dGVzdF9wYXNzd29yZA==',
+                         session_pool=pool)
+
+
+def test_commands_share_one_transport(ssh_server, session_pool):
+    connection = make_connection(ssh_server, session_pool)
+    for _ in range(5):
+        stdout, stderr, exit_code = connection.execute_command('echo "Hello world!"')
+        assert stdout == ['Command executed successfully\n']
+        assert exit_code == 0
+    assert ssh_server.connection_count == 1
+    assert len(ssh_server.commands) == 5
+
+
+def test_sudo_prefix_is_applied(ssh_server, session_pool):
+    make_connection(ssh_server, session_pool).execute_command('apt-get update')
+    assert ssh_server.commands == ["echo test_password | sudo -S --prompt='' apt-get update"]
+
+
+def test_reconnect_after_transport_drop(ssh_server, session_pool):
+    connection = make_connection(ssh_server, session_pool)
+    connection.execute_command('uptime')
+    ssh_server.drop_connections()
+    sleep(0.2)
+    stdout, stderr, exit_code = connection.execute_command('uptime')
+    assert exit_code == 0
+    assert ssh_server.connection_count == 2
+
+
+def test_idle_sessions_are_evicted(ssh_server):
+    pool = SSHSessionPool(idle_timeout=0)
+    connection = make_connection(ssh_server, pool)
+    connection.execute_command('uptime')
+    assert pool.evict_idle() == 1
+    assert len(pool) == 0
+    connection.execute_command('uptime')
+    assert ssh_server.connection_count == 2
+    pool.close_all()
+
+
+def test_connection_cap_evicts_least_recently_used(ssh_server, session_pool):
+    for user in ('user_one', 'user_two', 'user_three'):
+        make_connection(ssh_server, session_pool, user=user).execute_command('uptime')
+    assert len(session_pool) == session_pool.max_connections
+    assert ssh_server.connection_count == 3
+
+
+def test_close_releases_session(ssh_server, session_pool):
+    connection = make_connection(ssh_server, session_pool)
+    connection.execute_command('uptime')
+    connection.close()
+    assert len(session_pool) == 0
+
+
+@pytest.fixture()
+def shell_server(tmp_path):
+    server = FakeSSHServer(command_handler=shell_command_handler(working_dir=str(tmp_path)), home=str(tmp_path))
+    yield server
+    server.stop()
+
+
+def test_upload_moves_file_into_place(shell_server, session_pool, tmp_path):
+    connection = make_connection(shell_server, session_pool, user='root')
+    destination = tmp_path / 'etc' / 'scylla.yaml'
+    destination.parent.mkdir()
+    content = b'cluster_name: "test \'cluster\'"\nseed_provider: $(reboot)\n'
+    assert connection.upload(content=content, remote_path=str(destination))
+    assert destination.read_bytes() == content
+    assert oct(destination.stat().st_mode)[-3:] == '644'
+    assert sorted(x.name for x in tmp_path.rglob('*')) == ['etc', 'scylla.yaml']
+    assert not connection.upload(content=content, remote_path=str(destination))
+    assert len([x for x in shell_server.commands if x.startswith('bash -c')]) == 1
+
+
+def test_upload_to_missing_directory_fails(shell_server, session_pool, tmp_path):
+    connection = make_connection(shell_server, session_pool, user='root')
+    with pytest.raises(expected_exception=FileTransferError):
+        connection.upload(content=b'data', remote_path=str(tmp_path / 'missing' / 'scylla.yaml'))
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_upload_fans_out_to_hosts(tmp_path):
+    homes = [tmp_path / str(x) for x in range(3)]
+    servers = []
+    for home in homes:
+        home.mkdir()
+        servers.append(FakeSSHServer(command_handler=shell_command_handler(working_dir=str(home)), home=str(home)))
+    pool = SSHSessionPool()
+    try:
+        uploads = [(make_connection(x, pool, user='root'), f'listen_address: {x.port}\n'.encode()) for x in servers]
+        assert upload_to_hosts(uploads=uploads, remote_path='scylla.yaml') == [True, True, True]
+        for home, server in zip(homes, servers):
+            assert (home / 'scylla.yaml').read_text() == f'listen_address: {server.port}\n'
+        assert upload_to_hosts(uploads=uploads, remote_path='scylla.yaml') == [False, False, False]
+    finally:
+        pool.close_all()
+        for server in servers:
+            server.stop()
+
+
+def test_output_tail_splits_chunks_into_lines():
+    received = []
+    tail = OutputTail('stdout', on_line=lambda stream, line: received.append((stream, line)), max_lines=2)
+    for chunk in [b'first li', b'ne\nsecond line\nthi', b'rd \xc3', b'\xa9 line']:
+        tail.feed(chunk)
+    tail.close()
+    assert received == [('stdout', 'first line'), ('stdout', 'second line'), ('stdout', 'third \u00e9 line')]
+    assert tail.lines == ['second line\n', 'third \u00e9 line']
+    tail.feed(b'x' * (MAX_LINE_LENGTH + 1))
+    assert len(tail.lines[-1]) == MAX_LINE_LENGTH + 1
+
+
+def test_command_output_is_streamed_with_bounded_tail(shell_server, session_pool):
+    connection = make_connection(shell_server, session_pool, user='root')
+    received = []
+    stdout, stderr, exit_code = connection.execute_command('seq 1 1000; echo "Critical error!!!" >&2; exit 3',
+                                                           on_line=lambda stream, line: received.append(stream),
+                                                           tail_lines=10)
+    assert stdout == [f'{x}\n' for x in range(991, 1001)]
+    assert stderr == ['Critical error!!!\n']
+    assert exit_code == 3
+    assert received.count('stdout') == 1000
+    assert received.count('stderr') == 1
+
+
+def test_hung_command_is_interrupted_by_job_timeout(session_pool):
+    release = threading.Event()
+    server = FakeSSHServer(command_handler=lambda command: (release.wait(timeout=30), (b'', b'', 0))[1])
+    cancel_event = threading.Event()
+    connection = SSHConnection(host=server.host, port=server.port, user='root', password='dGVzdF9wYXNzd29yZA==',
+                               session_pool=session_pool, cancel_event=cancel_event)
+    errors = []
+
+    def job():
+        try:
+            connection.execute_command('cassandra-stress write n=1000000')
+        except CommandInterrupted as ex:
+            errors.append(ex)
+            raise
+
+    pool = WorkerPool(max_workers=1, watchdog_interval=0.05).start()
+    hung_job = Job(job_id=1, function=job, timeout=0.2, cancel_event=cancel_event)
+    started = monotonic()
+    try:
+        pool.submit(hung_job)
+        while pool.active_job_ids and monotonic() - started < 5:
+            sleep(0.05)
+        pool.shutdown()
+        assert monotonic() - started < 5
+        assert len(errors) == 1
+        assert hung_job.state == JobState.CANCELLED and hung_job.cancel_reason == 'timed out'
+    finally:
+        release.set()
+        server.stop()
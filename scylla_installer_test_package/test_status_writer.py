@@ -0,0 +1,135 @@
+from db_interface.sql_database_interface import SQLiteDatabase
+from db_interface.migrations import create_tables
+from status_writer import StatusWriter, DatabaseUnavailable
+from jinja2 import FileSystemLoader, Environment
+from time import sleep, monotonic
+from datetime import datetime, timedelta
+import pytest
+
+
+class FlakyDatabase(SQLiteDatabase):
+    def __init__(self, database, failures):
+        super().__init__(database=database)
+        self.failures = failures
+        self.transactions = 0
+
+    def transaction(self):
+        if self._connection().in_transaction:
+            return super().transaction()
+        self.transactions += 1
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError('database is not available')
+        return super().transaction()
+
+
+@pytest.fixture()
+def database(tmp_path):
+    database = FlakyDatabase(database=str(tmp_path / 'installer.sqlite'), failures=0)
+    create_tables(database=database, template_environment=Environment(loader=FileSystemLoader('templates')),
+                  db_type='sqlite', schema=database.schema)
+    database.insert_data(table='nodes', columns=('host', 'port', 'username', 'db_version', 'cluster_name',
+                                                 'seed_node'),
+                         values=[(f'10.0.0.{x}', '22', 'root', '4.4', 'cluster', '10.0.0.1') for x in (1, 2)])
+    database.insert_data(table='installations', columns=('global_status', 'host'),
+                         values=[('new', '10.0.0.1'), ('new', '10.0.0.2')])
+    database.transactions = 0
+    yield database
+    database.close()
+
+
+def statuses(database):
+    return database.execute(query='select installation_id, status_name from statuses order by status_timestamp')
+
+
+def test_events_are_written_in_one_batch_and_keep_their_order(database):
+    writer = StatusWriter(database=database, flush_interval=60).start()
+    for number in range(3):
+        for installation_id in (1, 2):
+            writer.add_status(installation_id=installation_id, status_name=f'step {number}')
+            writer.update_installation(installation_id=installation_id, progress=f'{number} of 3')
+    writer.update_node(host='10.0.0.2', os_version='Ubuntu 20.04')
+    writer.update_installation(installation_id=2, global_status='succeeded', finish_timestamp='get_system_timestamp')
+    writer.add_facets(status='succeeded', cluster='cluster')
+    assert writer.pending == 15 and statuses(database) == []
+    writer.stop()
+    assert database.transactions == 1 and writer.pending == 0
+    assert statuses(database) == [(x, f'step {number}') for number in range(3) for x in (1, 2)]
+    assert database.execute(query='select id, progress, global_status, finish_timestamp is not null '
+                                  'from installations order by id') == [(1, '2 of 3', 'new', 0),
+                                                                        (2, '2 of 3', 'succeeded', 1)]
+    assert database.execute(query="select os_version from nodes where host = '10.0.0.2'") == [('Ubuntu 20.04',)]
+    assert len(database.execute(query='select facet_name from statistics_facets')) == 2
+
+
+def test_full_batch_is_written_without_waiting_for_interval(database):
+    writer = StatusWriter(database=database, flush_interval=60, batch_size=4).start()
+    for number in range(4):
+        writer.add_status(installation_id=1, status_name=f'step {number}')
+    deadline = monotonic() + 5
+    while writer.pending and monotonic() < deadline:
+        sleep(0.01)
+    assert len(statuses(database)) == 4
+    writer.stop()
+
+
+def test_failed_flush_is_retried_without_losing_events(database):
+    database.failures = 2
+    writer = StatusWriter(database=database, flush_interval=0.01).start()
+    writer.add_status(installation_id=1, status_name='Scylla installed')
+    writer.update_installation(installation_id=1, global_status='failed')
+    writer.stop()
+    assert database.transactions == 3
+    assert statuses(database) == [(1, 'Scylla installed')]
+    assert database.execute(query='select global_status from installations where id = 1') == [('failed',)]
+
+
+def test_writer_which_is_not_running_writes_at_once(database):
+    writer = StatusWriter(database=database)
+    writer.add_status(installation_id=1, status_name='Scylla installed')
+    assert statuses(database) == [(1, 'Scylla installed')] and writer.pending == 0
+    database.failures = 1
+    with pytest.raises(expected_exception=ConnectionError):
+        writer.add_status(installation_id=1, status_name='Scylla started')
+    # the event stays queued and is written with the next one
+    writer.add_status(installation_id=1, status_name='Scylla configured')
+    assert statuses(database)[1:] == [(1, 'Scylla started'), (1, 'Scylla configured')]
+
+
+def test_timestamps_are_taken_from_database_clock(database, monkeypatch):
+    database_now = datetime(2021, 6, 1, 10, 0, 0)
+    monkeypatch.setattr(database, 'current_timestamp', lambda: database_now)
+    writer = StatusWriter(database=database, flush_interval=60).start()
+    writer.add_status(installation_id=1, status_name='Scylla installed')
+    writer.add_status(installation_id=1, status_name='Scylla started')
+    writer.stop()
+    timestamps = [x[0] for x in database.execute(query='select status_timestamp from statuses '
+                                                       'order by status_timestamp')]
+    # the events keep the order and the distance they happened at, shifted to the clock of the database
+    assert timestamps[0] < timestamps[1] <= database_now
+    assert database_now - timestamps[0] < timedelta(seconds=5)
+
+
+def test_event_which_can_not_be_written_is_dropped(database):
+    writer = StatusWriter(database=database, flush_interval=0.01, max_retries=3).start()
+    writer.add_status(installation_id=1, status_name='Scylla installed')
+    writer.add_status(installation_id=99, status_name='Scylla installed')
+    writer.add_status(installation_id=2, status_name='Scylla installed')
+    deadline = monotonic() + 5
+    while writer.pending and monotonic() < deadline:
+        sleep(0.01)
+    writer.add_status(installation_id=2, status_name='Scylla started')
+    writer.stop()
+    assert statuses(database) == [(1, 'Scylla installed'), (2, 'Scylla installed'), (2, 'Scylla started')]
+
+
+def test_events_are_kept_while_database_is_unavailable(database, monkeypatch):
+    writer = StatusWriter(database=database, flush_interval=0.01, max_retries=1)
+    writer.add_status(installation_id=1, status_name='Scylla installed')
+    monkeypatch.setattr(database, 'current_timestamp', lambda: database.execute(query='select * from missing'))
+    for _ in range(3):
+        with pytest.raises(expected_exception=DatabaseUnavailable):
+            writer.add_status(installation_id=1, status_name='Scylla started')
+    monkeypatch.undo()
+    writer.flush()
+    assert len(statuses(database)) == 4 and writer.pending == 0
@@ -0,0 +1,30 @@
+from template_service import TemplateService, templates
+
+
+def test_scylla_yaml_is_rendered_by_shared_service():
+    scylla_yaml = templates.render('scylla_yaml/scylla.yaml', cluster_name='"cluster_0"', seed_node='"10.0.0.1"',
+                                   listen_address='10.0.0.2', rpc_address='10.0.0.2')
+    assert 'listen_address: 10.0.0.2' in scylla_yaml
+
+
+def test_changed_template_is_picked_up_only_with_auto_reload(tmp_path):
+    (tmp_path / 'page.html').write_text('first')
+    service = TemplateService(template_dir=str(tmp_path))
+    assert service.render('page.html') == 'first' and service.render_static('page.html') == 'first'
+    (tmp_path / 'page.html').write_text('second')
+    assert service.render('page.html') == 'first' and service.render_static('page.html') == 'first'
+    service.configure(auto_reload=True)
+    assert service.render('page.html') == 'second' and service.render_static('page.html') == 'second'
+
+
+def test_precompiled_templates_are_kept_in_bytecode_cache(tmp_path):
+    (tmp_path / 'templates').mkdir()
+    for name in ('page.html', 'scylla.yaml', 'create_nodes.sql'):
+        (tmp_path / 'templates' / name).write_text('{{ value }}')
+    cache_dir = tmp_path / 'template_cache'
+    service = TemplateService(template_dir=str(tmp_path / 'templates'), bytecode_cache_dir=str(cache_dir))
+    assert service.precompile() == ['page.html', 'scylla.yaml']
+    assert len(list(cache_dir.iterdir())) == 2
+    # another process loads the compiled templates from the cache
+    restarted = TemplateService(template_dir=str(tmp_path / 'templates'), bytecode_cache_dir=str(cache_dir))
+    assert restarted.render('scylla.yaml', value='cached') == 'cached'
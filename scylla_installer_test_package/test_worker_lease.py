@@ -0,0 +1,70 @@
+from db_interface.sql_database_interface import SQLiteDatabase
+from db_interface.migrations import create_tables
+from worker_lease import WorkerLease
+from status_writer import StatusWriter
+from datetime import datetime, timedelta
+from jinja2 import FileSystemLoader, Environment
+import pytest
+
+
+@pytest.fixture()
+def database(tmp_path):
+    database = SQLiteDatabase(database=str(tmp_path / 'installer.sqlite'))
+    create_tables(database=database, template_environment=Environment(loader=FileSystemLoader('templates')),
+                  db_type='sqlite', schema=database.schema)
+    database.insert_data(table='nodes', columns=('host', 'port', 'username', 'db_version', 'cluster_name',
+                                                 'seed_node'),
+                         values=[(f'10.0.0.{x}', '22', 'root', '4.4', 'cluster', '10.0.0.1') for x in (1, 2, 3)])
+    database.insert_data(table='installations', columns=('global_status', 'host'),
+                         values=[('new', '10.0.0.1'), ('new', '10.0.0.2'), ('new', '10.0.0.3')])
+    yield database
+    database.close()
+
+
+def installations(database):
+    return database.execute(query='select id, global_status, worker_id from installations order by id')
+
+
+def stop_heartbeats(database):
+    database.update_data(table='installations', condition='global_status = %s', condition_params=('in progress',),
+                         heartbeat_timestamp=datetime.now() - timedelta(seconds=120))
+
+
+def test_expired_lease_is_queued_again_for_another_worker(database):
+    first_worker = WorkerLease(database=database, worker_id='first', lease_timeout=60)
+    second_worker = WorkerLease(database=database, worker_id='second', lease_timeout=60)
+    assert first_worker.claim(installation_ids=[1, 2]) == [1, 2]
+    assert second_worker.claim(installation_ids=[1, 2, 3]) == [3]
+    stop_heartbeats(database)
+    first_worker.renew()
+    second_worker.renew()
+    assert second_worker.requeue_expired() == []
+    stop_heartbeats(database)
+    second_worker.renew()
+    assert second_worker.requeue_expired() == [1, 2]
+    assert installations(database) == [(1, 'new', None), (2, 'new', None), (3, 'in progress', 'second')]
+    assert second_worker.claim(installation_ids=[1, 2]) == [1, 2]
+    # the first worker comes back, its late updates don't touch the installations of the second worker
+    StatusWriter(database=database, worker_id='first').update_installation(installation_id=1, global_status='failed')
+    StatusWriter(database=database, worker_id='second').update_installation(installation_id=2,
+                                                                            global_status='succeeded')
+    assert installations(database) == [(1, 'in progress', 'second'), (2, 'succeeded', 'second'),
+                                       (3, 'in progress', 'second')]
+
+
+def test_released_installations_are_handed_over_at_once(database):
+    worker = WorkerLease(database=database, worker_id='first')
+    assert worker.claim(installation_ids=[1, 2, 3]) == [1, 2, 3]
+    database.update_data(table='installations', condition='id = %s', condition_params=(3,), global_status='failed')
+    worker.release()
+    assert installations(database) == [(1, 'new', None), (2, 'new', None), (3, 'failed', 'first')]
+    assert WorkerLease(database=database, worker_id='second').claim(installation_ids=[1, 2, 3]) == [1, 2]
+
+
+def test_leases_expire_by_database_clock(database, monkeypatch):
+    worker = WorkerLease(database=database, worker_id='first', lease_timeout=60)
+    assert worker.claim(installation_ids=[1, 2]) == [1, 2]
+    assert worker.requeue_expired() == []
+    # the local clock of the worker doesn't matter, only the clock of the database moves the leases on
+    monkeypatch.setattr(database, 'current_timestamp', lambda: datetime.now() + timedelta(seconds=120))
+    assert WorkerLease(database=database, worker_id='second').requeue_expired() == [1, 2]
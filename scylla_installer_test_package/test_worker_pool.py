@@ -0,0 +1,163 @@
+from worker_pool import WorkerPool, AsyncWorkerPool, Job, JobState, JobCancelled
+import asyncio
+import threading
+from time import sleep
+
+
+def wait_for_idle(pool, timeout=5):
+    for _ in range(int(timeout / 0.01)):
+        if not pool.active_job_ids:
+            return
+        sleep(0.01)
+
+
+def test_concurrency_is_bounded():
+    pool = WorkerPool(max_workers=3).start()
+    lock = threading.Lock()
+    running = []
+    peak = []
+
+    def job():
+        with lock:
+            running.append(1)
+            peak.append(len(running))
+        sleep(0.05)
+        with lock:
+            running.pop()
+
+    for number in range(12):
+        assert pool.submit(Job(job_id=number, function=job))
+    wait_for_idle(pool)
+    pool.shutdown()
+    assert max(peak) == 3
+    assert len(peak) == 12
+
+
+def test_duplicate_job_is_rejected():
+    release = threading.Event()
+    pool = WorkerPool(max_workers=1).start()
+    assert pool.submit(Job(job_id=1, function=release.wait))
+    assert not pool.submit(Job(job_id=1, function=release.wait))
+    release.set()
+    wait_for_idle(pool)
+    pool.shutdown()
+
+
+def test_priority_jobs_are_taken_first():
+    release = threading.Event()
+    order = []
+    pool = WorkerPool(max_workers=1).start()
+    pool.submit(Job(job_id='blocker', function=release.wait))
+    sleep(0.05)
+    pool.submit(Job(job_id='node', function=lambda: order.append('node'), priority=1))
+    pool.submit(Job(job_id='seed', function=lambda: order.append('seed'), priority=0))
+    release.set()
+    wait_for_idle(pool)
+    pool.shutdown()
+    assert order == ['seed', 'node']
+
+
+def test_cancelled_job_is_skipped():
+    release = threading.Event()
+    executed = []
+    pool = WorkerPool(max_workers=1).start()
+    pool.submit(Job(job_id='blocker', function=release.wait))
+    cancelled_job = Job(job_id='cancelled', function=lambda: executed.append(1))
+    pool.submit(cancelled_job)
+    assert pool.cancel(job_id='cancelled')
+    release.set()
+    wait_for_idle(pool)
+    pool.shutdown()
+    assert executed == []
+    assert cancelled_job.state == JobState.CANCELLED
+
+
+def test_running_job_is_cancelled_on_timeout():
+    cancel_event = threading.Event()
+    job = Job(job_id=1, function=lambda: cancel_event.wait(timeout=5), timeout=0.1, cancel_event=cancel_event)
+    pool = WorkerPool(max_workers=1, watchdog_interval=0.05).start()
+    pool.submit(job)
+    wait_for_idle(pool)
+    pool.shutdown()
+    assert job.cancel_reason == 'timed out'
+
+
+def test_pool_limits_workers_and_hosts():
+    pool = WorkerPool(max_workers=4).start()
+    lock = threading.Lock()
+    running = {}
+    peak = []
+
+    def make_job(number, host):
+        def job():
+            with lock:
+                running[host] = running.get(host, 0) + 1
+                peak.append((sum(running.values()), running[host]))
+            sleep(0.02)
+            with lock:
+                running[host] -= 1
+        return Job(job_id=number, function=job, concurrency_key=host)
+
+    for number in range(20):
+        assert pool.submit(make_job(number=number, host=f'10.0.0.{number % 5}'))
+    wait_for_idle(pool)
+    pool.shutdown()
+    assert len(peak) == 20
+    assert max(x[0] for x in peak) == 4
+    assert max(x[1] for x in peak) == 1
+
+
+def test_job_waiting_for_its_key_holds_no_worker():
+    release = threading.Event()
+    executed = []
+    pool = WorkerPool(max_workers=2).start()
+    pool.submit(Job(job_id='old installation', function=release.wait, concurrency_key='10.0.0.1'))
+    pool.submit(Job(job_id='new installation', function=lambda: executed.append('10.0.0.1'),
+                    concurrency_key='10.0.0.1'))
+    pool.submit(Job(job_id='other host', function=lambda: executed.append('10.0.0.2'), concurrency_key='10.0.0.2'))
+    sleep(0.2)
+    assert executed == ['10.0.0.2']
+    release.set()
+    wait_for_idle(pool)
+    pool.shutdown()
+    assert executed == ['10.0.0.2', '10.0.0.1']
+
+
+def test_async_pool_limits_workers_and_hosts():
+    pool = AsyncWorkerPool(max_workers=4).start()
+    running = {}
+    peak = []
+
+    def make_job(number, host):
+        async def job():
+            running[host] = running.get(host, 0) + 1
+            peak.append((sum(running.values()), running[host]))
+            await asyncio.sleep(0.02)
+            running[host] -= 1
+        return Job(job_id=number, function=job, concurrency_key=host)
+
+    for number in range(20):
+        assert pool.submit(make_job(number=number, host=f'10.0.0.{number % 5}'))
+    assert not pool.submit(make_job(number=0, host='10.0.0.0'))
+    wait_for_idle(pool)
+    pool.shutdown()
+    assert len(peak) == 20
+    assert max(x[0] for x in peak) == 4
+    assert max(x[1] for x in peak) == 1
+
+
+def test_async_job_is_cancelled_on_timeout():
+    pool = AsyncWorkerPool(max_workers=2).start()
+    cancelled = threading.Event()
+
+    async def job(cancel_event):
+        while not cancel_event.is_set():
+            await asyncio.sleep(0.01)
+        cancelled.set()
+        raise JobCancelled('timed out')
+
+    cancel_event = threading.Event()
+    pool.submit(Job(job_id=1, function=lambda: job(cancel_event), timeout=0.05, cancel_event=cancel_event))
+    wait_for_idle(pool)
+    pool.shutdown()
+    assert cancelled.is_set()
@@ -0,0 +1,134 @@
+import asyncio
+import shlex
+from hashlib import sha256
+from ssh_interface.ssh import SSHConnection, SSH_CONNECT_SECONDS, SSH_RECONNECTS, SSH_COMMAND_SECONDS, \
+    SSH_COMMAND_FAILURES
+from metrics import command_name
+from ssh_interface.command_output import OutputTail, CommandInterrupted, CHUNK_SIZE
+
+try:
+    import asyncssh
+except ImportError:
+    asyncssh = None
+
+# how often a command which waits for its output checks whether its job was cancelled
+CANCEL_CHECK_INTERVAL = 0.5
+
+
+class MissingAsyncDependency(Exception):
+    pass
+
+
+class AsyncSSHConnection(SSHConnection):
+    def __init__(self, host, port, user, password=None, connect_timeout=30, cancel_event=None):
+        super().__init__(host=host, port=port, user=user, password=password, cancel_event=cancel_event)
+        self._connect_timeout = connect_timeout
+        self._connection = None
+        self._connect_lock = asyncio.Lock()
+
+    async def _connect(self):
+        if asyncssh is None:
+            raise MissingAsyncDependency('The asyncio installer engine needs the "asyncssh" package')
+        async with self._connect_lock:
+            if self._connection is None:
+                with SSH_CONNECT_SECONDS.time(host=self._host):
+                    self._connection = await asyncio.wait_for(
+                        asyncssh.connect(self._host, port=int(self._port), username=self._user,
+                                         password=self._password, known_hosts=None),
+                        timeout=self._connect_timeout)
+            return self._connection
+
+    async def _run_on_connection(self, action):
+        for attempt in range(2):
+            connection = await self._connect()
+            try:
+                return await action(connection)
+            except (asyncssh.ChannelOpenError, asyncssh.ConnectionLost, BrokenPipeError):
+                # the connection died while idle, the command has not been started yet, so reconnect once
+                if self._connection is connection:
+                    self._connection = None
+                    connection.close()
+                if attempt:
+                    raise
+                SSH_RECONNECTS.inc(host=self._host)
+
+    async def execute_command(self, command, on_line=None, tail_lines=None):
+        return await self._execute(command=command,
+                                   stdout=OutputTail('stdout', on_line=on_line, max_lines=tail_lines),
+                                   stderr=OutputTail('stderr', on_line=on_line, max_lines=tail_lines),
+                                   label=command_name(command))
+
+    async def _execute(self, command, stdout, stderr, label):
+        command = self._with_sudo(command=command)
+        with SSH_COMMAND_SECONDS.time(host=self._host, command=label):
+            exit_code = await self._run_on_connection(
+                action=lambda x: self._stream_process(connection=x, command=command, stdout=stdout, stderr=stderr))
+        if exit_code != 0:
+            SSH_COMMAND_FAILURES.inc(host=self._host, command=label)
+        return stdout.lines, stderr.lines, exit_code
+
+    async def _stream_process(self, connection, command, stdout, stderr):
+        async with connection.create_process(command, encoding=None) as process:
+            streams = asyncio.gather(self._pump(reader=process.stdout, output=stdout),
+                                     self._pump(reader=process.stderr, output=stderr))
+            await self._wait_unless_cancelled(streams=streams, process=process)
+            completed = await process.wait(check=False)
+        return completed.exit_status
+
+    async def _wait_unless_cancelled(self, streams, process):
+        # the event is set from other threads, e.g. by the worker pool when the job timed out, so it is polled
+        while self._cancel_event is not None and not streams.done():
+            if self._cancel_event.is_set():
+                streams.cancel()
+                process.close()
+                await asyncio.gather(streams, return_exceptions=True)
+                raise CommandInterrupted('The command was interrupted because its job was cancelled')
+            await asyncio.wait({streams}, timeout=CANCEL_CHECK_INTERVAL)
+        await streams
+
+    @staticmethod
+    async def _pump(reader, output):
+        while True:
+            chunk = await reader.read(CHUNK_SIZE)
+            if not chunk:
+                output.close()
+                return
+            output.feed(chunk)
+
+    async def execute_batch(self, batch, on_line=None, tail_lines=None):
+        stdout, stderr, exit_code = await self._execute(command=batch.render_command(), stdout=OutputTail('stdout'),
+                                                        stderr=OutputTail('output', on_line=on_line,
+                                                                          max_lines=tail_lines),
+                                                        label='batch')
+        return batch.parse_results(stdout=stdout), stderr, exit_code
+
+    async def checksum(self, remote_path):
+        stdout, stderr, exit_code = await self.execute_command(command=f'sha256sum {shlex.quote(remote_path)}')
+        return self._parse_checksum(stdout=stdout, exit_code=exit_code)
+
+    async def upload(self, content, remote_path, mode='644'):
+        checksum = sha256(content).hexdigest()
+        if await self.checksum(remote_path=remote_path) == checksum:
+            return False
+        upload_path = await self._run_on_connection(action=lambda x: self._put_content(connection=x,
+                                                                                       content=content))
+        batch, cleanup_command = self._placement_batch(upload_path=upload_path, remote_path=remote_path, mode=mode)
+        results, stderr, exit_code = await self.execute_batch(batch=batch)
+        if len(results) < len(batch) or results[-1].exit_code != 0:
+            await self.execute_command(command=cleanup_command)
+        self._check_placement(batch=batch, results=results, stderr=stderr, checksum=checksum,
+                              remote_path=remote_path)
+        return True
+
+    async def _put_content(self, connection, content):
+        async with connection.start_sftp_client() as sftp:
+            upload_path = self._upload_path(home=await sftp.realpath('.'))
+            async with sftp.open(upload_path, 'wb') as file:
+                await file.write(content)
+            return upload_path
+
+    async def close(self):
+        if self._connection is not None:
+            connection, self._connection = self._connection, None
+            connection.close()
+            await connection.wait_closed()
@@ -0,0 +1,113 @@
+from base64 import b64encode, b64decode
+from uuid import uuid4
+
+# the output of a step is sent back in lines of this width, which stay below the line cut of OutputTail
+ENCODED_LINE_WIDTH = 4096
+# only the tail of the output of a step is sent back, the full output is streamed on stderr of the batch
+STEP_OUTPUT_LIMIT = 65536
+
+
+class StepResult:
+    def __init__(self, command, stdout, stderr, exit_code, duration):
+        self._command = command
+        self._stdout = stdout
+        self._stderr = stderr
+        self._exit_code = exit_code
+        self._duration = duration
+
+    @property
+    def command(self):
+        return self._command
+
+    @property
+    def stdout(self):
+        return self._stdout
+
+    @property
+    def stderr(self):
+        return self._stderr
+
+    @property
+    def exit_code(self):
+        return self._exit_code
+
+    @property
+    def duration(self):
+        return self._duration
+
+
+class CommandBatch:
+    def __init__(self, name):
+        self._name = name
+        self._commands = []
+        self._marker = f'__SCYLLA_INSTALLER_STEP_{uuid4().hex}__'
+
+    @property
+    def name(self):
+        return self._name
+
+    @property
+    def commands(self):
+        return list(self._commands)
+
+    def __len__(self):
+        return len(self._commands)
+
+    def add(self, command):
+        self._commands.append(command)
+        return self
+
+    def render_script(self):
+        script_lines = ['__out=$(mktemp)', '__err=$(mktemp)', 'trap \'rm -f "$__out" "$__err"\' EXIT']
+        for number, command in enumerate(self._commands):
+            # every step reports its exit code, timing and base64 encoded output, the batch stops on first failure;
+            # stdout of the step is also copied to stderr of the batch as it is produced
+            script_lines += ['__start=$(date +%s%N)',
+                             f'( {command}\n) 2>"$__err" </dev/null | tee "$__out" >&2',
+                             '__rc=${PIPESTATUS[0]}',
+                             '__end=$(date +%s%N)',
+                             f'echo "{self._marker} {number} $__rc $__start $__end"',
+                             f'tail -c {STEP_OUTPUT_LIMIT} "$__out" | base64 -w {ENCODED_LINE_WIDTH}',
+                             f'echo "{self._marker} end"',
+                             f'tail -c {STEP_OUTPUT_LIMIT} "$__err" | base64 -w {ENCODED_LINE_WIDTH}',
+                             f'echo "{self._marker} end"',
+                             '[ $__rc -eq 0 ] || exit 0']
+        return '\n'.join(script_lines) + '\n'
+
+    def render_command(self):
+        encoded_script = b64encode(self.render_script().encode('utf-8')).decode('utf-8')
+        return f'bash -c "$(echo {encoded_script} | base64 -d)"'
+
+    def parse_results(self, stdout):
+        results = []
+        lines = [line.rstrip('\n') for line in stdout]
+        position = 0
+        while position < len(lines):
+            fields = lines[position].split()
+            if len(fields) == 5 and fields[0] == self._marker:
+                number, exit_code, start, end = (int(x) for x in fields[1:])
+                stdout_end = self._end_of_output(lines=lines, start=position + 1)
+                stderr_end = self._end_of_output(lines=lines, start=stdout_end + 1)
+                if stderr_end == len(lines):
+                    # the batch was cut off while the step reported its output
+                    break
+                results.append(StepResult(command=self._commands[number],
+                                          stdout=self._decode_lines(lines[position + 1:stdout_end]),
+                                          stderr=self._decode_lines(lines[stdout_end + 1:stderr_end]),
+                                          exit_code=exit_code,
+                                          duration=(end - start) / 1e9))
+                position = stderr_end + 1
+            else:
+                position += 1
+        return results
+
+    def _end_of_output(self, lines, start):
+        end_line = f'{self._marker} end'
+        position = start
+        while position < len(lines) and lines[position] != end_line:
+            position += 1
+        return position
+
+    @staticmethod
+    def _decode_lines(encoded_lines):
+        return b64decode(''.join(encoded_lines)).decode('utf-8', errors='replace').splitlines(keepends=True)
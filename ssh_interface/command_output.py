@@ -0,0 +1,68 @@
+import select
+from collections import deque
+
+CHUNK_SIZE = 32768
+# a line which never ends is cut, so that one chatty command can't hold an unbounded buffer
+MAX_LINE_LENGTH = 65536
+
+
+class CommandInterrupted(Exception):
+    pass
+
+
+class OutputTail:
+    def __init__(self, stream_name, on_line=None, max_lines=None):
+        self._stream_name = stream_name
+        self._on_line = on_line
+        self._lines = deque(maxlen=max_lines)
+        self._pending = b''
+
+    @property
+    def lines(self):
+        return list(self._lines)
+
+    def feed(self, chunk):
+        lines = (self._pending + chunk).split(b'\n')
+        self._pending = lines.pop()
+        for line in lines:
+            self._add_line(line + b'\n')
+        if len(self._pending) >= MAX_LINE_LENGTH:
+            self._add_line(self._pending)
+            self._pending = b''
+
+    def close(self):
+        if self._pending:
+            self._add_line(self._pending)
+            self._pending = b''
+
+    def _add_line(self, raw_line):
+        line = raw_line.decode('utf-8', errors='replace')
+        self._lines.append(line)
+        if self._on_line is not None:
+            self._on_line(self._stream_name, line.rstrip('\n'))
+
+
+def read_channel(channel, stdout, stderr, poll_interval=0.05, cancel_event=None):
+    # both streams are drained as data arrives, a full stderr window never blocks the remote command
+    while True:
+        if cancel_event is not None and cancel_event.is_set():
+            # a hung command would hold the worker forever, closing the channel stops waiting for it
+            channel.close()
+            stdout.close()
+            stderr.close()
+            raise CommandInterrupted('The command was interrupted because its job was cancelled')
+        received = False
+        if channel.recv_ready():
+            stdout.feed(channel.recv(CHUNK_SIZE))
+            received = True
+        if channel.recv_stderr_ready():
+            stderr.feed(channel.recv_stderr(CHUNK_SIZE))
+            received = True
+        if received:
+            continue
+        if channel.exit_status_ready() and not channel.recv_ready() and not channel.recv_stderr_ready():
+            break
+        select.select([channel], [], [], poll_interval)
+    stdout.close()
+    stderr.close()
+    return channel.recv_exit_status()
@@ -1,5 +1,18 @@
 import paramiko
+import shlex
+import threading
 from base64 import b64decode
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from hashlib import sha256
+from io import BytesIO
+from os import path
+from time import monotonic
+from uuid import uuid4
+from ssh_interface.command_batch import CommandBatch
+from ssh_interface.command_output import OutputTail, read_channel
+from metrics import registry, command_name
 
 
 class MissingAuthInformation(Exception):
@@ -10,8 +23,196 @@ class MissingSudoPassword(Exception):
     pass
 
 
+class SessionPoolExhausted(Exception):
+    pass
+
+
+class FileTransferError(Exception):
+    pass
+
+
+SSH_CONNECT_SECONDS = registry.histogram('installer_ssh_connect_seconds', 'Duration of SSH connection setup',
+                                         ('host',))
+SSH_RECONNECTS = registry.counter('installer_ssh_reconnects_total', 'SSH sessions re-established after their '
+                                                                    'transport was dropped', ('host',))
+SSH_COMMAND_SECONDS = registry.histogram('installer_ssh_command_seconds', 'Duration of remote commands including '
+                                                                          'the transfer of their output',
+                                         ('host', 'command'))
+SSH_COMMAND_FAILURES = registry.counter('installer_ssh_command_failures_total', 'Remote commands which exited with '
+                                                                                'a non-zero code', ('host', 'command'))
+
+
+class PooledSession:
+    def __init__(self, host, port, user):
+        self._host = host
+        self._port = port
+        self._user = user
+        self._client = None
+        self._lock = threading.Lock()
+        self.users = 0
+        self.last_used = monotonic()
+
+    @property
+    def client(self):
+        return self._client
+
+    def is_active(self):
+        if self._client is None:
+            return False
+        transport = self._client.get_transport()
+        return transport is not None and transport.is_active()
+
+    def ensure_connected(self, password, connect_timeout):
+        with self._lock:
+            if self.is_active():
+                return self._client
+            self.close()
+            client = paramiko.SSHClient()
+            client.set_missing_host_key_policy(paramiko.AutoAddPolicy)
+            with SSH_CONNECT_SECONDS.time(host=self._host):
+                client.connect(hostname=self._host,
+                               port=self._port,
+                               username=self._user,
+                               password=password,
+                               timeout=connect_timeout)
+            # keepalive packets make a silently dropped transport visible to is_active()
+            client.get_transport().set_keepalive(30)
+            self._client = client
+            return client
+
+    def discard_client(self, client):
+        with self._lock:
+            if self._client is client:
+                self.close()
+
+    def close(self):
+        if self._client is not None:
+            self._client.close()
+            self._client = None
+
+
+class SSHSessionPool:
+    def __init__(self, max_connections=256, idle_timeout=300, connect_timeout=30, acquire_timeout=600):
+        self._max_connections = max_connections
+        self._idle_timeout = idle_timeout
+        self._connect_timeout = connect_timeout
+        self._acquire_timeout = acquire_timeout
+        self._sessions = OrderedDict()
+        self._condition = threading.Condition()
+
+    @property
+    def max_connections(self):
+        return self._max_connections
+
+    @property
+    def idle_timeout(self):
+        return self._idle_timeout
+
+    def __len__(self):
+        with self._condition:
+            return len(self._sessions)
+
+    @contextmanager
+    def session(self, host, port, user, password=None):
+        key = (host, int(port), user)
+        entry = self._acquire(key=key)
+        try:
+            try:
+                client = entry.ensure_connected(password=password, connect_timeout=self._connect_timeout)
+            except Exception:
+                self._discard(key=key, entry=entry)
+                raise
+            yield client
+        finally:
+            self._release(key=key, entry=entry)
+
+    def invalidate(self, host, port, user, client):
+        with self._condition:
+            entry = self._sessions.get((host, int(port), user))
+        if entry is not None:
+            entry.discard_client(client=client)
+
+    def close(self, host, port, user):
+        with self._condition:
+            entry = self._sessions.get((host, int(port), user))
+            if entry is None or entry.users > 0:
+                return
+            del self._sessions[(host, int(port), user)]
+            self._condition.notify_all()
+        entry.close()
+
+    def close_all(self):
+        with self._condition:
+            entries = list(self._sessions.values())
+            self._sessions.clear()
+            self._condition.notify_all()
+        for entry in entries:
+            entry.close()
+
+    def evict_idle(self):
+        with self._condition:
+            evicted = self._pop_idle()
+        for entry in evicted:
+            entry.close()
+        return len(evicted)
+
+    def _acquire(self, key):
+        evicted = []
+        deadline = monotonic() + self._acquire_timeout
+        with self._condition:
+            evicted.extend(self._pop_idle())
+            while True:
+                entry = self._sessions.get(key)
+                if entry is not None:
+                    self._sessions.move_to_end(key)
+                    break
+                if len(self._sessions) < self._max_connections:
+                    entry = PooledSession(host=key[0], port=key[1], user=key[2])
+                    self._sessions[key] = entry
+                    break
+                least_recently_used = self._pop_least_recently_used()
+                if least_recently_used is not None:
+                    evicted.append(least_recently_used)
+                    continue
+                remaining = deadline - monotonic()
+                if remaining <= 0:
+                    raise SessionPoolExhausted(f"All {self._max_connections} SSH sessions are busy, "
+                                               f"could not connect to {key[0]}:{key[1]}")
+                self._condition.wait(timeout=remaining)
+            entry.users += 1
+        for stale_entry in evicted:
+            stale_entry.close()
+        return entry
+
+    def _release(self, key, entry):
+        with self._condition:
+            entry.users -= 1
+            entry.last_used = monotonic()
+            self._condition.notify_all()
+
+    def _discard(self, key, entry):
+        with self._condition:
+            if self._sessions.get(key) is entry and entry.users == 1:
+                del self._sessions[key]
+        entry.close()
+
+    def _pop_idle(self):
+        now = monotonic()
+        idle_keys = [k for k, v in self._sessions.items() if v.users == 0 and now - v.last_used >= self._idle_timeout]
+        return [self._sessions.pop(k) for k in idle_keys]
+
+    def _pop_least_recently_used(self):
+        for k, v in self._sessions.items():
+            if v.users == 0:
+                return self._sessions.pop(k)
+        return None
+
+
+default_session_pool = SSHSessionPool()
+
+
 class SSHConnection:
-    def __init__(self, host, port, user, password=None):
+    def __init__(self, host, port, user, password=None, session_pool=None, cancel_event=None):
         self._host = host
         self._port = port
         self._user = user
@@ -23,21 +224,135 @@ class SSHConnection:
             self._sudo_mode = False
         else:
             self._sudo_mode = True
+        self._session_pool = default_session_pool if session_pool is None else session_pool
+        # a set event interrupts the running command, e.g. when the job of the installation timed out
+        self._cancel_event = cancel_event
 
-    def execute_command(self, command):
-        with paramiko.SSHClient() as client:
-            client.set_missing_host_key_policy(paramiko.AutoAddPolicy)
-            if self._sudo_mode:
-                if self._password:
-                    command = f"echo {self._password} | sudo -S --prompt='' " + command
-                else:
-                    command = "sudo " + command
-            client.connect(hostname=self._host,
-                           port=self._port,
-                           username=self._user,
-                           password=self._password)
-            standard_input, standard_output, standard_error = client.exec_command(command)
-            stdout = standard_output.readlines()
-            stderr = standard_error.readlines()
-            exit_code = standard_output.channel.recv_exit_status()
-        return stdout, stderr, exit_code
+    @property
+    def host(self):
+        return self._host
+
+    def execute_command(self, command, on_line=None, tail_lines=None):
+        return self._execute(command=command, stdout=OutputTail('stdout', on_line=on_line, max_lines=tail_lines),
+                             stderr=OutputTail('stderr', on_line=on_line, max_lines=tail_lines),
+                             label=command_name(command))
+
+    def _execute(self, command, stdout, stderr, label):
+        command = self._with_sudo(command=command)
+        with SSH_COMMAND_SECONDS.time(host=self._host, command=label):
+            result = self._run_on_client(start=lambda x: x.exec_command(command),
+                                         finish=lambda x: self._read_command_output(channel_files=x, stdout=stdout,
+                                                                                    stderr=stderr))
+        if result[2] != 0:
+            SSH_COMMAND_FAILURES.inc(host=self._host, command=label)
+        return result
+
+    def _with_sudo(self, command):
+        if self._sudo_mode:
+            if self._password:
+                return f"echo {self._password} | sudo -S --prompt='' " + command
+            return "sudo " + command
+        return command
+
+    def _read_command_output(self, channel_files, stdout, stderr):
+        standard_input, standard_output, standard_error = channel_files
+        exit_code = read_channel(channel=standard_output.channel, stdout=stdout, stderr=stderr,
+                                 cancel_event=self._cancel_event)
+        return stdout.lines, stderr.lines, exit_code
+
+    def _run_on_client(self, start, finish):
+        for attempt in range(2):
+            with self._session_pool.session(host=self._host, port=self._port, user=self._user,
+                                            password=self._password) as client:
+                try:
+                    started = start(client)
+                except (paramiko.SSHException, EOFError, OSError):
+                    # the transport died while idle, the command has not been started yet, so reconnect once
+                    self._session_pool.invalidate(host=self._host, port=self._port, user=self._user, client=client)
+                    if attempt:
+                        raise
+                    SSH_RECONNECTS.inc(host=self._host)
+                    continue
+                return finish(started)
+
+    def execute_batch(self, batch, on_line=None, tail_lines=None):
+        # the results of the steps are parsed from stdout, only the live output on stderr is cut to its tail
+        stdout, stderr, exit_code = self._execute(command=batch.render_command(), stdout=OutputTail('stdout'),
+                                                  stderr=OutputTail('output', on_line=on_line, max_lines=tail_lines),
+                                                  label='batch')
+        return batch.parse_results(stdout=stdout), stderr, exit_code
+
+    def checksum(self, remote_path):
+        stdout, stderr, exit_code = self.execute_command(command=f'sha256sum {shlex.quote(remote_path)}')
+        return self._parse_checksum(stdout=stdout, exit_code=exit_code)
+
+    @staticmethod
+    def _parse_checksum(stdout, exit_code):
+        if exit_code != 0 or not stdout:
+            return None
+        return stdout[0].split()[0]
+
+    def upload(self, content, remote_path, mode='644'):
+        checksum = sha256(content).hexdigest()
+        if self.checksum(remote_path=remote_path) == checksum:
+            return False
+        upload_path = self._run_on_client(start=lambda x: x.open_sftp(),
+                                          finish=lambda x: self._put_content(sftp=x, content=content))
+        batch, cleanup_command = self._placement_batch(upload_path=upload_path, remote_path=remote_path, mode=mode)
+        results, stderr, exit_code = self.execute_batch(batch=batch)
+        if len(results) < len(batch) or results[-1].exit_code != 0:
+            self.execute_command(command=cleanup_command)
+        self._check_placement(batch=batch, results=results, stderr=stderr, checksum=checksum,
+                              remote_path=remote_path)
+        return True
+
+    @staticmethod
+    def _placement_batch(upload_path, remote_path, mode):
+        quoted_path = shlex.quote(remote_path)
+        # the file is staged next to its destination, so that the final move is an atomic rename
+        staging_path = shlex.quote(path.join(path.dirname(remote_path),
+                                             f'.{path.basename(remote_path)}.{uuid4().hex}'))
+        batch = CommandBatch(name=f'Upload of {remote_path}')
+        batch.add(f'install -m {mode} {shlex.quote(upload_path)} {staging_path}')
+        batch.add(f'[ ! -e {quoted_path} ] || chown --reference={quoted_path} {staging_path}')
+        batch.add(f'mv -f {staging_path} {quoted_path}')
+        batch.add(f'rm -f {shlex.quote(upload_path)}')
+        batch.add(f'sha256sum {quoted_path}')
+        return batch, f'rm -f {shlex.quote(upload_path)} {staging_path}'
+
+    def _check_placement(self, batch, results, stderr, checksum, remote_path):
+        if len(results) < len(batch) or results[-1].exit_code != 0:
+            failed_step = results[-1] if results else None
+            error_msg = ''.join(failed_step.stderr if failed_step else stderr)
+            raise FileTransferError(f'Upload of {remote_path} to {self._host} failed: {error_msg.strip()}')
+        if results[-1].stdout[0].split()[0] != checksum:
+            raise FileTransferError(f'Checksum of {remote_path} on {self._host} does not match the uploaded file')
+
+    def _put_content(self, sftp, content):
+        with sftp:
+            upload_path = self._upload_path(home=sftp.normalize('.'))
+            sftp.putfo(BytesIO(content), upload_path)
+            return upload_path
+
+    @staticmethod
+    def _upload_path(home):
+        return f'{home}/.scylla-installer-upload-{uuid4().hex}'
+
+    def close(self):
+        self._session_pool.close(host=self._host, port=self._port, user=self._user)
+
+
+def upload_to_hosts(uploads, remote_path, mode='644', max_workers=16):
+    failures = []
+    with ThreadPoolExecutor(max_workers=max(min(max_workers, len(uploads)), 1)) as executor:
+        futures = [(connection.host, executor.submit(connection.upload, content=content, remote_path=remote_path,
+                                                     mode=mode))
+                   for connection, content in uploads]
+        for host, future in futures:
+            try:
+                future.result()
+            except Exception as e:
+                failures.append(f'{host}: {e}')
+    if failures:
+        raise FileTransferError(f"Upload of {remote_path} failed on {len(failures)} hosts: {'; '.join(failures)}")
+    return [future.result() for host, future in futures]
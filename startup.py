@@ -16,16 +16,33 @@ class ProcessRunner:
         return popen_objects_list
 
 
+def worker_count(value):
+    if not value.isdigit() or int(value) < 1:
+        raise argparse.ArgumentTypeError(f'at least one installer worker is needed, got {value}')
+    return int(value)
+
+
 def parse_args():
     parser = argparse.ArgumentParser(description='This script runs the application.')
     parser.add_argument('config_path', help='Path to config file', type=str)
+    parser.add_argument('-w', '--installer_workers', help='Number of installer processes sharing the installations',
+                        type=worker_count, default=1)
     return parser.parse_args()
 
 
+def installer_commands(path_to_config, installer_workers):
+    if installer_workers == 1:
+        return [f"./installer.py {path_to_config}"]
+    # every worker writes its metrics to a snapshot file of its own
+    return [f"./installer.py {path_to_config} --worker {x}" for x in range(1, installer_workers + 1)]
+
+
 def main():
-    path_to_config = vars(parse_args())['config_path']
-    runner = ProcessRunner(processes_to_run=[f"./controller.py {path_to_config}",
-                                             f"./installer.py {path_to_config}"])
+    arguments = vars(parse_args())
+    path_to_config = arguments['config_path']
+    runner = ProcessRunner(processes_to_run=[f"./controller.py {path_to_config}"] +
+                           installer_commands(path_to_config=path_to_config,
+                                              installer_workers=arguments['installer_workers']))
     running_processes = runner.run()
     print('\n'.join([f'Starting up {x}...' for x in running_processes]))
 
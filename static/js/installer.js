@@ -119,6 +119,8 @@ async function sendFormData() {
         arrayOfForms.push(formDataObj)
     }
     objectToJSON['nodes'] = arrayOfForms
+    objectToJSON['operation'] = document.querySelector("select[name='operation']").value
+    objectToJSON['batch_size'] = document.querySelector("select[name='batch_size']").value
     let response = await fetch('/install', {
         method: 'POST',
         headers: {
@@ -129,6 +131,33 @@ async function sendFormData() {
     openModalWindow()
 }
 
+async function submitManifest() {
+    let manifestInput = document.querySelector("input[name='manifest']")
+    if (manifestInput.files.length == 0) {
+        manifestInput.classList.add("emptyInput");
+        return
+    }
+    let formData = new FormData()
+    formData.append('manifest', manifestInput.files[0])
+    formData.append('operation', document.querySelector("select[name='operation']").value)
+    formData.append('batch_size', document.querySelector("select[name='batch_size']").value)
+    let response = await fetch('/install_manifest', {
+        method: 'POST',
+        body: formData
+    });
+    if (!response.ok) {
+        let errorPage = new DOMParser().parseFromString(await response.text(), 'text/html')
+        let message = errorPage.querySelector('p')
+        window.alert('The manifest was not accepted:\r' + (message ? message.innerText : response.statusText))
+        return
+    }
+    let result = await response.json()
+    if (result['skipped'].length > 0) {
+        window.alert('Following hosts already have active installations and were skipped:\r' + result['skipped'].join(', '))
+    }
+    openModalWindow()
+}
+
 function forceInstallStatusChange(e) {
     checkBox = event.target
     if (checkBox.checked) {
@@ -138,115 +167,100 @@ function forceInstallStatusChange(e) {
     }
 }
 
-async function openModalWindow() {
+function openModalWindow() {
     modalWindowBackground.style.display = "block";
-    window.controller = new AbortController();
     messageString = document.querySelector('#statusMessage');
-    let objectToJSON = {"host": ''}
-    let response;
-    try {
-        response = await fetch('/status', {
-            signal: window.controller.signal,
-            method: 'POST',
-            headers: {
-            'Content-Type': 'application/json; charset=utf-8'
-        },
-        body: JSON.stringify(objectToJSON)
-        });
-    }
-    catch(err) {
-        return
-    }
-    if (response.ok) {
-        let json = await response.json();
-        if (json['message'] == '') {
+    window.progressSource = new EventSource('/progress_stream');
+    window.progressSource.addEventListener('snapshot', function(e) {
+        let installations = JSON.parse(e.data);
+        // a snapshot replaces everything shown before, it is sent again when the stream missed events
+        document.querySelector('tbody').replaceChildren();
+        if (installations.length == 0) {
             messageString.innerText = 'No active installations found';
         }
         else {
             messageString.innerText = ''
-            for (let item of json['message']) {
-                getProgress(host=item['host'])
-            }
         }
-    }
-    else {
-        alert("HTTP Error: " + response.status);
-    }
+        for (let installation of installations) {
+            showProgress(installation)
+        }
+    });
+    window.progressSource.onmessage = function(e) {
+        messageString.innerText = ''
+        showProgress(JSON.parse(e.data))
+    };
 }
 
-async function getProgress(host) {
-    let succeededIcon = '<img src="../../static/img/succeeded.png" alt="Succeeded">'
-    let inProgressIcon = '<img src="../../static/img/in_progress.png" alt="In Progress">'
-    let failedIcon = '<img src="../../static/img/failed.png" alt="Failed">'
-    
+function getProgressRow(installationId, host) {
+    let rowId = 'installation' + installationId
+    let row = document.getElementById(rowId)
+    if (row != null) {
+        return row
+    }
     let tableHead = document.querySelector('thead');
     let tableHeadRow = tableHead.querySelector('tr');
     let tableHeadColumns = tableHeadRow.querySelectorAll('th');
     let tableBody = document.querySelector('tbody');
-    let newRow = document.createElement('tr');
-    tableBody.appendChild(newRow);
+    row = document.createElement('tr');
+    row.id = rowId
+    tableBody.appendChild(row);
     for (let i = 1; i <= tableHeadColumns.length; i++){
         newCell = document.createElement('td');
-        newRow.appendChild(newCell)
+        row.appendChild(newCell)
     }
-    newRow.firstChild.innerText = host
-    newRow.lastChild.innerHTML = inProgressIcon
-    
-    let objectToJSON = {"host": host}
-    let response;
-    let globalStatus;
-    let inProgress = true
-    while (inProgress) {
-        try {
-            response = await fetch('/status', {
-                signal: window.controller.signal,
-                method: 'POST',
-                headers: {
-                    'Content-Type': 'application/json; charset=utf-8'
-                },
-                body: JSON.stringify(objectToJSON)
-            });
-        }
-        catch(err) {
-            return
+    row.firstChild.innerText = host
+    return row
+}
+
+function showProgress(installation) {
+    let succeededIcon = '<img src="../../static/img/succeeded.png" alt="Succeeded">'
+    let inProgressIcon = '<img src="../../static/img/in_progress.png" alt="In Progress">'
+    let failedIcon = '<img src="../../static/img/failed.png" alt="Failed">'
+
+    let row = getProgressRow(installation['installation_id'], installation['host'])
+    for (let statusName of installation['statuses']) {
+        switch(statusName.toUpperCase()){
+            case 'OS IDENTIFIED':
+                row.querySelectorAll('td')[1].innerHTML = succeededIcon;
+                break;
+            case 'SCYLLA INSTALLED':
+            case 'SCYLLA UPGRADED':
+                row.querySelectorAll('td')[2].innerHTML = succeededIcon;
+                break;
+            case 'SCYLLA.YAML CREATED':
+            case 'SCYLLA.YAML UPDATED':
+                row.querySelectorAll('td')[3].innerHTML = succeededIcon;
+                break;
+            case 'SCYLLA CONFIGURED':
+                row.querySelectorAll('td')[4].innerHTML = succeededIcon;
+                break;
+            case 'SCYLLA STARTED':
+            case 'SCYLLA RESTARTED':
+                row.querySelectorAll('td')[5].innerHTML = succeededIcon;
+                break;
+            case 'CASSANDRA-STRESS COMPLETED' :
+                row.querySelectorAll('td')[6].innerHTML = succeededIcon;
+                break;
         }
-        if (response.ok) {
-            let json = await response.json();
-            for (let record of json['message']) {
-                switch(record['status_name'].toUpperCase()){
-                    case 'OS IDENTIFIED':
-                        newRow.querySelectorAll('td')[1].innerHTML = succeededIcon;
-                        break;
-                    case 'SCYLLA INSTALLED':
-                        newRow.querySelectorAll('td')[2].innerHTML = succeededIcon;
-                        break;
-                    case 'SCYLLA.YAML CREATED':
-                        newRow.querySelectorAll('td')[3].innerHTML = succeededIcon;
-                        break;
-                    case 'SCYLLA CONFIGURED':
-                        newRow.querySelectorAll('td')[4].innerHTML = succeededIcon;
-                        break;
-                    case 'SCYLLA STARTED':
-                        newRow.querySelectorAll('td')[5].innerHTML = succeededIcon;
-                        break;
-                    case 'CASSANDRA-STRESS COMPLETED' :
-                        newRow.querySelectorAll('td')[6].innerHTML = succeededIcon;
-                        break;
-                }
-            }
-            if (json['message'] != '') {
-                globalStatus = json['message'][0]['global_status']
-                if (globalStatus.toUpperCase() != 'IN PROGRESS') {
-                    inProgress = false
-                }
-            }
-        }   
     }
-    newRow.lastChild.innerHTML = (globalStatus.toUpperCase() == 'SUCCEEDED') ? succeededIcon : failedIcon;
+    switch(installation['global_status'].toUpperCase()){
+        case 'SUCCEEDED':
+            row.lastChild.innerHTML = succeededIcon;
+            break;
+        case 'FAILED':
+            row.lastChild.innerHTML = failedIcon;
+            break;
+        default:
+            row.lastChild.innerHTML = inProgressIcon;
+    }
+    row.title = installation['progress'] || ''
+    if (installation['operation'] && installation['operation'] != 'install') {
+        row.firstChild.innerText = installation['host'] + ' (' + installation['operation'] + ')'
+    }
 }
 
 function closeModalWindow() {
-    window.controller.abort();
+    window.progressSource.close();
     modalWindowBackground.style.display = "none";
     messageString = document.querySelector('#statusMessage');
     messageString.innerText = 'Looking for active installations...'
@@ -1,6 +1,26 @@
-document.addEventListener("DOMContentLoaded", getStatistics);
+document.addEventListener("DOMContentLoaded", function() {
+    for (let column of document.querySelectorAll('th[data-sort]')) {
+        column.addEventListener('click', sortStatistics);
+    }
+    getStatistics();
+});
+
+window.statSort = {'sort_by': 'installation_start', 'sort_order': 'desc'};
+window.statRequest = 0;
+
+function sortStatistics(event) {
+    let sortBy = event.target.dataset.sort;
+    if (window.statSort['sort_by'] == sortBy) {
+        window.statSort['sort_order'] = window.statSort['sort_order'] == 'asc' ? 'desc' : 'asc';
+    }
+    else {
+        window.statSort = {'sort_by': sortBy, 'sort_order': 'asc'};
+    }
+    getStatistics();
+}
 
 async function getStatistics() {
+    let requestNumber = ++window.statRequest;
     let tableBody = document.querySelector('tbody');
     while (tableBody.firstChild) {
         tableBody.removeChild(tableBody.firstChild);
@@ -10,33 +30,38 @@ async function getStatistics() {
     
     let formData = new FormData(document.querySelector("form[name='filter']"))
     
-    let formDataObj = {}
+    let formDataObj = Object.assign({}, window.statSort);
     
     for (let [name, value] of formData) {
         formDataObj[name] = value;
     }
     
-    response = await fetch('/get_stat', {
-        method: 'POST',
-        headers: {
-            'Content-Type': 'application/json; charset=utf-8'
-        },
-        body: JSON.stringify(formDataObj)
-    });
-    if (response.ok) {
+    let rowCount = 0;
+    do {
+        response = await fetch('/get_stat', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json; charset=utf-8'
+            },
+            body: JSON.stringify(formDataObj)
+        });
+        if (!response.ok) {
+            alert("HTTP Error: " + response.status);
+            return;
+        }
         let json = await response.json();
-        if (json['message'] == '') {
-            messageString.innerText = 'No completed installations found';
+        // a newer filter or sort request has been started, the rest of this one is dropped
+        if (requestNumber != window.statRequest) {
+            return;
         }
-        else {
-            messageString.innerText = ''
-            generatStatTable(statArray=json['message'])
+        rowCount += json['message'].length;
+        generatStatTable(statArray=json['message'])
+        formDataObj['after'] = json['next'];
+        if (json['next']) {
+            messageString.innerText = 'Loaded ' + rowCount + ' installations...';
         }
-    }
-    else {
-        alert("HTTP Error: " + response.status);
-    }    
-
+    } while (formDataObj['after']);
+    messageString.innerText = rowCount == 0 ? 'No completed installations found' : '';
 }
 
 function generatStatTable(statArray) {
@@ -44,13 +69,15 @@ function generatStatTable(statArray) {
     let tableHeadRow = tableHead.querySelector('tr');
     let tableHeadColumns = tableHeadRow.querySelectorAll('th');
     let tableBody = document.querySelector('tbody');
+    let fragment = document.createDocumentFragment();
     for (let item of statArray) {
         let newRow = document.createElement('tr');
-        tableBody.appendChild(newRow);
+        fragment.appendChild(newRow);
         for (let i = 0; i < tableHeadColumns.length; i++){
             newCell = document.createElement('td');
             newCell.innerText = item[i]
             newRow.appendChild(newCell)
         }
     }
-}
\ No newline at end of file
+    tableBody.appendChild(fragment);
+}
@@ -0,0 +1,199 @@
+import logging
+import threading
+from datetime import timedelta
+from time import monotonic, monotonic_ns, sleep
+from metrics import registry
+
+logger = logging.getLogger('installer')
+
+STATUS_EVENTS = registry.counter('installer_status_events_total', 'Status events queued by installations',
+                                 ('kind',))
+STATUS_FLUSH_SECONDS = registry.histogram('installer_status_flush_seconds', 'Duration of status writer flushes')
+STATUS_FLUSH_ERRORS = registry.counter('installer_status_flush_errors_total', 'Status writer flushes which failed')
+STATUS_EVENTS_DROPPED = registry.counter('installer_status_events_dropped_total', 'Status events which could not be '
+                                                                                  'written and were dropped',
+                                         ('kind',))
+
+STATUS = 'status'
+INSTALLATION = 'installation'
+NODE = 'node'
+FACETS = 'facets'
+
+
+class DatabaseUnavailable(Exception):
+    pass
+
+
+class StatusWriter:
+    def __init__(self, database, flush_interval=0.2, batch_size=1000, worker_id=None, max_retries=5):
+        self._database = database
+        self._worker_id = worker_id
+        self._flush_interval = flush_interval
+        self._batch_size = batch_size
+        self._max_retries = max_retries
+        self._failed_writes = 0
+        self._events = []
+        self._last_happened = 0
+        self._condition = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None
+
+    @property
+    def pending(self):
+        with self._condition:
+            return len(self._events)
+
+    def start(self):
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._write_loop, name='status-writer', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout=30):
+        if self._thread is not None:
+            self._stopping.set()
+            with self._condition:
+                self._condition.notify()
+            self._thread.join()
+            # events queued after this point are written at once by the installation itself
+            self._thread = None
+        deadline = monotonic() + timeout
+        while self.pending:
+            try:
+                self.flush()
+            except Exception as e:
+                if monotonic() >= deadline:
+                    logger.error(msg=f'{self.pending} status events were not written on shutdown: {e}')
+                    return
+                sleep(self._flush_interval)
+
+    def add_status(self, installation_id, status_name):
+        self._enqueue(kind=STATUS, key=installation_id,
+                      values={'status_name': status_name, 'status_timestamp': 'get_system_timestamp'})
+
+    def update_installation(self, installation_id, **values):
+        self._enqueue(kind=INSTALLATION, key=installation_id, values=values)
+
+    def update_node(self, host, **values):
+        self._enqueue(kind=NODE, key=host, values=values)
+
+    def add_facets(self, **facets):
+        self._enqueue(kind=FACETS, key=None, values=facets)
+
+    def _enqueue(self, kind, key, values):
+        STATUS_EVENTS.inc(kind=kind)
+        with self._condition:
+            # the events are written later, so they carry the time they happened at; the times always grow, so the
+            # statuses of an installation keep their order even within one flush
+            self._last_happened = max(monotonic_ns() // 1000, self._last_happened + 1)
+            self._events.append((kind, key, values, self._last_happened))
+            if len(self._events) >= self._batch_size:
+                self._condition.notify()
+        if self._thread is None:
+            self.flush()
+
+    def flush(self):
+        with self._flush_lock:
+            with self._condition:
+                events = self._events[:self._batch_size]
+            while events:
+                try:
+                    with STATUS_FLUSH_SECONDS.time():
+                        self._write_batch(events=events)
+                except Exception:
+                    STATUS_FLUSH_ERRORS.inc()
+                    raise
+                with self._condition:
+                    events = self._events[:self._batch_size]
+
+    def _write_batch(self, events):
+        # the timestamps are taken from the clock of the database, like the start timestamps of the installations;
+        # when the database is not reachable the events stay queued however long it takes
+        try:
+            self._write(events=events, clock=self._database_clock())
+        except DatabaseUnavailable:
+            raise
+        except Exception as e:
+            self._failed_writes += 1
+            if self._failed_writes < self._max_retries:
+                raise
+            logger.error(msg=f'A batch of {len(events)} status events failed {self._failed_writes} times, its events '
+                             f'are written one by one: {e}')
+        else:
+            self._failed_writes = 0
+            self._dequeue(count=len(events))
+            return
+        # the database is reachable but the batch keeps failing, so an event of it can't be written at all; the
+        # other events are written, the failing ones are dropped instead of blocking all the events behind them
+        self._failed_writes = 0
+        for event in events:
+            try:
+                self._write(events=[event], clock=self._database_clock())
+            except Exception as e:
+                # when the database went away in the meantime the remaining events are retried later
+                self._database_clock()
+                kind, key, values, happened = event
+                STATUS_EVENTS_DROPPED.inc(kind=kind)
+                logger.error(msg=f'Status event {kind} {key} {values} was dropped: {e}')
+            self._dequeue(count=1)
+
+    def _database_clock(self):
+        try:
+            return self._database.current_timestamp(), monotonic_ns() // 1000
+        except Exception as e:
+            raise DatabaseUnavailable(f'Database is not available: {e}') from e
+
+    def _dequeue(self, count):
+        # the events stay queued until they are written, so a failed flush loses nothing
+        with self._condition:
+            del self._events[:count]
+
+    def _write_loop(self):
+        while not self._stopping.is_set():
+            with self._condition:
+                if len(self._events) < self._batch_size:
+                    self._condition.wait(timeout=self._flush_interval)
+            try:
+                self.flush()
+            except Exception as e:
+                logger.warning(msg=f'{self.pending} status events were not written and will be retried: {e}')
+                self._stopping.wait(self._flush_interval)
+
+    def _write(self, events, clock):
+        statuses = []
+        installations = {}
+        nodes = {}
+        facets = {}
+        database_now, now = clock
+        for kind, key, values, happened in events:
+            values = {k: database_now - timedelta(microseconds=now - happened) if v == 'get_system_timestamp' else v
+                      for k, v in values.items()}
+            if kind == STATUS:
+                statuses.append((values['status_name'], key, values['status_timestamp']))
+            elif kind == INSTALLATION:
+                installations.setdefault(key, {}).update(values)
+            elif kind == NODE:
+                nodes.setdefault(key, {}).update(values)
+            else:
+                facets.update(dict.fromkeys(values.items()))
+        # a batch is written by one transaction with at most one statement per table
+        with self._database.transaction():
+            if nodes:
+                self._database.update_rows(table='nodes', key_column='host', rows=nodes)
+            if statuses:
+                self._database.insert_data(table='statuses',
+                                           columns=('status_name', 'installation_id', 'status_timestamp'),
+                                           values=statuses)
+            if installations:
+                # a worker whose lease expired leaves the installations alone, another worker owns them now
+                fence = {} if self._worker_id is None else {'condition': 'worker_id = %s',
+                                                            'condition_params': (self._worker_id,)}
+                self._database.update_rows(table='installations', key_column='id', rows=installations, **fence)
+            if facets:
+                self._database.upsert_data(table='statistics_facets', columns=('facet_name', 'facet_value'),
+                                           values=list(facets))
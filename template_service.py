@@ -0,0 +1,60 @@
+import threading
+from os import makedirs
+from jinja2 import FileSystemLoader, FileSystemBytecodeCache, Environment, select_autoescape
+
+TEMPLATE_DIR = 'templates'
+
+
+class TemplateService:
+    def __init__(self, template_dir=TEMPLATE_DIR, auto_reload=False, bytecode_cache_dir=None):
+        self._template_dir = template_dir
+        self._static_pages = {}
+        self._lock = threading.Lock()
+        self._environment = None
+        self.configure(auto_reload=auto_reload, bytecode_cache_dir=bytecode_cache_dir)
+
+    @property
+    def environment(self):
+        return self._environment
+
+    def configure(self, auto_reload=False, bytecode_cache_dir=None):
+        bytecode_cache = None
+        if bytecode_cache_dir:
+            makedirs(bytecode_cache_dir, exist_ok=True)
+            # the compiled templates are shared by the processes and survive their restarts
+            bytecode_cache = FileSystemBytecodeCache(directory=bytecode_cache_dir)
+        # without auto reload a loaded template is never checked against its file again, so a template is read
+        # from the disk once per process; all templates are kept in memory, there are only a few of them
+        self._environment = Environment(loader=FileSystemLoader(self._template_dir), autoescape=select_autoescape(),
+                                        auto_reload=auto_reload, bytecode_cache=bytecode_cache, cache_size=-1)
+        with self._lock:
+            self._static_pages = {}
+        return self
+
+    def get_template(self, name):
+        return self._environment.get_template(name)
+
+    def render(self, name, **context):
+        return self._environment.get_template(name).render(**context)
+
+    def render_static(self, name):
+        # pages without variables are rendered once, unless their changes have to be picked up
+        if self._environment.auto_reload:
+            return self.render(name)
+        with self._lock:
+            page = self._static_pages.get(name)
+        if page is None:
+            page = self.render(name)
+            with self._lock:
+                self._static_pages[name] = page
+        return page
+
+    def precompile(self, extensions=('html', 'yaml')):
+        # the templates are compiled at startup instead of by the first request or installation which needs them
+        names = self._environment.list_templates(extensions=extensions)
+        for name in names:
+            self._environment.get_template(name)
+        return names
+
+
+templates = TemplateService()
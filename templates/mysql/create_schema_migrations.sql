@@ -0,0 +1,4 @@
+create table if not exists {{ database }}.schema_migrations (
+  version            varchar(100) not null primary key,
+  applied_timestamp  timestamp(6) default current_timestamp(6)
+);
\ No newline at end of file
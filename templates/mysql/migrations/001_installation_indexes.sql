@@ -0,0 +1,4 @@
+create index installations_status_start_idx on {{ database }}.installations (global_status, start_timestamp);
+create index installations_start_idx on {{ database }}.installations (start_timestamp);
+create index statuses_installation_timestamp_idx on {{ database }}.statuses (installation_id, status_timestamp);
+create index nodes_cluster_name_idx on {{ database }}.nodes (cluster_name);
\ No newline at end of file
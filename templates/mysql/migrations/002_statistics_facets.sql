@@ -0,0 +1,32 @@
+create table {{ database }}.statistics_facets (
+  facet_name         varchar(50) not null,
+  facet_value        varchar(150) not null,
+  primary key (facet_name, facet_value)
+);
+insert ignore into {{ database }}.statistics_facets (facet_name, facet_value)
+select distinct 'host', nodes.host from {{ database }}.nodes
+join {{ database }}.installations on nodes.host = installations.host
+where installations.global_status in ('failed', 'succeeded');
+insert ignore into {{ database }}.statistics_facets (facet_name, facet_value)
+select distinct 'cluster', nodes.cluster_name from {{ database }}.nodes
+join {{ database }}.installations on nodes.host = installations.host
+where installations.global_status in ('failed', 'succeeded');
+insert ignore into {{ database }}.statistics_facets (facet_name, facet_value)
+select distinct 'user', nodes.username from {{ database }}.nodes
+join {{ database }}.installations on nodes.host = installations.host
+where installations.global_status in ('failed', 'succeeded');
+insert ignore into {{ database }}.statistics_facets (facet_name, facet_value)
+select distinct 'db_version', nodes.db_version from {{ database }}.nodes
+join {{ database }}.installations on nodes.host = installations.host
+where installations.global_status in ('failed', 'succeeded');
+insert ignore into {{ database }}.statistics_facets (facet_name, facet_value)
+select distinct 'os_version', coalesce(nodes.os_version, 'None') from {{ database }}.nodes
+join {{ database }}.installations on nodes.host = installations.host
+where installations.global_status in ('failed', 'succeeded');
+insert ignore into {{ database }}.statistics_facets (facet_name, facet_value)
+select distinct 'seed_node', nodes.seed_node from {{ database }}.nodes
+join {{ database }}.installations on nodes.host = installations.host
+where installations.global_status in ('failed', 'succeeded');
+insert ignore into {{ database }}.statistics_facets (facet_name, facet_value)
+select distinct 'status', installations.global_status from {{ database }}.installations
+where installations.global_status in ('failed', 'succeeded');
\ No newline at end of file
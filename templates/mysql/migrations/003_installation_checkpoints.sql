@@ -0,0 +1,10 @@
+create table {{ database }}.installation_checkpoints (
+  host                  varchar(150) not null,
+  step_name             varchar(50) not null,
+  fingerprint           varchar(64) not null,
+  installation_id       int not null,
+  checkpoint_timestamp  timestamp(6) not null default current_timestamp(6),
+  primary key (host, step_name),
+  foreign key (host) references {{ database }}.nodes(host),
+  foreign key (installation_id) references {{ database }}.installations(id)
+);
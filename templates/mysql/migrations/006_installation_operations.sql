@@ -0,0 +1,2 @@
+alter table {{ database }}.installations add column operation varchar(20) not null default 'install';
+alter table {{ database }}.installations add column batch_size varchar(10) not null default '1';
@@ -0,0 +1 @@
+alter table {{ database }}.installations add column worker_id varchar(255);
@@ -0,0 +1 @@
+alter table {{ database }}.installations add column heartbeat_timestamp timestamp(6) null;
@@ -1,6 +0,0 @@
-select
-{{ columns }}
-from nodes 
-{{ join_installations }} join installations on nodes.host = installations.host
-{{ join_statuses}} join statuses on installations.id = statuses.installation_id
-where {{ filter }};
\ No newline at end of file
@@ -0,0 +1,8 @@
+create table {{ database }}.installations (
+  id                 integer primary key autoincrement,
+  start_timestamp    timestamp default (strftime('%Y-%m-%d %H:%M:%f', 'now', 'localtime')),
+  finish_timestamp   timestamp,
+  global_status      varchar(50),
+  host               varchar(150) not null,
+  foreign key (host) references nodes(host)
+);
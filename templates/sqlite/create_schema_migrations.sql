@@ -0,0 +1,4 @@
+create table if not exists {{ database }}.schema_migrations (
+  version            varchar(100) not null primary key,
+  applied_timestamp  timestamp default (strftime('%Y-%m-%d %H:%M:%f', 'now', 'localtime'))
+);
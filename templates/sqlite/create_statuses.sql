@@ -0,0 +1,6 @@
+create table {{ database }}.statuses (
+  status_name         varchar(50) not null,
+  status_timestamp    timestamp not null default (strftime('%Y-%m-%d %H:%M:%f', 'now', 'localtime')),
+  installation_id     int not null,
+  foreign key (installation_id) references installations(id)
+);
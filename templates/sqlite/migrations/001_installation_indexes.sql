@@ -0,0 +1,4 @@
+create index {{ database }}.installations_status_start_idx on installations (global_status, start_timestamp);
+create index {{ database }}.installations_start_idx on installations (start_timestamp);
+create index {{ database }}.statuses_installation_timestamp_idx on statuses (installation_id, status_timestamp);
+create index {{ database }}.nodes_cluster_name_idx on nodes (cluster_name);
@@ -0,0 +1 @@
+alter table {{ database }}.installations add column progress varchar(255) null;
@@ -0,0 +1,12 @@
+create table {{ database }}.host_facts (
+  host                varchar(150) not null primary key,
+  os_id               varchar(50),
+  os_version_id       varchar(50),
+  nic_names           varchar(1000),
+  cpu_count           int,
+  memory_mb           int,
+  disks               text,
+  scylla_version      varchar(100),
+  gathered_timestamp  timestamp not null,
+  foreign key (host) references nodes(host)
+);
@@ -0,0 +1,112 @@
+import logging
+import threading
+from datetime import timedelta
+from os import getpid
+from socket import gethostname
+from controller import InstallationState
+from db_interface.query_builder import SelectQuery, Operator
+from metrics import registry
+
+logger = logging.getLogger('installer')
+
+LEASES_CLAIMED = registry.counter('installer_leases_claimed_total', 'Installations taken over by this worker')
+LEASES_EXPIRED = registry.counter('installer_leases_expired_total', 'Installations requeued after the lease of '
+                                                                    'their worker expired')
+LEASE_RENEWAL_ERRORS = registry.counter('installer_lease_renewal_errors_total', 'Heartbeats which were not written')
+
+
+def default_worker_id():
+    return f'{gethostname()}:{getpid()}'
+
+
+class WorkerLease:
+    def __init__(self, database, worker_id=None, lease_timeout=60, heartbeat_interval=10):
+        self._database = database
+        self._worker_id = worker_id or default_worker_id()
+        self._lease_timeout = lease_timeout
+        self._heartbeat_interval = heartbeat_interval
+        self._stopping = threading.Event()
+        self._thread = None
+
+    @property
+    def worker_id(self):
+        return self._worker_id
+
+    @property
+    def lease_timeout(self):
+        return self._lease_timeout
+
+    def start(self):
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._heartbeat_loop, name='worker-lease', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def claim(self, installation_ids):
+        # the update is a compare-and-set on the state, so of several workers which saw the same new installations
+        # only one takes each of them over
+        self._database.update_data(table='installations',
+                                   condition=f"id in ({', '.join(['%s'] * len(installation_ids))}) "
+                                             f"and global_status = %s",
+                                   condition_params=tuple(installation_ids) + (InstallationState.NEW.value,),
+                                   global_status=InstallationState.IN_PROGRESS.value, worker_id=self._worker_id,
+                                   heartbeat_timestamp='get_system_timestamp')
+        query = SelectQuery(columns=('installations.id',), table='installations')
+        query.where('installations.id', Operator.IN, installation_ids)
+        query.where('installations.worker_id', Operator.EQ, self._worker_id)
+        claimed = [x['installation_id'] for x in self._database.select_data(query=query,
+                                                                            columns=('installation_id',))]
+        LEASES_CLAIMED.inc(len(claimed))
+        return claimed
+
+    def renew(self):
+        # one statement renews the leases of all installations of this worker, however many there are; the leases
+        # are stamped and expired by the clock of the database, so the clocks of the workers may differ
+        self._database.update_data(table='installations', condition='worker_id = %s and global_status = %s',
+                                   condition_params=(self._worker_id, InstallationState.IN_PROGRESS.value),
+                                   heartbeat_timestamp='get_system_timestamp')
+
+    def requeue_expired(self):
+        expired_before = self._database.current_timestamp() - timedelta(seconds=self._lease_timeout)
+        query = SelectQuery(columns=('installations.id', 'installations.worker_id'), table='installations')
+        query.where('installations.global_status', Operator.EQ, InstallationState.IN_PROGRESS.value)
+        query.where('installations.heartbeat_timestamp', Operator.LT, expired_before)
+        expired = self._database.select_data(query=query, columns=('installation_id', 'worker_id'))
+        if not expired:
+            return []
+        installation_ids = [x['installation_id'] for x in expired]
+        # the lease is checked again by the update, a worker which came back in the meantime keeps its installations
+        self._database.update_data(table='installations',
+                                   condition=f"id in ({', '.join(['%s'] * len(installation_ids))}) "
+                                             f"and global_status = %s and heartbeat_timestamp < %s",
+                                   condition_params=tuple(installation_ids) + (InstallationState.IN_PROGRESS.value,
+                                                                               expired_before),
+                                   global_status=InstallationState.NEW.value, worker_id='null',
+                                   heartbeat_timestamp='null')
+        for worker_id in sorted({x['worker_id'] for x in expired}):
+            worker_installations = [str(x['installation_id']) for x in expired if x['worker_id'] == worker_id]
+            logger.warning(msg=f"Lease of worker {worker_id} expired, its installations "
+                               f"{', '.join(worker_installations)} are queued again")
+        LEASES_EXPIRED.inc(len(installation_ids))
+        return installation_ids
+
+    def release(self):
+        # a worker which shuts down cleanly hands its installations over at once instead of after the lease timeout
+        self._database.update_data(table='installations', condition='worker_id = %s and global_status = %s',
+                                   condition_params=(self._worker_id, InstallationState.IN_PROGRESS.value),
+                                   global_status=InstallationState.NEW.value, worker_id='null',
+                                   heartbeat_timestamp='null')
+
+    def _heartbeat_loop(self):
+        while not self._stopping.wait(self._heartbeat_interval):
+            try:
+                self.renew()
+            except Exception as e:
+                LEASE_RENEWAL_ERRORS.inc()
+                logger.warning(msg=f'Lease of worker {self._worker_id} was not renewed: {e}')
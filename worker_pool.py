@@ -0,0 +1,371 @@
+import asyncio
+import itertools
+import logging
+import threading
+from collections import deque
+from contextlib import nullcontext
+from enum import Enum, unique
+from queue import PriorityQueue, Empty
+from time import monotonic
+
+logger = logging.getLogger('installer')
+
+
+class JobCancelled(Exception):
+    pass
+
+
+@unique
+class JobState(Enum):
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    FINISHED = 'finished'
+    FAILED = 'failed'
+    CANCELLED = 'cancelled'
+
+
+class Job:
+    def __init__(self, job_id, function, priority=0, timeout=None, cancel_event=None, description=None,
+                 concurrency_key=None):
+        self._job_id = job_id
+        self._function = function
+        self._priority = priority
+        self._timeout = timeout
+        self._cancel_event = cancel_event or threading.Event()
+        self._description = description or str(job_id)
+        self._concurrency_key = concurrency_key
+        self._cancel_reason = None
+        self.state = JobState.QUEUED
+        self.started = None
+
+    @property
+    def job_id(self):
+        return self._job_id
+
+    @property
+    def priority(self):
+        return self._priority
+
+    @property
+    def timeout(self):
+        return self._timeout
+
+    @property
+    def description(self):
+        return self._description
+
+    @property
+    def cancel_event(self):
+        return self._cancel_event
+
+    @property
+    def concurrency_key(self):
+        return self._concurrency_key
+
+    @property
+    def cancel_reason(self):
+        return self._cancel_reason
+
+    def cancel(self, reason='cancelled'):
+        if not self._cancel_event.is_set():
+            self._cancel_reason = reason
+            self._cancel_event.set()
+
+    def is_cancelled(self):
+        return self._cancel_event.is_set()
+
+    def run(self):
+        return self._function()
+
+
+class WorkerPool:
+    def __init__(self, max_workers=16, per_key_limit=1, job_timeout=None, watchdog_interval=1.0, on_job_done=None):
+        self._max_workers = max_workers
+        self._per_key_limit = per_key_limit
+        self._job_timeout = job_timeout
+        self._on_job_done = on_job_done
+        self._watchdog_interval = watchdog_interval
+        self._queue = PriorityQueue()
+        self._sequence = itertools.count()
+        self._jobs = {}
+        self._running_keys = {}
+        self._waiting_keys = {}
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._threads = []
+
+    @property
+    def max_workers(self):
+        return self._max_workers
+
+    @property
+    def queue_depth(self):
+        with self._lock:
+            return len([x for x in self._jobs.values() if x.state == JobState.QUEUED])
+
+    @property
+    def active_workers(self):
+        with self._lock:
+            return len([x for x in self._jobs.values() if x.state == JobState.RUNNING])
+
+    @property
+    def active_job_ids(self):
+        with self._lock:
+            return list(self._jobs.keys())
+
+    def start(self):
+        for number in range(self._max_workers):
+            thread = threading.Thread(target=self._worker_loop, name=f'installer-worker-{number}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        watchdog = threading.Thread(target=self._watchdog_loop, name='installer-watchdog', daemon=True)
+        watchdog.start()
+        self._threads.append(watchdog)
+        return self
+
+    def submit(self, job):
+        with self._lock:
+            if job.job_id in self._jobs:
+                return False
+            self._jobs[job.job_id] = job
+        # lower priority values are taken first, the sequence keeps submission order within one priority
+        self._queue.put((job.priority, next(self._sequence), job))
+        return True
+
+    def is_active(self, job_id):
+        with self._lock:
+            return job_id in self._jobs
+
+    def cancel(self, job_id, reason='cancelled'):
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None:
+            return False
+        job.cancel(reason=reason)
+        return True
+
+    def shutdown(self, wait=True, cancel_running=False):
+        self._stopping.set()
+        if cancel_running:
+            for job_id in self.active_job_ids:
+                self.cancel(job_id=job_id, reason='installer shutdown')
+        if wait:
+            for thread in self._threads:
+                thread.join()
+
+    def _worker_loop(self):
+        while not self._stopping.is_set():
+            try:
+                priority, sequence, job = self._queue.get(timeout=0.5)
+            except Empty:
+                continue
+            if not self._take_key(entry=(priority, sequence, job)):
+                # the job waits for the running job of its key without holding a worker
+                self._queue.task_done()
+                continue
+            try:
+                if job.is_cancelled():
+                    job.state = JobState.CANCELLED
+                    logger.info(msg=f'Job {job.description} was {job.cancel_reason} before it started')
+                    continue
+                job.started = monotonic()
+                job.state = JobState.RUNNING
+                try:
+                    job.run()
+                except Exception as ex:
+                    job.state = JobState.CANCELLED if job.is_cancelled() else JobState.FAILED
+                    logger.error(msg=f'Job {job.description} failed: {ex}')
+                else:
+                    job.state = JobState.FINISHED
+            finally:
+                with self._lock:
+                    self._jobs.pop(job.job_id, None)
+                self._release_key(key=job.concurrency_key)
+                self._queue.task_done()
+                self._job_done()
+
+    def _take_key(self, entry):
+        key = entry[2].concurrency_key
+        if key is None:
+            return True
+        with self._lock:
+            if self._running_keys.get(key, 0) >= self._per_key_limit:
+                self._waiting_keys.setdefault(key, deque()).append(entry)
+                return False
+            self._running_keys[key] = self._running_keys.get(key, 0) + 1
+            return True
+
+    def _release_key(self, key):
+        if key is None:
+            return
+        with self._lock:
+            self._running_keys[key] -= 1
+            if not self._running_keys[key]:
+                del self._running_keys[key]
+            waiting = self._waiting_keys.get(key)
+            entry = waiting.popleft() if waiting else None
+            if not waiting:
+                self._waiting_keys.pop(key, None)
+        # the next job of the key keeps its place among the queued jobs
+        if entry is not None:
+            self._queue.put(entry)
+
+    def _job_done(self):
+        # a freed worker lets the dispatcher take over more installations
+        if self._on_job_done is not None:
+            try:
+                self._on_job_done()
+            except Exception as ex:
+                logger.warning(msg=f'Job completion callback failed: {ex}')
+
+    def _watchdog_loop(self):
+        while not self._stopping.wait(timeout=self._watchdog_interval):
+            now = monotonic()
+            with self._lock:
+                running_jobs = [x for x in self._jobs.values() if x.state == JobState.RUNNING]
+            for job in running_jobs:
+                timeout = job.timeout or self._job_timeout
+                if timeout and not job.is_cancelled() and now - job.started > timeout:
+                    logger.warning(msg=f'Job {job.description} exceeded its timeout of {timeout} seconds '
+                                       'and will be cancelled')
+                    job.cancel(reason='timed out')
+
+
+class AsyncWorkerPool:
+    def __init__(self, max_workers=1000, per_key_limit=1, job_timeout=None, on_job_done=None):
+        self._max_workers = max_workers
+        self._per_key_limit = per_key_limit
+        self._job_timeout = job_timeout
+        self._on_job_done = on_job_done
+        self._jobs = {}
+        self._tasks = set()
+        self._lock = threading.Lock()
+        self._loop = None
+        self._thread = None
+        self._workers = None
+        self._key_limits = {}
+        self._stopping = False
+
+    @property
+    def max_workers(self):
+        return self._max_workers
+
+    @property
+    def queue_depth(self):
+        with self._lock:
+            return len([x for x in self._jobs.values() if x.state == JobState.QUEUED])
+
+    @property
+    def active_workers(self):
+        with self._lock:
+            return len([x for x in self._jobs.values() if x.state == JobState.RUNNING])
+
+    @property
+    def active_job_ids(self):
+        with self._lock:
+            return list(self._jobs.keys())
+
+    def start(self):
+        self._loop = asyncio.new_event_loop()
+        started = threading.Event()
+        self._thread = threading.Thread(target=self._run_loop, args=(started,), name='installer-event-loop',
+                                        daemon=True)
+        self._thread.start()
+        started.wait()
+        return self
+
+    def submit(self, job):
+        with self._lock:
+            if job.job_id in self._jobs or self._stopping:
+                return False
+            self._jobs[job.job_id] = job
+        self._loop.call_soon_threadsafe(self._schedule, job)
+        return True
+
+    def is_active(self, job_id):
+        with self._lock:
+            return job_id in self._jobs
+
+    def cancel(self, job_id, reason='cancelled'):
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None:
+            return False
+        job.cancel(reason=reason)
+        return True
+
+    def shutdown(self, wait=True, cancel_running=False):
+        with self._lock:
+            self._stopping = True
+        if cancel_running:
+            for job_id in self.active_job_ids:
+                self.cancel(job_id=job_id, reason='installer shutdown')
+        if wait:
+            asyncio.run_coroutine_threadsafe(self._drain(), self._loop).result()
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+
+    def _run_loop(self, started):
+        asyncio.set_event_loop(self._loop)
+        self._workers = asyncio.Semaphore(self._max_workers)
+        self._loop.call_soon(started.set)
+        self._loop.run_forever()
+
+    def _schedule(self, job):
+        task = self._loop.create_task(self._run_job(job))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _drain(self):
+        while self._tasks:
+            await asyncio.wait(set(self._tasks))
+
+    async def _run_job(self, job):
+        try:
+            # jobs wait for their key first, so that a job blocked by another job of the same host holds no worker
+            async with self._key_limit(job.concurrency_key), self._workers:
+                if job.is_cancelled() or self._stopping:
+                    job.state = JobState.CANCELLED
+                    logger.info(msg=f'Job {job.description} was {job.cancel_reason or "dropped"} before it started')
+                    return
+                job.started = monotonic()
+                job.state = JobState.RUNNING
+                try:
+                    await self._run_with_timeout(job)
+                except Exception as ex:
+                    job.state = JobState.CANCELLED if job.is_cancelled() else JobState.FAILED
+                    logger.error(msg=f'Job {job.description} failed: {ex}')
+                else:
+                    job.state = JobState.FINISHED
+        finally:
+            with self._lock:
+                self._jobs.pop(job.job_id, None)
+            self._job_done()
+
+    def _job_done(self):
+        # a freed worker lets the dispatcher take over more installations
+        if self._on_job_done is not None:
+            try:
+                self._on_job_done()
+            except Exception as ex:
+                logger.warning(msg=f'Job completion callback failed: {ex}')
+
+    async def _run_with_timeout(self, job):
+        task = asyncio.ensure_future(job.run())
+        timeout = job.timeout or self._job_timeout
+        if timeout:
+            done, pending = await asyncio.wait({task}, timeout=timeout)
+            if pending:
+                # like the thread pool watchdog, the job is asked to stop and fails at its next cancellation check
+                logger.warning(msg=f'Job {job.description} exceeded its timeout of {timeout} seconds '
+                                   'and will be cancelled')
+                job.cancel(reason='timed out')
+        await task
+
+    def _key_limit(self, key):
+        if key is None:
+            return nullcontext()
+        if key not in self._key_limits:
+            self._key_limits[key] = asyncio.Semaphore(self._per_key_limit)
+        return self._key_limits[key]
+